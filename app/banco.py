@@ -0,0 +1,177 @@
+"""
+Camada de acesso ao `agendha.db` compartilhada pelos endpoints.
+
+As consultas rodam em um executor próprio, com um número limitado de threads
+(`BANCO_MAX_CONEXOES`), e cada thread mantém suas conexões abertas: uma
+somente-leitura (URI `mode=ro`, para os endpoints de consulta) e uma de
+escrita. Assim, as consultas não ocupam o threadpool do Starlette e não
+pagam abertura de arquivo, leitura do schema e preparo das instruções a cada
+requisição (o módulo `sqlite3` guarda as instruções preparadas por conexão).
+Todas as conexões usam WAL e os pragmas de leitura abaixo.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+DB_PATH = os.getenv("AGENDHA_DB", "agendha.db")
+# Threads do executor de banco (e, portanto, conexões de cada tipo).
+BANCO_MAX_CONEXOES = int(os.getenv("BANCO_MAX_CONEXOES", "8"))
+# Instruções preparadas guardadas por conexão (LRU do módulo sqlite3).
+BANCO_CACHE_INSTRUCOES = 256
+BANCO_TIMEOUT = 30  # s aguardando o lock de escrita
+PRAGMAS_CONEXAO = {
+    "mmap_size": int(os.getenv("BANCO_MMAP_MB", "256")) * 1024 * 1024,
+    "cache_size": -int(os.getenv("BANCO_CACHE_MB", "32")) * 1024,  # KiB
+    "temp_store": "MEMORY",
+    "synchronous": "NORMAL",
+}
+
+
+class BancoSQLite:
+    """Conexões por thread (leitura e escrita) e executor limitado."""
+
+    def __init__(
+        self,
+        db_path: str = DB_PATH,
+        max_conexoes: int = BANCO_MAX_CONEXOES
+    ):
+        """Guarda a configuração; as conexões abrem sob demanda."""
+        self.db_path = db_path
+        self.max_conexoes = max(1, max_conexoes)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conexoes: List[sqlite3.Connection] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._wal_configurado = False
+        # Métricas
+        self._abertas = {"leitura": 0, "escrita": 0}
+        self._pendentes = 0
+        self._operacoes = 0
+        self._tempo_total_ms = 0.0
+        self._espera_total_ms = 0.0
+
+    def _conectar(self, somente_leitura: bool) -> sqlite3.Connection:
+        """Abre uma conexão já com os pragmas aplicados."""
+        if somente_leitura:
+            uri = Path(self.db_path).resolve().as_uri() + "?mode=ro"
+            conexao = sqlite3.connect(
+                uri, uri=True, check_same_thread=False,
+                timeout=BANCO_TIMEOUT,
+                cached_statements=BANCO_CACHE_INSTRUCOES
+            )
+            conexao.execute("PRAGMA query_only = 1")
+        else:
+            conexao = sqlite3.connect(
+                self.db_path, check_same_thread=False,
+                timeout=BANCO_TIMEOUT,
+                cached_statements=BANCO_CACHE_INSTRUCOES
+            )
+        conexao.row_factory = sqlite3.Row
+        for pragma, valor in PRAGMAS_CONEXAO.items():
+            conexao.execute(f"PRAGMA {pragma} = {valor}")
+        with self._lock:
+            self._conexoes.append(conexao)
+            self._abertas["leitura" if somente_leitura else "escrita"] += 1
+        return conexao
+
+    def _configurar_wal(self):
+        """Ativa o WAL (persistente no arquivo) antes da primeira conexão
+        somente-leitura, que não consegue mudar o journal."""
+        if self._wal_configurado:
+            return
+        conexao = sqlite3.connect(self.db_path, timeout=BANCO_TIMEOUT)
+        try:
+            conexao.execute("PRAGMA journal_mode = WAL")
+        finally:
+            conexao.close()
+        self._wal_configurado = True
+
+    def leitura(self) -> sqlite3.Connection:
+        """Conexão somente-leitura desta thread."""
+        conexao = getattr(self._local, "leitura", None)
+        if conexao is None:
+            self._configurar_wal()
+            conexao = self._local.leitura = self._conectar(True)
+        return conexao
+
+    def escrita(self) -> sqlite3.Connection:
+        """Conexão de escrita desta thread (use `with conexao:` para a
+        transação)."""
+        conexao = getattr(self._local, "escrita", None)
+        if conexao is None:
+            self._configurar_wal()
+            conexao = self._local.escrita = self._conectar(False)
+        return conexao
+
+    def _medir(self, funcao: Callable[..., Any], enfileirado: float,
+               *args: Any) -> Any:
+        """Executa `funcao` na thread do executor, registrando os tempos."""
+        inicio = time.perf_counter()
+        try:
+            return funcao(*args)
+        finally:
+            fim = time.perf_counter()
+            with self._lock:
+                self._operacoes += 1
+                self._espera_total_ms += (inicio - enfileirado) * 1000
+                self._tempo_total_ms += (fim - inicio) * 1000
+
+    async def executar(self, funcao: Callable[..., Any], *args: Any) -> Any:
+        """Executa `funcao(*args)` em uma thread do executor de banco."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_conexoes, thread_name_prefix="banco"
+            )
+        loop = asyncio.get_running_loop()
+        self._pendentes += 1
+        try:
+            return await loop.run_in_executor(
+                self._executor, self._medir, funcao, time.perf_counter(),
+                *args
+            )
+        finally:
+            self._pendentes -= 1
+
+    def metricas(self) -> Dict[str, Any]:
+        """Conexões abertas, fila e tempos médios das operações."""
+        with self._lock:
+            operacoes = self._operacoes
+            return {
+                "max_conexoes": self.max_conexoes,
+                "conexoes_leitura": self._abertas["leitura"],
+                "conexoes_escrita": self._abertas["escrita"],
+                "em_andamento": min(self._pendentes, self.max_conexoes),
+                "profundidade_fila": max(
+                    0, self._pendentes - self.max_conexoes
+                ),
+                "operacoes": operacoes,
+                "tempo_medio_ms": round(
+                    self._tempo_total_ms / operacoes, 3
+                ) if operacoes else 0.0,
+                "espera_media_ms": round(
+                    self._espera_total_ms / operacoes, 3
+                ) if operacoes else 0.0,
+            }
+
+    def fechar(self):
+        """Encerra o executor e fecha todas as conexões."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        with self._lock:
+            for conexao in self._conexoes:
+                conexao.close()
+            self._conexoes.clear()
+            self._abertas = {"leitura": 0, "escrita": 0}
+        self._local = threading.local()
+        logging.info("Conexões com %s fechadas.", self.db_path)
+
+
+banco = BancoSQLite()
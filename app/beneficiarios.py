@@ -0,0 +1,294 @@
+"""
+Consultas paginadas à tabela `beneficiarios` do `agendha.db`.
+
+Filtros, ordenação e paginação são feitos no SQLite, sobre índices criados
+na inicialização da aplicação, para que a tabela de dados (`index.html`) não
+precise receber a tabela inteira a cada carregamento.
+
+A busca textual usa a tabela virtual FTS5 `beneficiarios_busca`, mantida em
+sincronia por triggers. O tokenizador `unicode61` com `remove_diacritics 2`
+ignora acentos e maiúsculas, como o `padronizar_texto` de
+`scripts/limpar_dados_db.py`, então "joao" encontra "JOÃO".
+"""
+
+import re
+import logging
+import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.banco import banco
+
+COLUNAS_BENEFICIARIOS = (
+    "id",
+    "codigo",
+    "nome_tecnico",
+    "cpf_tecnico",
+    "municipio",
+    "comunidade",
+    "latitude",
+    "longitude",
+    "data_atividade",
+    "nome_familiar",
+    "cpf_familiar",
+    "nis",
+    "renda_media",
+    "status",
+    "tecnico_agua_que_alimenta",
+    "doc_status",
+    "grh",
+    "verificado_bsf",
+)
+# Colunas usadas pela busca por substring (sem `coluna_busca`).
+COLUNAS_BUSCA = (
+    "nome_familiar", "comunidade", "municipio", "cpf_familiar", "nis",
+)
+# Depois da migração 001 (ver `app.migracoes`), data_atividade é ISO
+# (AAAA-MM-DD) e latitude/longitude/renda_media são REAL, então filtros de
+# intervalo e ordenações usam os índices diretamente.
+INDICES_BENEFICIARIOS = {
+    "idx_beneficiarios_municipio": "municipio COLLATE NOCASE",
+    "idx_beneficiarios_status": "status COLLATE NOCASE",
+    "idx_beneficiarios_tecnico": "nome_tecnico COLLATE NOCASE",
+    "idx_beneficiarios_data": "data_atividade",
+    "idx_beneficiarios_nome": "nome_familiar",
+    "idx_beneficiarios_coordenadas": "latitude, longitude",
+    "idx_beneficiarios_renda": "renda_media",
+}
+LIMITE_PAGINA_MAXIMO = 1000
+
+# --- Busca textual (FTS5) ---
+TABELA_BUSCA = "beneficiarios_busca"
+COLUNAS_TEXTO_BUSCA = ("nome_familiar", "comunidade", "municipio",
+                       "nome_tecnico")
+COLUNAS_DIGITOS_BUSCA = ("cpf_familiar", "nis")
+LIMITE_BUSCA_PADRAO = 20
+LIMITE_BUSCA_MAXIMO = 100
+
+
+def _coluna_sql(coluna: str) -> str:
+    """Identificador SQL de uma coluna (entre aspas)."""
+    return f'"{coluna}"'
+
+
+def criar_indices():
+    """Cria (se faltarem) os índices usados pelos filtros e ordenações."""
+    conexao = banco.escrita()
+    with conexao:
+        for nome, expressao in INDICES_BENEFICIARIOS.items():
+            conexao.execute(
+                f"CREATE INDEX IF NOT EXISTS {nome} "
+                f"ON beneficiarios ({expressao})"
+            )
+    logging.info(
+        "Beneficiários: %d índice(s) verificados.",
+        len(INDICES_BENEFICIARIOS)
+    )
+
+
+def _somente_digitos_sql(expressao: str) -> str:
+    """Remove a pontuação usual de CPF/NIS em SQL puro (os triggers também
+    rodam em conexões de scripts, sem funções Python registradas)."""
+    for caractere in (".", "-", "/", " "):
+        expressao = f"replace({expressao}, '{caractere}', '')"
+    return expressao
+
+
+def _valores_busca_sql(prefixo: str) -> str:
+    """Lista de valores do índice de busca para a linha `prefixo`
+    (`new`/`old` nos triggers, ou a própria tabela na reconstrução)."""
+    colunas = [f"{prefixo}{c}" for c in COLUNAS_TEXTO_BUSCA]
+    colunas += [_somente_digitos_sql(f"{prefixo}{c}")
+                for c in COLUNAS_DIGITOS_BUSCA]
+    return ", ".join([f"{prefixo}rowid"] + colunas)
+
+
+def preparar_busca():
+    """Cria a tabela FTS5 e os triggers de sincronia.
+
+    O índice é reconstruído quando os triggers não existiam (por exemplo,
+    depois de `scripts/migrar_dados.py` recriar a tabela) ou quando a
+    contagem de linhas diverge.
+    """
+    colunas = ", ".join(COLUNAS_TEXTO_BUSCA + COLUNAS_DIGITOS_BUSCA)
+    nomes = "rowid, " + colunas
+    conexao = banco.escrita()
+    with conexao:
+        triggers_existentes = conexao.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' "
+            "AND name LIKE ?", (f"{TABELA_BUSCA}_%",)
+        ).fetchone()[0]
+        conexao.executescript(
+            f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {TABELA_BUSCA} USING fts5(
+                {colunas},
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '2 3'
+            );
+            CREATE TRIGGER IF NOT EXISTS {TABELA_BUSCA}_ai
+            AFTER INSERT ON beneficiarios BEGIN
+                INSERT INTO {TABELA_BUSCA} ({nomes})
+                VALUES ({_valores_busca_sql("new.")});
+            END;
+            CREATE TRIGGER IF NOT EXISTS {TABELA_BUSCA}_ad
+            AFTER DELETE ON beneficiarios BEGIN
+                DELETE FROM {TABELA_BUSCA} WHERE rowid = old.rowid;
+            END;
+            CREATE TRIGGER IF NOT EXISTS {TABELA_BUSCA}_au
+            AFTER UPDATE ON beneficiarios BEGIN
+                DELETE FROM {TABELA_BUSCA} WHERE rowid = old.rowid;
+                INSERT INTO {TABELA_BUSCA} ({nomes})
+                VALUES ({_valores_busca_sql("new.")});
+            END;
+            """
+        )
+        total_tabela = conexao.execute(
+            "SELECT COUNT(*) FROM beneficiarios"
+        ).fetchone()[0]
+        total_indice = conexao.execute(
+            f"SELECT COUNT(*) FROM {TABELA_BUSCA}"
+        ).fetchone()[0]
+        if triggers_existentes < 3 or total_tabela != total_indice:
+            conexao.execute(f"DELETE FROM {TABELA_BUSCA}")
+            conexao.execute(
+                f"INSERT INTO {TABELA_BUSCA} ({nomes}) "
+                f"SELECT {_valores_busca_sql('')} FROM beneficiarios"
+            )
+            logging.info(
+                "Busca de beneficiários: índice FTS5 reconstruído "
+                "(%d registros).", total_tabela
+            )
+
+
+def _consulta_fts(termo: str) -> str:
+    """Converte o texto digitado em uma consulta FTS5 segura.
+
+    Cada palavra vira um prefixo entre aspas (todas precisam casar);
+    pontuação entre dígitos some, para que "055.996.115-40" case com o
+    CPF guardado só com dígitos.
+    """
+    termo = re.sub(r"(?<=\d)[.\-/](?=\d)", "", termo)
+    palavras = re.findall(r"\w+", termo)
+    return " ".join(f'"{palavra}"*' for palavra in palavras)
+
+
+def buscar(
+    termo: str,
+    campos: Sequence[str] = COLUNAS_BENEFICIARIOS,
+    limite: int = LIMITE_BUSCA_PADRAO
+) -> List[Dict[str, Any]]:
+    """Beneficiários que casam com `termo`, do mais ao menos relevante."""
+    consulta = _consulta_fts(termo)
+    if not consulta:
+        return []
+    colunas = ", ".join(f"b.{_coluna_sql(c)}" for c in campos)
+    linhas = banco.leitura().execute(
+        f"SELECT {colunas} FROM {TABELA_BUSCA} "
+        f"JOIN beneficiarios AS b ON b.rowid = {TABELA_BUSCA}.rowid "
+        f"WHERE {TABELA_BUSCA} MATCH ? ORDER BY rank LIMIT ?",
+        (consulta, max(1, min(limite, LIMITE_BUSCA_MAXIMO)))
+    ).fetchall()
+    return [dict(linha) for linha in linhas]
+
+
+def validar_campos(campos: Optional[str]) -> Tuple[str, ...]:
+    """Converte "campo1,campo2" na projeção pedida (padrão: todas)."""
+    if not campos:
+        return COLUNAS_BENEFICIARIOS
+    pedidos = tuple(c.strip() for c in campos.split(",") if c.strip())
+    desconhecidos = [c for c in pedidos if c not in COLUNAS_BENEFICIARIOS]
+    if desconhecidos:
+        raise ValueError(
+            f"Campo(s) desconhecido(s): {', '.join(desconhecidos)}."
+        )
+    return pedidos or COLUNAS_BENEFICIARIOS
+
+
+def _data_filtro(data: str) -> str:
+    """Valida uma data de filtro "AAAA-MM-DD"."""
+    try:
+        return datetime.date.fromisoformat(data).isoformat()
+    except ValueError as e:
+        raise ValueError(
+            f"Data inválida '{data}'. Use o formato AAAA-MM-DD."
+        ) from e
+
+
+def _montar_filtros(filtros: Dict[str, Optional[str]]) -> Tuple[str, list]:
+    """Cláusula WHERE e parâmetros a partir dos filtros da API."""
+    condicoes, parametros = [], []
+    for filtro, coluna in (("municipio", "municipio"),
+                           ("status", "status"),
+                           ("tecnico", "nome_tecnico")):
+        if filtros.get(filtro):
+            condicoes.append(f"{coluna} = ? COLLATE NOCASE")
+            parametros.append(filtros[filtro])
+    if filtros.get("data_inicio"):
+        condicoes.append("data_atividade >= ?")
+        parametros.append(_data_filtro(filtros["data_inicio"]))
+    if filtros.get("data_fim"):
+        condicoes.append("data_atividade <= ?")
+        parametros.append(_data_filtro(filtros["data_fim"]))
+    if filtros.get("busca"):
+        coluna_busca = filtros.get("coluna_busca")
+        if coluna_busca and coluna_busca not in COLUNAS_BENEFICIARIOS:
+            raise ValueError(f"Coluna de busca desconhecida: {coluna_busca}.")
+        colunas = (coluna_busca,) if coluna_busca else COLUNAS_BUSCA
+        condicoes.append("(" + " OR ".join(
+            f"{_coluna_sql(c)} LIKE ?" for c in colunas
+        ) + ")")
+        parametros.extend([f"%{filtros['busca']}%"] * len(colunas))
+    return " AND ".join(condicoes), parametros
+
+
+def _ordem_sql(ordenar: Optional[str], direcao: str) -> str:
+    """Cláusula ORDER BY (rowid desempata, para páginas estáveis)."""
+    if direcao.lower() not in ("asc", "desc"):
+        raise ValueError("Direção deve ser 'asc' ou 'desc'.")
+    if not ordenar:
+        return "rowid"
+    if ordenar not in COLUNAS_BENEFICIARIOS:
+        raise ValueError(f"Coluna de ordenação desconhecida: {ordenar}.")
+    return f"{_coluna_sql(ordenar)} {direcao.upper()}, rowid"
+
+
+def consultar(
+    filtros: Optional[Dict[str, Optional[str]]] = None,
+    campos: Sequence[str] = COLUNAS_BENEFICIARIOS,
+    ordenar: Optional[str] = None,
+    direcao: str = "asc",
+    limite: Optional[int] = None,
+    offset: int = 0
+) -> Tuple[List[Dict[str, Any]], int]:
+    """Retorna (página de registros, total de registros filtrados).
+
+    Sem `limite`, devolve todos os registros filtrados.
+    """
+    where, parametros = _montar_filtros(filtros or {})
+    where_sql = f"WHERE {where}" if where else ""
+    sql = (
+        f"SELECT {', '.join(_coluna_sql(c) for c in campos)} "
+        f"FROM beneficiarios {where_sql} "
+        f"ORDER BY {_ordem_sql(ordenar, direcao)}"
+    )
+    parametros_pagina = list(parametros)
+    if limite is not None or offset:
+        sql += " LIMIT ? OFFSET ?"
+        parametros_pagina += [
+            -1 if limite is None else min(limite, LIMITE_PAGINA_MAXIMO),
+            offset
+        ]
+
+    conexao = banco.leitura()
+    with conexao:
+        # Página e total lidos no mesmo snapshot.
+        conexao.execute("BEGIN")
+        registros = [
+            dict(linha) for linha in conexao.execute(sql, parametros_pagina)
+        ]
+        if limite is None and not offset:
+            total = len(registros)
+        else:
+            total = conexao.execute(
+                f"SELECT COUNT(*) FROM beneficiarios {where_sql}", parametros
+            ).fetchone()[0]
+    return registros, total
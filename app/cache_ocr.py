@@ -0,0 +1,166 @@
+"""
+Cache persistente de resultados de OCR.
+
+A chave de cada entrada combina o SHA-256 dos bytes do arquivo enviado, o
+trecho de páginas processado e a assinatura do pipeline (definições de ROI e
+parâmetros de pré-processamento, ver `pipeline_ocr.assinatura_pipeline`).
+Reenvios do mesmo PDF devolvem os campos imediatamente; mudar qualquer
+coordenada de ROI gera chaves novas e as entradas antigas são descartadas.
+O tamanho total é limitado com remoção LRU.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from typing import Any, Dict, Optional
+
+CACHE_OCR_PATH = "cache_ocr.db"
+CACHE_OCR_MAX_BYTES = int(os.getenv("CACHE_OCR_MAX_MB", "256")) * 1024 * 1024
+
+TAMANHO_BLOCO_HASH = 1024 * 1024
+
+
+def calcular_sha256(caminho: str) -> str:
+    """SHA-256 do conteúdo de um arquivo, lido em blocos."""
+    sha = hashlib.sha256()
+    with open(caminho, "rb") as arquivo:
+        for bloco in iter(lambda: arquivo.read(TAMANHO_BLOCO_HASH), b""):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+class CacheOCR:
+    """Cache LRU em SQLite dos campos extraídos por documento."""
+
+    def __init__(
+        self,
+        assinatura: str,
+        caminho: str = CACHE_OCR_PATH,
+        max_bytes: int = CACHE_OCR_MAX_BYTES
+    ):
+        """Abre (ou cria) o cache e descarta entradas de outra assinatura."""
+        self.assinatura = assinatura
+        self.caminho = caminho
+        self.max_bytes = max_bytes
+        self.acertos = 0
+        self.falhas = 0
+        self._lock = threading.Lock()
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.execute(
+            """
+            CREATE TABLE IF NOT EXISTS resultados (
+                chave TEXT PRIMARY KEY,
+                assinatura TEXT NOT NULL,
+                dados TEXT NOT NULL,
+                tamanho INTEGER NOT NULL,
+                ultimo_acesso REAL NOT NULL
+            )
+            """
+        )
+        self._conexao.execute(
+            "CREATE INDEX IF NOT EXISTS idx_resultados_acesso "
+            "ON resultados (ultimo_acesso)"
+        )
+        removidas = self._conexao.execute(
+            "DELETE FROM resultados WHERE assinatura != ?", (assinatura,)
+        ).rowcount
+        self._conexao.commit()
+        if removidas:
+            logging.info(
+                "Cache de OCR: %d entrada(s) invalidada(s) por mudança nas "
+                "ROIs/parâmetros.", removidas
+            )
+
+    def chave(
+        self,
+        sha256_arquivo: str,
+        pagina_inicial: int = 1,
+        num_paginas: Optional[int] = None
+    ) -> str:
+        """Monta a chave de um documento (ou formulário) para a assinatura
+        atual do pipeline."""
+        return (
+            f"{sha256_arquivo}:{pagina_inicial}:{num_paginas or 0}:"
+            f"{self.assinatura}"
+        )
+
+    def obter(self, chave: str) -> Optional[Dict[str, Any]]:
+        """Retorna os campos guardados, ou None se não houver entrada."""
+        with self._lock:
+            linha = self._conexao.execute(
+                "SELECT dados FROM resultados WHERE chave = ?", (chave,)
+            ).fetchone()
+            if linha is None:
+                self.falhas += 1
+                return None
+            self._conexao.execute(
+                "UPDATE resultados SET ultimo_acesso = ? WHERE chave = ?",
+                (time.time(), chave)
+            )
+            self._conexao.commit()
+            self.acertos += 1
+        return json.loads(linha[0])
+
+    def guardar(self, chave: str, dados: Dict[str, Any]):
+        """Guarda os campos de um documento e aplica o limite de tamanho."""
+        serializado = json.dumps(dados, ensure_ascii=False)
+        with self._lock:
+            self._conexao.execute(
+                "INSERT OR REPLACE INTO resultados "
+                "(chave, assinatura, dados, tamanho, ultimo_acesso) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (chave, self.assinatura, serializado,
+                 len(serializado.encode("utf-8")), time.time())
+            )
+            self._remover_excedente()
+            self._conexao.commit()
+
+    def _remover_excedente(self):
+        """Remove as entradas menos usadas até caber em max_bytes."""
+        total = self._conexao.execute(
+            "SELECT COALESCE(SUM(tamanho), 0) FROM resultados"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        cursor = self._conexao.execute(
+            "SELECT chave, tamanho FROM resultados ORDER BY ultimo_acesso"
+        )
+        remover = []
+        for chave, tamanho in cursor:
+            if total <= self.max_bytes:
+                break
+            remover.append((chave,))
+            total -= tamanho
+        self._conexao.executemany(
+            "DELETE FROM resultados WHERE chave = ?", remover
+        )
+        logging.info("Cache de OCR: %d entrada(s) removida(s) (LRU).",
+                     len(remover))
+
+    def metricas(self) -> Dict[str, Any]:
+        """Contadores de acerto/falha e ocupação do cache."""
+        with self._lock:
+            entradas, total = self._conexao.execute(
+                "SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM resultados"
+            ).fetchone()
+        consultas = self.acertos + self.falhas
+        return {
+            "acertos": self.acertos,
+            "falhas": self.falhas,
+            "taxa_acerto": (
+                round(self.acertos / consultas, 3) if consultas else 0.0
+            ),
+            "entradas": entradas,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+        }
+
+    def fechar(self):
+        """Fecha a conexão com o arquivo do cache."""
+        with self._lock:
+            self._conexao.close()
@@ -0,0 +1,230 @@
+"""
+Consolidado de atividades por município, materializado no `agendha.db`.
+
+A tabela `consolidado_municipio` guarda, por município, as mesmas contagens
+que o `GROUP BY municipio` do dashboard calculava a cada carregamento.
+Triggers em `beneficiarios` a atualizam incrementalmente (+1/-1 por linha
+inserida, removida ou alterada); o ETag usa a versão de `beneficiarios` em
+`app.versoes`. Se os triggers sumirem (por exemplo, quando
+`scripts/migrar_dados.py` recria a tabela), ela é recalculada na
+inicialização. `verificar` compara a tabela com a consulta ao vivo.
+"""
+
+import logging
+import sqlite3
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.banco import banco
+from app import versoes
+
+TABELA_CONSOLIDADO = "consolidado_municipio"
+# Contador de versão próprio, substituído por `versoes` (removido ao
+# preparar o consolidado).
+TABELA_VERSAO_ANTIGA = "consolidado_versao"
+
+# Coluna do consolidado -> status contado nela.
+STATUS_POR_COLUNA = {
+    "em_cadastro": "EM CADASTRO",
+    "cadastrado": "CADASTRADO",
+    "a_construir": "A CONSTRUIR",
+    "construida": "CONSTRUÍDA",
+}
+COLUNAS_CONSOLIDADO = (
+    ("municipio", "total_beneficiarios")
+    + tuple(STATUS_POR_COLUNA)
+    + ("outros_status",)
+)
+
+# Consulta original do dashboard (usada para recalcular e para verificar).
+CONSULTA_AO_VIVO = """
+    SELECT
+        municipio,
+        COUNT(*) AS total_beneficiarios,
+        SUM(CASE WHEN status = 'EM CADASTRO' THEN 1 ELSE 0 END) AS em_cadastro,
+        SUM(CASE WHEN status = 'CADASTRADO' THEN 1 ELSE 0 END) AS cadastrado,
+        SUM(CASE WHEN status = 'A CONSTRUIR' THEN 1 ELSE 0 END) AS a_construir,
+        SUM(CASE WHEN status = 'CONSTRUÍDA' THEN 1 ELSE 0 END) AS construida,
+        SUM(CASE WHEN status NOT IN (
+            'EM CADASTRO', 'CADASTRADO', 'A CONSTRUIR', 'CONSTRUÍDA'
+            ) OR status IS NULL THEN 1 ELSE 0 END) AS outros_status
+    FROM
+        beneficiarios
+    WHERE
+        municipio IS NOT NULL AND municipio != ''
+    GROUP BY
+        municipio
+    ORDER BY
+        municipio
+"""
+
+
+def _incrementos_sql(linha: str, sinal: str) -> Tuple[str, str]:
+    """(lista de valores, cláusula SET) para somar `sinal` 1 às contagens
+    da linha `linha` (`new`/`old`)."""
+    lista_status = ", ".join(f"'{s}'" for s in STATUS_POR_COLUNA.values())
+    deltas = {"total_beneficiarios": f"{sinal}1"}
+    for coluna, status in STATUS_POR_COLUNA.items():
+        deltas[coluna] = (
+            f"{sinal}(CASE WHEN {linha}.status = '{status}' "
+            "THEN 1 ELSE 0 END)"
+        )
+    deltas["outros_status"] = (
+        f"{sinal}(CASE WHEN {linha}.status IN ({lista_status}) "
+        "THEN 0 ELSE 1 END)"
+    )
+    valores = ", ".join([f"{linha}.municipio"] + list(deltas.values()))
+    atribuicoes = ", ".join(
+        f"{coluna} = {coluna} + ({delta})" for coluna, delta in deltas.items()
+    )
+    return valores, atribuicoes
+
+
+def _triggers_sql() -> str:
+    """Triggers que mantêm o consolidado em dia."""
+    colunas = ", ".join(COLUNAS_CONSOLIDADO)
+    valores_novo, soma_novo = _incrementos_sql("new", "+")
+    _, subtrai_antigo = _incrementos_sql("old", "-")
+    adicionar_novo = f"""
+        INSERT INTO {TABELA_CONSOLIDADO} ({colunas})
+        SELECT {valores_novo}
+        WHERE new.municipio IS NOT NULL AND new.municipio != ''
+        ON CONFLICT (municipio) DO UPDATE SET {soma_novo};
+    """
+    remover_antigo = f"""
+        UPDATE {TABELA_CONSOLIDADO} SET {subtrai_antigo}
+        WHERE municipio = old.municipio;
+        DELETE FROM {TABELA_CONSOLIDADO}
+        WHERE municipio = old.municipio AND total_beneficiarios <= 0;
+    """
+    return f"""
+        CREATE TRIGGER IF NOT EXISTS {TABELA_CONSOLIDADO}_ai
+        AFTER INSERT ON beneficiarios BEGIN
+            {adicionar_novo}
+        END;
+        CREATE TRIGGER IF NOT EXISTS {TABELA_CONSOLIDADO}_ad
+        AFTER DELETE ON beneficiarios BEGIN
+            {remover_antigo}
+        END;
+        CREATE TRIGGER IF NOT EXISTS {TABELA_CONSOLIDADO}_au
+        AFTER UPDATE OF municipio, status ON beneficiarios
+        WHEN old.municipio IS NOT new.municipio
+            OR old.status IS NOT new.status
+        BEGIN
+            {remover_antigo}
+            {adicionar_novo}
+        END;
+    """
+
+
+def _recalcular(conexao: sqlite3.Connection):
+    """Reconstrói a tabela a partir da consulta ao vivo e gera uma nova
+    versão de `beneficiarios` (sem commit)."""
+    colunas = ", ".join(COLUNAS_CONSOLIDADO)
+    conexao.execute(f"DELETE FROM {TABELA_CONSOLIDADO}")
+    conexao.execute(
+        f"INSERT INTO {TABELA_CONSOLIDADO} ({colunas}) {CONSULTA_AO_VIVO}"
+    )
+    versoes.incrementar(conexao, "beneficiarios")
+
+
+def preparar_consolidado():
+    """Cria a tabela e os triggers; recalcula se os triggers não existiam
+    (tabela nova ou `beneficiarios` recriada). Requer
+    `versoes.preparar_versoes`."""
+    conexao = banco.escrita()
+    with conexao:
+        versao_antiga = conexao.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' "
+            "AND name = ?", (TABELA_VERSAO_ANTIGA,)
+        ).fetchone()[0]
+        if versao_antiga:
+            # Os triggers antigos também atualizavam a tabela de versão
+            for sufixo in ("ai", "ad", "au"):
+                conexao.execute(
+                    f"DROP TRIGGER IF EXISTS {TABELA_CONSOLIDADO}_{sufixo}"
+                )
+            conexao.execute(f"DROP TABLE {TABELA_VERSAO_ANTIGA}")
+        triggers_existentes = conexao.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' "
+            "AND name LIKE ?", (f"{TABELA_CONSOLIDADO}_%",)
+        ).fetchone()[0]
+        colunas_contagem = ",\n".join(
+            f"{c} INTEGER NOT NULL DEFAULT 0"
+            for c in COLUNAS_CONSOLIDADO[1:]
+        )
+        conexao.executescript(
+            f"""
+            CREATE TABLE IF NOT EXISTS {TABELA_CONSOLIDADO} (
+                municipio TEXT PRIMARY KEY,
+                {colunas_contagem}
+            );
+            """
+        )
+        conexao.executescript(_triggers_sql())
+        if triggers_existentes < 3:
+            _recalcular(conexao)
+            logging.info(
+                "Consolidado por município recalculado (triggers "
+                "recriados)."
+            )
+
+
+def recalcular():
+    """Recalcula o consolidado inteiro (após importações em massa)."""
+    conexao = banco.escrita()
+    with conexao:
+        _recalcular(conexao)
+
+
+def consultar(
+    municipio: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], int]:
+    """Retorna (linhas do consolidado, versão de `beneficiarios`) lidas na
+    mesma transação."""
+    colunas = ", ".join(COLUNAS_CONSOLIDADO)
+    sql = f"SELECT {colunas} FROM {TABELA_CONSOLIDADO}"
+    parametros: tuple = ()
+    if municipio:
+        sql += " WHERE municipio = ?"
+        parametros = (municipio,)
+    conexao = banco.leitura()
+    with conexao:
+        conexao.execute("BEGIN")
+        versao = conexao.execute(
+            f"SELECT versao FROM {versoes.TABELA_VERSOES} WHERE nome = ?",
+            ("beneficiarios",)
+        ).fetchone()[0]
+        linhas = conexao.execute(
+            sql + " ORDER BY municipio", parametros
+        ).fetchall()
+    return [dict(linha) for linha in linhas], versao
+
+
+def verificar() -> List[Dict[str, Any]]:
+    """Compara a tabela materializada com a consulta ao vivo.
+
+    Retorna a lista de divergências (vazia quando as duas batem).
+    """
+    conexao = banco.leitura()
+    with conexao:
+        conexao.execute("BEGIN")
+        ao_vivo = {
+            linha["municipio"]: dict(linha)
+            for linha in conexao.execute(CONSULTA_AO_VIVO)
+        }
+        materializado = {
+            linha["municipio"]: dict(linha)
+            for linha in conexao.execute(
+                f"SELECT {', '.join(COLUNAS_CONSOLIDADO)} "
+                f"FROM {TABELA_CONSOLIDADO}"
+            )
+        }
+    return [
+        {
+            "municipio": municipio,
+            "ao_vivo": ao_vivo.get(municipio),
+            "materializado": materializado.get(municipio),
+        }
+        for municipio in sorted(set(ao_vivo) | set(materializado))
+        if ao_vivo.get(municipio) != materializado.get(municipio)
+    ]
@@ -0,0 +1,276 @@
+"""
+Artefatos de depuração do OCR (imagens intermediárias do pipeline).
+
+Antes, cada execução gravava em `uploads/`, de forma síncrona e com nomes
+aleatórios, o recorte de cada página e a binarização de cada ROI. Agora:
+
+- Desligado por padrão. `DEBUG_AMOSTRAGEM_PCT` define a porcentagem de
+  lotes com artefatos (100 = todos). A escolha é feita pelo hash do lote de
+  origem, então um lote amostrado tem todos os seus artefatos, em qualquer
+  worker.
+- `salvar` apenas enfileira a imagem. Uma thread do próprio processo (cada
+  worker do motor de OCR tem a sua) codifica o PNG e o grava em
+  `DEBUG_FOLDER/<lote>/`. Com a fila cheia, o artefato é descartado, sem
+  atrasar o OCR.
+- A mesma thread aplica a retenção: apaga arquivos com mais de
+  `DEBUG_MAX_HORAS` e, depois, os mais antigos até o diretório caber em
+  `DEBUG_MAX_BYTES`.
+
+Os artefatos são auxiliares: os que estiverem na fila quando o processo
+terminar são perdidos.
+"""
+
+import os
+import time
+import queue
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app.eventos import lote_raiz
+
+DEBUG_FOLDER = os.getenv("DEBUG_FOLDER", "debug_artefatos")
+# Porcentagem de lotes com artefatos de depuração (0 = desligado).
+DEBUG_AMOSTRAGEM_PCT = float(os.getenv("DEBUG_AMOSTRAGEM_PCT", "0"))
+DEBUG_MAX_BYTES = int(os.getenv("DEBUG_MAX_BYTES", str(200 * 1024 * 1024)))
+DEBUG_MAX_HORAS = float(os.getenv("DEBUG_MAX_HORAS", "72"))
+# Imagens aguardando gravação antes de começar a descartar.
+DEBUG_TAMANHO_FILA = int(os.getenv("DEBUG_TAMANHO_FILA", "256"))
+# Intervalo mínimo (s) entre duas varreduras de retenção.
+DEBUG_INTERVALO_LIMPEZA = float(os.getenv("DEBUG_INTERVALO_LIMPEZA", "60"))
+
+# Caracteres aceitos em nomes de lote e de artefato (sem separadores).
+_CARACTERES_VALIDOS = set(
+    "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_-."
+)
+
+
+def nome_seguro(nome: str) -> bool:
+    """True se `nome` pode ser usado como um componente de caminho."""
+    return bool(nome) and nome not in (".", "..") and all(
+        c in _CARACTERES_VALIDOS for c in nome
+    )
+
+
+def _limpar_nome(nome: str) -> str:
+    """Troca por "_" os caracteres não aceitos em nomes de arquivo."""
+    return "".join(c if c in _CARACTERES_VALIDOS else "_" for c in nome)
+
+
+def amostrado(lote: Optional[str], pct: float = DEBUG_AMOSTRAGEM_PCT) -> bool:
+    """True se o lote deve ter artefatos de depuração."""
+    if pct <= 0 or not lote:
+        return False
+    if pct >= 100:
+        return True
+    resumo = hashlib.sha1(lote_raiz(lote).encode("utf-8")).digest()
+    return int.from_bytes(resumo[:4], "big") % 10000 < pct * 100
+
+
+class GravadorDepuracao:
+    """Fila e thread de gravação dos artefatos, com retenção por tamanho e
+    idade do diretório."""
+
+    def __init__(
+        self,
+        pasta: str = DEBUG_FOLDER,
+        amostragem_pct: float = DEBUG_AMOSTRAGEM_PCT,
+        max_bytes: int = DEBUG_MAX_BYTES,
+        max_horas: float = DEBUG_MAX_HORAS,
+        tamanho_fila: int = DEBUG_TAMANHO_FILA
+    ):
+        self.pasta = pasta
+        self.amostragem_pct = amostragem_pct
+        self.max_bytes = max_bytes
+        self.max_horas = max_horas
+        self.tamanho_fila = tamanho_fila
+        self._fila: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._trava = threading.Lock()
+        self._ultima_limpeza = 0.0
+        # Métricas (do processo atual)
+        self.gravados = 0
+        self.descartados = 0
+        self.removidos = 0
+        self.bytes_removidos = 0
+
+    def _garantir_thread(self) -> queue.Queue:
+        """Cria a fila e a thread no processo atual (também após um fork,
+        que não copia threads)."""
+        with self._trava:
+            if self._pid != os.getpid() or self._thread is None:
+                self._fila = queue.Queue(maxsize=max(1, self.tamanho_fila))
+                self._thread = threading.Thread(
+                    target=self._gravar, name="depuracao", daemon=True
+                )
+                self._pid = os.getpid()
+                self._thread.start()
+            return self._fila
+
+    def salvar(self, lote: Optional[str], nome: str, imagem: np.ndarray):
+        """Enfileira `imagem` como `<nome>.png` do lote, se ele foi
+        amostrado. Não espera a gravação."""
+        if not amostrado(lote, self.amostragem_pct):
+            return
+        fila = self._garantir_thread()
+        try:
+            # Cópia: a imagem pode ser uma view de uma página ainda em uso
+            fila.put_nowait((lote, nome, imagem.copy()))
+        except queue.Full:
+            self.descartados += 1
+
+    def _gravar(self):
+        """Laço da thread: grava os artefatos e aplica a retenção."""
+        fila = self._fila
+        while True:
+            try:
+                lote, nome, imagem = fila.get(timeout=DEBUG_INTERVALO_LIMPEZA)
+            except queue.Empty:
+                self._limpar_se_preciso()
+                continue
+            pasta_lote = os.path.join(self.pasta, lote_raiz(lote))
+            caminho = os.path.join(
+                pasta_lote, f"{_limpar_nome(lote)}_{_limpar_nome(nome)}.png"
+            )
+            try:
+                os.makedirs(pasta_lote, exist_ok=True)
+                cv2.imwrite(caminho, imagem)
+                self.gravados += 1
+            except Exception as e:  # pylint: disable=broad-except
+                logging.error(
+                    "[%s] Erro ao salvar artefato de depuração %s: %s",
+                    lote, nome, e
+                )
+            self._limpar_se_preciso()
+
+    def _limpar_se_preciso(self):
+        """Aplica a retenção, no máximo uma vez por intervalo."""
+        agora = time.monotonic()
+        if agora - self._ultima_limpeza < DEBUG_INTERVALO_LIMPEZA:
+            return
+        self._ultima_limpeza = agora
+        try:
+            self.limpar()
+        except OSError as e:
+            logging.error("Erro na retenção dos artefatos de depuração: %s", e)
+
+    def _listar_arquivos(self) -> List[Tuple[float, int, str]]:
+        """(mtime, bytes, caminho) de todos os artefatos."""
+        arquivos = []
+        if not os.path.isdir(self.pasta):
+            return arquivos
+        for pasta_lote in os.scandir(self.pasta):
+            if not pasta_lote.is_dir():
+                continue
+            for arquivo in os.scandir(pasta_lote.path):
+                try:
+                    info = arquivo.stat()
+                except FileNotFoundError:
+                    continue  # removido por outro worker
+                arquivos.append((info.st_mtime, info.st_size, arquivo.path))
+        return arquivos
+
+    def _remover(self, caminho: str, tamanho: int):
+        """Apaga um artefato e contabiliza o espaço liberado."""
+        try:
+            os.remove(caminho)
+        except FileNotFoundError:
+            return
+        self.removidos += 1
+        self.bytes_removidos += tamanho
+
+    def limpar(self) -> Dict[str, int]:
+        """Remove artefatos vencidos e, se ainda passar de `max_bytes`, os
+        mais antigos. Retorna o que foi removido nesta chamada."""
+        removidos_antes = self.removidos
+        bytes_antes = self.bytes_removidos
+        limite_mtime = time.time() - self.max_horas * 3600
+
+        restantes = []
+        for mtime, tamanho, caminho in sorted(self._listar_arquivos()):
+            if mtime < limite_mtime:
+                self._remover(caminho, tamanho)
+            else:
+                restantes.append((tamanho, caminho))
+
+        total = sum(tamanho for tamanho, _ in restantes)
+        for tamanho, caminho in restantes:
+            if total <= self.max_bytes:
+                break
+            self._remover(caminho, tamanho)
+            total -= tamanho
+
+        if os.path.isdir(self.pasta):
+            for pasta_lote in os.scandir(self.pasta):
+                try:
+                    os.rmdir(pasta_lote.path)  # só remove se estiver vazia
+                except OSError:
+                    pass
+
+        resultado = {
+            "removidos": self.removidos - removidos_antes,
+            "bytes_removidos": self.bytes_removidos - bytes_antes,
+        }
+        if resultado["removidos"]:
+            logging.info(
+                "Depuração: %d artefato(s) removido(s), %d bytes liberados.",
+                resultado["removidos"], resultado["bytes_removidos"]
+            )
+        return resultado
+
+    def artefatos(self, lote: str) -> List[Dict[str, Any]]:
+        """Artefatos gravados do lote (e dos formulários dele)."""
+        pasta_lote = os.path.join(self.pasta, lote_raiz(lote))
+        if not os.path.isdir(pasta_lote):
+            return []
+        itens = []
+        for arquivo in sorted(os.scandir(pasta_lote), key=lambda a: a.name):
+            if lote != lote_raiz(lote) and not arquivo.name.startswith(
+                    f"{lote}_"):
+                continue
+            try:
+                info = arquivo.stat()
+            except FileNotFoundError:
+                continue
+            itens.append({
+                "nome": arquivo.name,
+                "bytes": info.st_size,
+                "modificado": int(info.st_mtime),
+            })
+        return itens
+
+    def caminho(self, lote: str, nome: str) -> Optional[str]:
+        """Caminho de um artefato do lote, ou None se não existir."""
+        if not (nome_seguro(lote) and nome_seguro(nome)):
+            return None
+        caminho = os.path.join(self.pasta, lote_raiz(lote), nome)
+        return caminho if os.path.isfile(caminho) else None
+
+    def metricas(self) -> Dict[str, Any]:
+        """Configuração e contadores do processo atual."""
+        fila = self._fila if self._pid == os.getpid() else None
+        return {
+            "amostragem_pct": self.amostragem_pct,
+            "pasta": self.pasta,
+            "max_bytes": self.max_bytes,
+            "max_horas": self.max_horas,
+            "pendentes": fila.qsize() if fila is not None else 0,
+            "gravados": self.gravados,
+            "descartados": self.descartados,
+            "removidos": self.removidos,
+            "bytes_removidos": self.bytes_removidos,
+        }
+
+
+# Instância do processo (a API e cada worker do motor de OCR têm a sua).
+gravador = GravadorDepuracao()
+
+
+def salvar(lote: Optional[str], nome: str, imagem: np.ndarray):
+    """Atalho para `gravador.salvar`."""
+    gravador.salvar(lote, nome, imagem)
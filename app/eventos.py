@@ -0,0 +1,188 @@
+"""
+Barramento interno de eventos de progresso dos lotes.
+
+As etapas do processamento publicam eventos com `publicar`, que só numera o
+evento e o coloca em um buffer circular (`TAMANHO_BUFFER_EVENTOS`): não há
+espera por rede nem serialização no caminho do processamento. Uma tarefa
+despachante, separada, entrega os eventos aos assinantes (os WebSockets, via
+`app.notificacoes`) na ordem em que foram publicados.
+
+O buffer também serve para reenviar os últimos eventos de um lote a quem
+se conecta depois (`recentes`). As métricas mostram o tempo que o
+processamento passa publicando e o tempo gasto nas entregas, que antes era
+pago pelo próprio processamento a cada mensagem.
+"""
+
+import os
+import time
+import asyncio
+import datetime
+import logging
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+TAMANHO_BUFFER_EVENTOS = int(os.getenv("TAMANHO_BUFFER_EVENTOS", "2000"))
+# Eventos reenviados por lote a um cliente que assina depois.
+REPLAY_EVENTOS_POR_LOTE = int(os.getenv("REPLAY_EVENTOS_POR_LOTE", "50"))
+
+TIPO_PROGRESSO = "progresso"
+TIPO_STATUS = "status"
+TIPO_ERRO = "erro"
+TIPO_CONCLUIDO = "concluido"
+
+Evento = Dict[str, Any]
+
+
+def lote_raiz(lote: Optional[str]) -> Optional[str]:
+    """Lote de origem de um ID de formulário ("ab12cd34-2" -> "ab12cd34")."""
+    if not lote:
+        return lote
+    return lote.split("-", 1)[0]
+
+
+class BarramentoEventos:
+    """Buffer circular de eventos e tarefa que os entrega aos assinantes.
+
+    `publicar` deve ser chamado no loop de eventos da aplicação.
+    """
+
+    def __init__(self, tamanho_buffer: int = TAMANHO_BUFFER_EVENTOS):
+        self._buffer: Deque[Evento] = deque(maxlen=max(1, tamanho_buffer))
+        self._assinantes: List[Callable[[Evento], None]] = []
+        self._seq = 0
+        self._despachado = 0  # seq do último evento entregue
+        self._sinal: Optional[asyncio.Event] = None
+        self._tarefa: Optional[asyncio.Task] = None
+        # Métricas
+        self._entregues = 0
+        self._perdidos = 0
+        self._publicacao_ms = 0.0
+        self._entrega_ms = 0.0
+        self._atraso_ms = 0.0
+
+    def assinar(self, entregar: Callable[[Evento], None]):
+        """Registra uma função chamada (no despachante) a cada evento."""
+        self._assinantes.append(entregar)
+
+    def publicar(
+        self,
+        mensagem: str,
+        lote: Optional[str] = None,
+        tipo: str = TIPO_PROGRESSO
+    ) -> Evento:
+        """Registra um evento do lote e retorna sem esperar a entrega."""
+        inicio = time.perf_counter()
+        self._seq += 1
+        evento = {
+            "seq": self._seq,
+            "lote": lote,
+            "tipo": tipo,
+            "mensagem": mensagem,
+            "momento": datetime.datetime.now().isoformat(timespec="seconds"),
+            "_publicado": inicio,
+        }
+        if (len(self._buffer) == self._buffer.maxlen
+                and self._buffer[0]["seq"] > self._despachado):
+            self._perdidos += 1  # sai do buffer antes de ser entregue
+        self._buffer.append(evento)
+        logging.info("Evento [%s] %s: %s", lote, tipo, mensagem)
+        if self._sinal is not None:
+            self._sinal.set()
+        self._publicacao_ms += (time.perf_counter() - inicio) * 1000
+        return evento
+
+    def _pendentes(self) -> List[Evento]:
+        """Eventos do buffer ainda não entregues, em ordem."""
+        pendentes = []
+        for evento in reversed(self._buffer):
+            if evento["seq"] <= self._despachado:
+                break
+            pendentes.append(evento)
+        pendentes.reverse()
+        return pendentes
+
+    async def _despachar(self):
+        """Entrega os eventos pendentes aos assinantes, continuamente."""
+        while True:
+            await self._sinal.wait()
+            self._sinal.clear()
+            for evento in self._pendentes():
+                inicio = time.perf_counter()
+                publico = {
+                    k: v for k, v in evento.items() if not k.startswith("_")
+                }
+                for entregar in self._assinantes:
+                    try:
+                        entregar(publico)
+                    except Exception:  # pylint: disable=broad-except
+                        logging.exception(
+                            "Erro ao entregar o evento %d.", evento["seq"]
+                        )
+                fim = time.perf_counter()
+                self._entrega_ms += (fim - inicio) * 1000
+                self._atraso_ms += (fim - evento["_publicado"]) * 1000
+                self._despachado = evento["seq"]
+                self._entregues += 1
+            # Cede o loop entre rajadas de eventos
+            await asyncio.sleep(0)
+
+    def iniciar(self):
+        """Inicia a tarefa despachante (no loop atual)."""
+        if self._tarefa is None:
+            self._sinal = asyncio.Event()
+            self._sinal.set()  # entrega o que foi publicado antes
+            self._tarefa = asyncio.create_task(self._despachar())
+
+    async def encerrar(self):
+        """Cancela a tarefa despachante."""
+        if self._tarefa is not None:
+            self._tarefa.cancel()
+            try:
+                await self._tarefa
+            except asyncio.CancelledError:
+                pass
+            self._tarefa = None
+            self._sinal = None
+
+    def recentes(
+        self, lote: str, limite: int = REPLAY_EVENTOS_POR_LOTE
+    ) -> List[Evento]:
+        """Últimos eventos já entregues do lote (`"*"`: de todos), para
+        reenviar a quem assina depois. Os ainda pendentes chegarão pelo
+        despachante."""
+        eventos = []
+        for evento in reversed(self._buffer):
+            if len(eventos) >= limite:
+                break
+            if evento["seq"] > self._despachado:
+                continue
+            if lote == "*" or lote_raiz(evento["lote"]) == lote:
+                eventos.append(
+                    {k: v for k, v in evento.items() if not k.startswith("_")}
+                )
+        eventos.reverse()
+        return eventos
+
+    def metricas(self) -> Dict[str, Any]:
+        """Eventos publicados/entregues e tempos de publicação e entrega."""
+        entregues = self._entregues
+        return {
+            "publicados": self._seq,
+            "entregues": entregues,
+            "pendentes": self._seq - self._despachado,
+            "perdidos": self._perdidos,
+            "no_buffer": len(self._buffer),
+            # Tempo que o processamento passou publicando
+            "publicacao_total_ms": round(self._publicacao_ms, 3),
+            "publicacao_media_ms": round(
+                self._publicacao_ms / self._seq, 4
+            ) if self._seq else 0.0,
+            # Tempo das entregas, que antes bloqueava o processamento
+            "entrega_total_ms": round(self._entrega_ms, 3),
+            "entrega_media_ms": round(
+                self._entrega_ms / entregues, 4
+            ) if entregues else 0.0,
+            "atraso_medio_ms": round(
+                self._atraso_ms / entregues, 3
+            ) if entregues else 0.0,
+        }
@@ -0,0 +1,201 @@
+"""
+Fila de jobs com controle de admissão para o endpoint `/upload`.
+
+Cada lote enviado vira um job em uma fila limitada, consumida por um número
+configurável de workers assíncronos. Quando a fila está cheia, o upload é
+recusado (503 + Retry-After) em vez de disparar mais um pipeline de
+Poppler/Tesseract. O estado de cada job fica disponível para consulta:
+`falhou` é reservado a erros de processamento (OCR, preparação da imagem,
+exceções); um lote processado sem erro, mas sem Nome/CPF extraídos, termina
+como `incompleto`.
+"""
+
+import os
+import math
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Tamanho máximo da fila de lotes aguardando processamento.
+FILA_MAX_JOBS = int(os.getenv("FILA_MAX_JOBS", "50"))
+# Quantos lotes são processados ao mesmo tempo.
+FILA_CONCORRENCIA = int(
+    os.getenv("FILA_CONCORRENCIA", str(os.cpu_count() or 1))
+)
+# Quantos jobs finalizados são mantidos para consulta de status.
+FILA_MAX_HISTORICO_JOBS = 1000
+
+ESTADO_NA_FILA = "na_fila"
+ESTADO_PROCESSANDO = "processando"
+ESTADO_CONCLUIDO = "concluido"
+ESTADO_INCOMPLETO = "incompleto"
+ESTADO_FALHOU = "falhou"
+
+# Resultados que o processador de um lote pode retornar.
+RESULTADO_SUCESSO = "sucesso"
+RESULTADO_INCOMPLETO = "incompleto"
+RESULTADO_ERRO = "erro"
+
+
+class FilaCheiaError(Exception):
+    """Levantada quando a fila não aceita novos jobs."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Fila de processamento cheia.")
+        self.retry_after = retry_after
+
+
+class FilaJobs:
+    """Fila limitada de lotes, com workers e estados por job."""
+
+    def __init__(
+        self,
+        processador: Callable[..., Awaitable[Any]],
+        max_jobs: int = FILA_MAX_JOBS,
+        concorrencia: int = FILA_CONCORRENCIA
+    ):
+        """Recebe a corrotina que processa um lote e os limites da fila.
+
+        A corrotina retorna um dos `RESULTADO_*`: `RESULTADO_ERRO` (ou
+        False) marca o job como `falhou`, `RESULTADO_INCOMPLETO` como
+        `incompleto` e os demais valores como `concluido`.
+        """
+        self.processador = processador
+        self.max_jobs = max(1, max_jobs)
+        self.concorrencia = max(1, concorrencia)
+        self._fila: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # Média móvel da duração dos jobs, usada para estimar Retry-After.
+        self._duracao_media = 30.0
+
+    async def iniciar(self):
+        """Cria a fila e os workers consumidores."""
+        if self._workers:
+            return
+        self._fila = asyncio.Queue(maxsize=self.max_jobs)
+        self._workers = [
+            asyncio.create_task(self._worker(i))
+            for i in range(self.concorrencia)
+        ]
+        logging.info(
+            "Fila de jobs iniciada: capacidade %d, %d worker(s).",
+            self.max_jobs, self.concorrencia
+        )
+
+    async def encerrar(self):
+        """Cancela os workers. Jobs ainda na fila são descartados."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logging.info("Fila de jobs encerrada.")
+
+    def cheia(self) -> bool:
+        """Indica se um novo job seria recusado agora."""
+        return self._fila is not None and self._fila.full()
+
+    def estimar_retry_after(self) -> int:
+        """Estima, em segundos, quando a fila deve voltar a ter espaço."""
+        tamanho = self._fila.qsize() if self._fila else 0
+        rodadas = max(1, math.ceil(tamanho / self.concorrencia))
+        return max(1, math.ceil(rodadas * self._duracao_media))
+
+    def enfileirar(self, beneficiario_id: str, *args: Any) -> Dict[str, Any]:
+        """Adiciona um lote à fila ou levanta FilaCheiaError."""
+        if self._fila is None:
+            raise RuntimeError("Fila de jobs não iniciada.")
+        job = {
+            "beneficiario_id": beneficiario_id,
+            "estado": ESTADO_NA_FILA,
+            "criado_em": time.time(),
+            "iniciado_em": None,
+            "concluido_em": None,
+            "erro": None,
+            "aviso": None,
+        }
+        try:
+            self._fila.put_nowait((job, args))
+        except asyncio.QueueFull as e:
+            raise FilaCheiaError(self.estimar_retry_after()) from e
+
+        self._jobs[beneficiario_id] = job
+        while len(self._jobs) > self.max_jobs + FILA_MAX_HISTORICO_JOBS:
+            self._jobs.popitem(last=False)
+        return job
+
+    def status(self, beneficiario_id: str) -> Optional[Dict[str, Any]]:
+        """Retorna o estado de um job, com a posição na fila se aplicável."""
+        job = self._jobs.get(beneficiario_id)
+        if job is None:
+            return None
+        status = dict(job)
+        if job["estado"] == ESTADO_NA_FILA:
+            na_fila = [
+                j for j in self._jobs.values()
+                if j["estado"] == ESTADO_NA_FILA
+            ]
+            status["posicao_fila"] = na_fila.index(job) + 1
+        return status
+
+    def metricas(self) -> Dict[str, Any]:
+        """Resumo da ocupação da fila."""
+        contagem = {
+            estado: 0 for estado in (
+                ESTADO_NA_FILA, ESTADO_PROCESSANDO, ESTADO_CONCLUIDO,
+                ESTADO_INCOMPLETO, ESTADO_FALHOU
+            )
+        }
+        for job in self._jobs.values():
+            contagem[job["estado"]] += 1
+        return {
+            "capacidade": self.max_jobs,
+            "concorrencia": self.concorrencia,
+            "duracao_media_s": round(self._duracao_media, 2),
+            "jobs": contagem,
+        }
+
+    async def _worker(self, indice: int):
+        """Consome jobs da fila até ser cancelado."""
+        while True:
+            job, args = await self._fila.get()
+            job["estado"] = ESTADO_PROCESSANDO
+            job["iniciado_em"] = time.time()
+            try:
+                resultado = await self.processador(
+                    job["beneficiario_id"], *args
+                )
+                if resultado is False or resultado == RESULTADO_ERRO:
+                    job["estado"] = ESTADO_FALHOU
+                    job["erro"] = (
+                        "Processamento terminou com erro; veja o histórico "
+                        "do lote."
+                    )
+                elif resultado == RESULTADO_INCOMPLETO:
+                    job["estado"] = ESTADO_INCOMPLETO
+                    job["aviso"] = (
+                        "Nome/CPF não extraídos; cadastro não iniciado. "
+                        "Veja o histórico do lote."
+                    )
+                else:
+                    job["estado"] = ESTADO_CONCLUIDO
+            except asyncio.CancelledError:
+                job["estado"] = ESTADO_FALHOU
+                job["erro"] = "Processamento cancelado."
+                raise
+            except Exception as e:  # pylint: disable=broad-except
+                logging.exception(
+                    "[%s] Job falhou no worker %d: %s",
+                    job["beneficiario_id"], indice, e
+                )
+                job["estado"] = ESTADO_FALHOU
+                job["erro"] = str(e)
+            finally:
+                job["concluido_em"] = time.time()
+                duracao = job["concluido_em"] - job["iniciado_em"]
+                self._duracao_media = (
+                    0.8 * self._duracao_media + 0.2 * duracao
+                )
+                self._fila.task_done()
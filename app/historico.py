@@ -0,0 +1,260 @@
+"""
+Histórico de processamentos em modo somente-inserção.
+
+Os registros ficam na tabela `historico` do `agendha.db` (journal WAL): cada
+`registrar` é um único INSERT, sem reler nem reescrever o histórico inteiro
+como acontecia com o `historico.json`. Escritas concorrentes são
+serializadas pelo próprio SQLite (ver `app.banco`). Na primeira inicialização o
+`historico.json` existente é importado uma única vez.
+
+As consultas são paginadas por cursor (o `id` do último registro devolvido,
+do mais recente para o mais antigo) e usam os índices da tabela, então o
+custo de uma página não cresce com o tamanho do histórico.
+"""
+
+import os
+import json
+import logging
+import sqlite3
+import datetime
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.banco import banco
+
+HISTORICO_JSON_LEGADO = "historico.json"
+FORMATO_DATA_HISTORICO = "%d/%m/%Y %H:%M:%S"
+
+CAMPOS_HISTORICO = (
+    "id_lote",
+    "nome_beneficiario",
+    "cpf_beneficiario",
+    "status_processamento",
+    "data_processamento",
+    "arquivos_originais",
+    "dados_extraidos_completos",
+)
+# Sem os blobs de dados extraídos: é o que a tela de processamento exibe.
+CAMPOS_LEVES = CAMPOS_HISTORICO[:5]
+CAMPOS_JSON = {"arquivos_originais": "[]", "dados_extraidos_completos": "{}"}
+LIMITE_PAGINA_PADRAO = 50
+LIMITE_PAGINA_MAXIMO = 500
+TAMANHO_LOTE_EXPORTACAO = 500
+
+_lock = threading.Lock()
+_inicializado = False
+
+
+def _data_iso(data_processamento: str) -> Optional[str]:
+    """Converte "DD/MM/AAAA HH:MM:SS" para ISO-8601 (para ordenar/filtrar)."""
+    try:
+        return datetime.datetime.strptime(
+            data_processamento, FORMATO_DATA_HISTORICO
+        ).isoformat()
+    except (TypeError, ValueError):
+        return None
+
+
+def _linha_para_registro(
+    linha: sqlite3.Row, campos: Sequence[str] = CAMPOS_HISTORICO
+) -> Dict[str, Any]:
+    """Monta um registro no mesmo formato do antigo historico.json, apenas
+    com os `campos` pedidos."""
+    registro = {}
+    for campo in campos:
+        valor = linha[campo]
+        if campo in CAMPOS_JSON:
+            valor = json.loads(valor or CAMPOS_JSON[campo])
+        registro[campo] = valor
+    return registro
+
+
+def _inserir(conexao: sqlite3.Connection, registros: List[Dict[str, Any]]):
+    """INSERT de um ou mais registros (sem commit)."""
+    conexao.executemany(
+        """
+        INSERT INTO historico (
+            id_lote, nome_beneficiario, cpf_beneficiario,
+            status_processamento, data_processamento, data_iso,
+            arquivos_originais, dados_extraidos_completos
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        [
+            (
+                r.get("id_lote"),
+                r.get("nome_beneficiario"),
+                r.get("cpf_beneficiario"),
+                r.get("status_processamento"),
+                r.get("data_processamento"),
+                _data_iso(r.get("data_processamento")),
+                json.dumps(r.get("arquivos_originais") or [],
+                           ensure_ascii=False),
+                json.dumps(r.get("dados_extraidos_completos") or {},
+                           ensure_ascii=False),
+            )
+            for r in registros
+        ]
+    )
+
+
+def _migrar_json_legado(conexao: sqlite3.Connection, json_path: str):
+    """Importa o historico.json (uma única vez) e o renomeia.
+
+    A importação só acontece com a tabela vazia, para que uma interrupção
+    entre o commit e o renomear não duplique os registros.
+    """
+    if not os.path.exists(json_path):
+        return
+    if conexao.execute("SELECT 1 FROM historico LIMIT 1").fetchone():
+        os.replace(json_path, json_path + ".migrado")
+        return
+    try:
+        with open(json_path, "r", encoding="utf-8") as hist_file:
+            registros = json.load(hist_file)
+    except json.JSONDecodeError:
+        logging.warning(
+            "Arquivo histórico %s vazio/corrompido. Nada a migrar.", json_path
+        )
+        registros = []
+
+    with conexao:
+        _inserir(conexao, registros)
+    os.replace(json_path, json_path + ".migrado")
+    logging.info(
+        "Histórico: %d registro(s) migrado(s) de %s para a tabela "
+        "'historico'.", len(registros), json_path
+    )
+
+
+def inicializar_historico(json_legado: str = HISTORICO_JSON_LEGADO):
+    """Cria a tabela (uma vez por processo) e migra o historico.json."""
+    global _inicializado
+    with _lock:
+        if _inicializado:
+            return
+        conexao = banco.escrita()
+        conexao.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS historico (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                id_lote TEXT,
+                nome_beneficiario TEXT,
+                cpf_beneficiario TEXT,
+                status_processamento TEXT,
+                data_processamento TEXT,
+                data_iso TEXT,
+                arquivos_originais TEXT,
+                dados_extraidos_completos TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_historico_id_lote
+                ON historico (id_lote);
+            CREATE INDEX IF NOT EXISTS idx_historico_status
+                ON historico (status_processamento, id);
+            CREATE INDEX IF NOT EXISTS idx_historico_cpf
+                ON historico (cpf_beneficiario, id);
+            CREATE INDEX IF NOT EXISTS idx_historico_data
+                ON historico (data_iso);
+            """
+        )
+        _migrar_json_legado(conexao, json_legado)
+        _inicializado = True
+
+
+def registrar(registro: Dict[str, Any]):
+    """Acrescenta um registro ao histórico (O(1), seguro entre threads)."""
+    inicializar_historico()
+    conexao = banco.escrita()
+    with conexao:
+        _inserir(conexao, [registro])
+
+
+def validar_campos(campos: Optional[str]) -> Tuple[str, ...]:
+    """Converte "campo1,campo2" na projeção pedida (padrão: CAMPOS_LEVES).
+
+    "todos" devolve todos os campos. Levanta ValueError para campos
+    desconhecidos.
+    """
+    if not campos:
+        return CAMPOS_LEVES
+    if campos == "todos":
+        return CAMPOS_HISTORICO
+    pedidos = tuple(c.strip() for c in campos.split(",") if c.strip())
+    desconhecidos = [c for c in pedidos if c not in CAMPOS_HISTORICO]
+    if desconhecidos:
+        raise ValueError(
+            f"Campo(s) desconhecido(s): {', '.join(desconhecidos)}."
+        )
+    return pedidos or CAMPOS_LEVES
+
+
+def _data_filtro(data: str, fim: bool = False) -> str:
+    """Limite ISO de um filtro de data "AAAA-MM-DD" (o fim é inclusivo)."""
+    try:
+        dia = datetime.date.fromisoformat(data)
+    except ValueError as e:
+        raise ValueError(
+            f"Data inválida '{data}'. Use o formato AAAA-MM-DD."
+        ) from e
+    if fim:
+        dia += datetime.timedelta(days=1)
+    return dia.isoformat()
+
+
+def _montar_filtros(filtros: Dict[str, Optional[str]]) -> Tuple[str, list]:
+    """Cláusula WHERE (sem o cursor) e seus parâmetros."""
+    condicoes, parametros = [], []
+    if filtros.get("status"):
+        condicoes.append("status_processamento = ?")
+        parametros.append(filtros["status"])
+    if filtros.get("cpf"):
+        condicoes.append("cpf_beneficiario = ?")
+        parametros.append(filtros["cpf"])
+    if filtros.get("id_lote"):
+        condicoes.append("id_lote = ?")
+        parametros.append(filtros["id_lote"])
+    if filtros.get("data_inicio"):
+        condicoes.append("data_iso >= ?")
+        parametros.append(_data_filtro(filtros["data_inicio"]))
+    if filtros.get("data_fim"):
+        condicoes.append("data_iso < ?")
+        parametros.append(_data_filtro(filtros["data_fim"], fim=True))
+    return " AND ".join(condicoes), parametros
+
+
+def validar_filtros(filtros: Dict[str, Optional[str]]):
+    """Levanta ValueError se algum filtro (ex.: data) for inválido."""
+    _montar_filtros(filtros)
+
+
+def consultar(
+    filtros: Optional[Dict[str, Optional[str]]] = None,
+    cursor: Optional[int] = None,
+    limite: int = LIMITE_PAGINA_PADRAO,
+    campos: Sequence[str] = CAMPOS_LEVES
+) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """Uma página do histórico, do mais recente para o mais antigo.
+
+    `cursor` é o valor devolvido pela página anterior; o retorno é
+    (registros, próximo cursor), com cursor None na última página.
+    """
+    inicializar_historico()
+    limite = max(1, min(limite, LIMITE_PAGINA_MAXIMO))
+    where, parametros = _montar_filtros(filtros or {})
+    if cursor is not None:
+        where = f"{where} AND id < ?" if where else "id < ?"
+        parametros.append(cursor)
+    colunas = ", ".join(("id",) + tuple(campos))
+    sql = (
+        f"SELECT {colunas} FROM historico "
+        f"{'WHERE ' + where if where else ''} "
+        "ORDER BY id DESC LIMIT ?"
+    )
+    linhas = banco.leitura().execute(
+        sql, parametros + [limite + 1]
+    ).fetchall()
+    proximo_cursor = linhas[limite - 1]["id"] if len(linhas) > limite else None
+    return (
+        [_linha_para_registro(linha, campos) for linha in linhas[:limite]],
+        proximo_cursor
+    )
+
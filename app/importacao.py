@@ -0,0 +1,128 @@
+"""
+Leitura da planilha (CSV) em blocos, com memória limitada.
+
+O CSV é lido em blocos de `TAMANHO_BLOCO_IMPORTACAO` linhas e cada bloco é
+convertido para as colunas tipadas de `beneficiarios` com operações
+vetorizadas do pandas (espaços, CPF só com dígitos, prefixo do código,
+datas). Os conversores de `app.migracoes` só são chamados, valor a valor,
+para o que não dá para vetorizar (coordenadas em graus/minutos/segundos,
+valores em reais) e para as datas fora do formato DD/MM/AAAA. Município,
+comunidade, técnico e status são padronizados (`app.normalizacao`) uma vez
+por valor distinto do bloco. O resultado é o mesmo de
+`migracoes.converter_registro` seguido de
+`normalizacao.padronizar_registro`, linha a linha.
+"""
+
+import os
+import re
+from typing import Any, Dict, Iterator, List, Optional
+
+import pandas as pd
+
+from app.migracoes import (
+    COLUNAS_TIPADAS, converter_coordenada, converter_data, converter_moeda
+)
+from app.normalizacao import FUNCOES_POR_COLUNA
+
+TAMANHO_BLOCO_IMPORTACAO = int(os.getenv("TAMANHO_BLOCO_IMPORTACAO", "5000"))
+
+# Cabeçalho da planilha -> coluna de `beneficiarios`.
+MAPEAMENTO_COLUNAS = {
+    'Código': 'codigo', 'Nome Técnico': 'nome_tecnico',
+    'CPF Técnico': 'cpf_tecnico', 'Município': 'municipio',
+    'Comunidade': 'comunidade', 'Latitude': 'latitude',
+    'Longitude': 'longitude', 'Data Atividade': 'data_atividade',
+    'Nome Familiar': 'nome_familiar', 'CPF Familiar': 'cpf_familiar',
+    'NIS': 'nis', 'Renda Média': 'renda_media', 'Status': 'status',
+    'Técnico Água que Alimenta': 'tecnico_agua_que_alimenta',
+    'Doc. Status': 'doc_status', 'GRH': 'grh',
+    'Verificado no BSF?': 'verificado_bsf'
+}
+
+COLUNAS_CPF = ("cpf_tecnico", "cpf_familiar")
+# Colunas convertidas valor a valor (não vetorizáveis).
+CONVERSORES_POR_VALOR = {
+    "latitude": converter_coordenada,
+    "longitude": converter_coordenada,
+    "renda_media": converter_moeda,
+}
+
+
+def _sem_vazios(serie: pd.Series) -> pd.Series:
+    """Texto vazio vira None (como em `migracoes.converter_texto`)."""
+    return serie.where(serie != "", None)
+
+
+def _converter_datas(serie: pd.Series) -> pd.Series:
+    """DD/MM/AAAA vetorizado; os demais formatos via `converter_data`."""
+    datas = pd.to_datetime(serie, format="%d/%m/%Y", errors="coerce")
+    convertidas = datas.dt.strftime("%Y-%m-%d").astype(object)
+    pendentes = datas.isna() & serie.notna()
+    convertidas[pendentes] = serie[pendentes].map(converter_data)
+    return convertidas.where(convertidas.notna(), None)
+
+
+def _padronizar(serie: pd.Series, coluna: str) -> pd.Series:
+    """Aplica a padronização da coluna uma vez por valor distinto."""
+    funcao = FUNCOES_POR_COLUNA[coluna][1]
+    mapa = {valor: funcao(valor) for valor in serie.dropna().unique()}
+    padronizada = serie.map(mapa, na_action="ignore").astype(object)
+    return padronizada.where(padronizada.notna(), None)
+
+
+def converter_bloco(
+    bloco: pd.DataFrame,
+    descartes: Optional[Dict[str, int]] = None
+) -> List[Dict[str, Any]]:
+    """Converte e padroniza um bloco da planilha (já com as colunas
+    renomeadas e lido como texto) em registros prontos para
+    `sincronizacao.sincronizar`.
+
+    Valores preenchidos que não puderam ser convertidos viram None e são
+    contados em `descartes`, como em `migracoes.converter_registro`.
+    """
+    convertido = pd.DataFrame(index=bloco.index)
+    for coluna in COLUNAS_TIPADAS:
+        if coluna not in bloco:
+            convertido[coluna] = None
+            continue
+        original = _sem_vazios(bloco[coluna].astype(object).str.strip())
+        if coluna == "codigo":
+            valores = _sem_vazios(original.str.replace(
+                r"^c[oó]digo\s*:?\s*", "", regex=True, flags=re.IGNORECASE
+            ))
+        elif coluna in COLUNAS_CPF:
+            valores = _sem_vazios(original.str.replace(r"\D", "", regex=True))
+        elif coluna == "data_atividade":
+            valores = _converter_datas(original)
+        elif coluna in CONVERSORES_POR_VALOR:
+            valores = original.map(
+                CONVERSORES_POR_VALOR[coluna], na_action="ignore"
+            ).astype(object)
+            valores = valores.where(valores.notna(), None)
+        elif coluna in FUNCOES_POR_COLUNA:
+            valores = _padronizar(original, coluna)
+        else:
+            valores = original
+        if descartes is not None:
+            perdidos = int((original.notna() & valores.isna()).sum())
+            if perdidos:
+                descartes[coluna] = descartes.get(coluna, 0) + perdidos
+        convertido[coluna] = valores.astype(object)
+    return convertido.to_dict("records")
+
+
+def ler_planilha(
+    origem: str,
+    tamanho_bloco: int = TAMANHO_BLOCO_IMPORTACAO,
+    descartes: Optional[Dict[str, int]] = None
+) -> Iterator[List[Dict[str, Any]]]:
+    """Lê o CSV (caminho ou URL) em blocos e gera os registros convertidos
+    de cada bloco. Só um bloco fica em memória por vez."""
+    leitor = pd.read_csv(
+        origem, dtype=str, keep_default_na=False, chunksize=tamanho_bloco
+    )
+    with leitor:
+        for bloco in leitor:
+            bloco = bloco.rename(columns=MAPEAMENTO_COLUNAS)
+            yield converter_bloco(bloco, descartes)
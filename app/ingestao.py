@@ -0,0 +1,337 @@
+"""
+Recebimento dos arquivos enviados ao `/upload`.
+
+O corpo multipart é lido direto de `request.stream()` com o parser em
+streaming do `python-multipart`, sem passar pelo parser do Starlette (que
+grava o corpo inteiro em arquivos temporários antes de o endpoint rodar).
+Para cada arquivo da requisição:
+
+- a extensão é conferida assim que os cabeçalhos da parte chegam;
+- os primeiros bytes (`TAMANHO_AMOSTRA_TIPO`) são conferidos antes de criar
+  o arquivo de destino: a assinatura (magic bytes) precisa ser de PDF, JPEG
+  ou PNG e combinar com a extensão;
+- o conteúdo vai direto para a pasta do lote, com escritas fora do loop de
+  eventos, e o SHA-256 é calculado na mesma passada (o cache de OCR não
+  precisa reler o arquivo);
+- os limites por arquivo (`UPLOAD_MAX_BYTES_ARQUIVO`) e por requisição
+  (`UPLOAD_MAX_BYTES_REQUISICAO`) são verificados a cada bloco recebido.
+
+Um arquivo recusado interrompe a leitura do corpo: o restante nunca chega
+ao disco, e o arquivo parcial é apagado.
+"""
+
+import os
+import asyncio
+import hashlib
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import Request
+from python_multipart.multipart import MultipartParser, parse_options_header
+from python_multipart.exceptions import FormParserError
+from starlette.requests import ClientDisconnect
+
+UPLOAD_MAX_BYTES_ARQUIVO = int(
+    os.getenv("UPLOAD_MAX_BYTES_ARQUIVO", str(25 * 1024 * 1024))
+)
+UPLOAD_MAX_BYTES_REQUISICAO = int(
+    os.getenv("UPLOAD_MAX_BYTES_REQUISICAO", str(100 * 1024 * 1024))
+)
+
+TIPO_PDF = "pdf"
+TIPO_JPEG = "jpeg"
+TIPO_PNG = "png"
+
+# Tipo esperado para cada extensão aceita
+TIPOS_POR_EXTENSAO = {
+    ".pdf": TIPO_PDF,
+    ".jpg": TIPO_JPEG,
+    ".jpeg": TIPO_JPEG,
+    ".png": TIPO_PNG,
+}
+# Folga do limite da requisição para os cabeçalhos multipart das partes.
+FOLGA_MULTIPART = 64 * 1024
+# O cabeçalho "%PDF-" pode vir depois de alguns bytes de lixo.
+JANELA_CABECALHO_PDF = 1024
+# Bytes acumulados de cada arquivo antes de identificar o tipo.
+TAMANHO_AMOSTRA_TIPO = JANELA_CABECALHO_PDF
+# Campos comuns (sem arquivo) não são usados; só se aceita um pouco deles.
+MAX_BYTES_CAMPO = 1024
+
+
+class UploadRecusadoError(Exception):
+    """Upload recusado no recebimento (tipo inválido, grande demais ou
+    corpo malformado)."""
+
+    def __init__(self, mensagem: str, status_code: int = 400):
+        super().__init__(mensagem)
+        self.status_code = status_code
+
+
+def _mb(quantidade: int) -> str:
+    """Bytes em MB, para mensagens."""
+    return f"{quantidade / (1024 * 1024):.0f} MB"
+
+
+def identificar_tipo(inicio: bytes) -> Optional[str]:
+    """Tipo do arquivo pelos primeiros bytes, ou None se não for aceito."""
+    if inicio.startswith(b"\xff\xd8\xff"):
+        return TIPO_JPEG
+    if inicio.startswith(b"\x89PNG\r\n\x1a\n"):
+        return TIPO_PNG
+    if b"%PDF-" in inicio[:JANELA_CABECALHO_PDF]:
+        return TIPO_PDF
+    return None
+
+
+def tipo_esperado(nome_arquivo: str) -> Optional[str]:
+    """Tipo correspondente à extensão do nome, ou None se não for aceita."""
+    return TIPOS_POR_EXTENSAO.get(os.path.splitext(nome_arquivo)[1].lower())
+
+
+def _remover_parcial(caminho: str):
+    """Apaga o arquivo de um recebimento interrompido."""
+    try:
+        os.remove(caminho)
+    except FileNotFoundError:
+        pass
+
+
+def excede_limite_declarado(
+    request: Request, max_bytes: int = UPLOAD_MAX_BYTES_REQUISICAO
+) -> bool:
+    """True se o Content-Length já passa do limite da requisição (o upload
+    pode ser recusado sem ler o corpo)."""
+    declarado = request.headers.get("content-length", "")
+    return declarado.isdigit() and int(declarado) > max_bytes + FOLGA_MULTIPART
+
+
+def mensagem_limite_requisicao() -> str:
+    """Mensagem do 413 por limite da requisição."""
+    return (
+        "Os arquivos enviados passam do limite de "
+        f"{_mb(UPLOAD_MAX_BYTES_REQUISICAO)} por envio."
+    )
+
+
+class _ArquivoEmRecebimento:
+    """Estado de uma parte com arquivo enquanto o corpo é lido."""
+
+    def __init__(self, nome: str, esperado: str):
+        self.nome = nome
+        self.esperado = esperado
+        self.amostra = bytearray()  # bytes antes de identificar o tipo
+        self.tipo: Optional[str] = None
+        self.caminho: Optional[str] = None
+        self.arquivo: Any = None
+        self.sha = hashlib.sha256()
+        self.total = 0
+
+
+class RecebimentoUpload:
+    """Lê o corpo multipart de uma requisição em streaming e grava cada
+    arquivo aceito em `destino(nome_original)`.
+
+    `receber` retorna, por arquivo, `{"nome", "caminho", "bytes", "sha256",
+    "tipo"}`, ou levanta UploadRecusadoError sem deixar arquivo parcial (os
+    arquivos já concluídos ficam com quem chamou, que apaga a pasta do
+    lote).
+    """
+
+    def __init__(
+        self,
+        request: Request,
+        destino: Callable[[str], str],
+        limite_arquivo: int = UPLOAD_MAX_BYTES_ARQUIVO,
+        limite_requisicao: int = UPLOAD_MAX_BYTES_REQUISICAO
+    ):
+        self.request = request
+        self.destino = destino
+        self.limite_arquivo = limite_arquivo
+        self.limite_requisicao = limite_requisicao
+        self.recebidos: List[Dict[str, Any]] = []
+        self._bytes_arquivos = 0
+        # Eventos do parser (síncrono), tratados com await após cada bloco
+        self._eventos: List[Tuple[str, Any]] = []
+        self._cabecalhos: Dict[bytes, bytes] = {}
+        self._campo_atual = b""
+        self._valor_atual = b""
+        self._bytes_campo = 0
+        self._atual: Optional[_ArquivoEmRecebimento] = None
+        self._terminado = False
+
+    # --- Callbacks do MultipartParser ---
+
+    def _inicio_parte(self):
+        self._cabecalhos = {}
+
+    def _campo_cabecalho(self, dados: bytes, inicio: int, fim: int):
+        self._campo_atual += dados[inicio:fim]
+
+    def _valor_cabecalho(self, dados: bytes, inicio: int, fim: int):
+        self._valor_atual += dados[inicio:fim]
+
+    def _fim_cabecalho(self):
+        self._cabecalhos[self._campo_atual.lower()] = self._valor_atual
+        self._campo_atual = b""
+        self._valor_atual = b""
+
+    def _fim_cabecalhos(self):
+        _, opcoes = parse_options_header(
+            self._cabecalhos.get(b"content-disposition", b"")
+        )
+        nome = opcoes.get(b"filename")
+        self._eventos.append((
+            "inicio",
+            nome.decode("utf-8", "replace") if nome is not None else None
+        ))
+
+    def _dados_parte(self, dados: bytes, inicio: int, fim: int):
+        self._eventos.append(("dados", dados[inicio:fim]))
+
+    def _fim_parte(self):
+        self._eventos.append(("fim", None))
+
+    def _fim_corpo(self):
+        self._terminado = True
+
+    # --- Tratamento assíncrono dos eventos ---
+
+    async def _iniciar_arquivo(self, nome: Optional[str]):
+        if nome is None:
+            self._atual = None  # campo comum
+            self._bytes_campo = 0
+            return
+        esperado = tipo_esperado(nome)
+        if esperado is None:
+            raise UploadRecusadoError(
+                f"Formato inválido para '{nome}'. "
+                "Apenas PDF, JPG, JPEG, PNG são permitidos."
+            )
+        self._atual = _ArquivoEmRecebimento(nome, esperado)
+
+    async def _abrir_destino(self, atual: _ArquivoEmRecebimento):
+        """Confere o tipo pela amostra e só então cria o arquivo."""
+        atual.tipo = identificar_tipo(bytes(atual.amostra))
+        if atual.tipo != atual.esperado:
+            raise UploadRecusadoError(
+                f"O conteúdo de '{atual.nome}' não é um "
+                f"{atual.esperado.upper()} válido."
+            )
+        atual.caminho = await asyncio.to_thread(self.destino, atual.nome)
+        atual.arquivo = await asyncio.to_thread(open, atual.caminho, "wb")
+        await self._gravar(atual, bytes(atual.amostra))
+        atual.amostra = bytearray()
+
+    async def _gravar(self, atual: _ArquivoEmRecebimento, bloco: bytes):
+        atual.sha.update(bloco)
+        await asyncio.to_thread(atual.arquivo.write, bloco)
+
+    async def _dados(self, bloco: bytes):
+        atual = self._atual
+        if atual is None:
+            self._bytes_campo += len(bloco)
+            if self._bytes_campo > MAX_BYTES_CAMPO:
+                raise UploadRecusadoError("Campo de formulário inesperado.")
+            return
+        atual.total += len(bloco)
+        self._bytes_arquivos += len(bloco)
+        if atual.total > self.limite_arquivo:
+            raise UploadRecusadoError(
+                f"'{atual.nome}' passa do limite de "
+                f"{_mb(self.limite_arquivo)} por arquivo.", 413
+            )
+        if self._bytes_arquivos > self.limite_requisicao:
+            raise UploadRecusadoError(mensagem_limite_requisicao(), 413)
+        if atual.arquivo is None:
+            atual.amostra.extend(bloco)
+            if len(atual.amostra) >= TAMANHO_AMOSTRA_TIPO:
+                await self._abrir_destino(atual)
+        else:
+            await self._gravar(atual, bloco)
+
+    async def _concluir_arquivo(self):
+        atual = self._atual
+        self._atual = None
+        if atual is None:
+            return
+        if atual.arquivo is None:
+            # Arquivo menor que a amostra (ou vazio)
+            await self._abrir_destino(atual)
+        await asyncio.to_thread(atual.arquivo.close)
+        logging.info(
+            "Arquivo '%s' recebido: %d bytes, %s, sha256 %s.",
+            atual.nome, atual.total, atual.tipo, atual.sha.hexdigest()[:12]
+        )
+        self.recebidos.append({
+            "nome": atual.nome,
+            "caminho": atual.caminho,
+            "bytes": atual.total,
+            "sha256": atual.sha.hexdigest(),
+            "tipo": atual.tipo,
+        })
+
+    async def _tratar_eventos(self):
+        eventos, self._eventos = self._eventos, []
+        for evento, valor in eventos:
+            if evento == "inicio":
+                await self._iniciar_arquivo(valor)
+            elif evento == "dados":
+                await self._dados(valor)
+            else:
+                await self._concluir_arquivo()
+
+    async def _descartar_parcial(self):
+        """Fecha e apaga o arquivo interrompido, se houver."""
+        atual = self._atual
+        self._atual = None
+        if atual is not None and atual.arquivo is not None:
+            await asyncio.to_thread(atual.arquivo.close)
+            await asyncio.to_thread(_remover_parcial, atual.caminho)
+
+    async def receber(self) -> List[Dict[str, Any]]:
+        """Lê o corpo inteiro (ou até a primeira recusa)."""
+        _, parametros = parse_options_header(
+            self.request.headers.get("content-type", "")
+        )
+        fronteira = parametros.get(b"boundary")
+        if not fronteira:
+            raise UploadRecusadoError(
+                "Envie os arquivos como multipart/form-data."
+            )
+        parser = MultipartParser(fronteira, {
+            "on_part_begin": self._inicio_parte,
+            "on_header_field": self._campo_cabecalho,
+            "on_header_value": self._valor_cabecalho,
+            "on_header_end": self._fim_cabecalho,
+            "on_headers_finished": self._fim_cabecalhos,
+            "on_part_data": self._dados_parte,
+            "on_part_end": self._fim_parte,
+            "on_end": self._fim_corpo,
+        })
+        limite_corpo = self.limite_requisicao + FOLGA_MULTIPART
+        lidos = 0
+        try:
+            async for bloco in self.request.stream():
+                lidos += len(bloco)
+                if lidos > limite_corpo:
+                    raise UploadRecusadoError(
+                        mensagem_limite_requisicao(), 413
+                    )
+                parser.write(bloco)
+                await self._tratar_eventos()
+            parser.finalize()
+            await self._tratar_eventos()
+            if not self._terminado:
+                raise UploadRecusadoError(
+                    "Corpo do upload incompleto (fronteira final ausente)."
+                )
+        except (FormParserError, ClientDisconnect) as e:
+            await self._descartar_parcial()
+            raise UploadRecusadoError(
+                f"Corpo do upload inválido ou incompleto: {e}"
+            ) from e
+        except BaseException:
+            await self._descartar_parcial()
+            raise
+        return self.recebidos
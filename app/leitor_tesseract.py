@@ -0,0 +1,155 @@
+"""
+Leitor de Tesseract mantido aquecido dentro de cada worker do motor de OCR.
+
+Quando o binding nativo `tesserocr` está instalado, cada processo (ou thread)
+do motor guarda um handle `PyTessBaseAPI` já inicializado com o idioma
+`por`, evitando abrir um processo `tesseract` e recarregar o traineddata a
+cada campo. Sem o binding, as leituras caem no caminho do `pytesseract`.
+As latências de cada chamada ficam registradas, por thread, para as
+métricas do motor: com `OCR_MODO=threads`, documentos simultâneos no mesmo
+processo não misturam as latências.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pytesseract
+from PIL import Image
+
+try:
+    import tesserocr  # type: ignore
+except ImportError:  # Binding nativo é opcional
+    tesserocr = None
+
+IDIOMA_OCR = "por"
+OEM_PADRAO = 3
+PSM_PADRAO = 7  # PSM 7: Tratar como linha única
+# Permite forçar o caminho do pytesseract mesmo com tesserocr instalado.
+OCR_NATIVO = os.getenv("OCR_NATIVO", "1") == "1"
+
+# Um handle por thread: PyTessBaseAPI não é thread-safe. As latências (ms)
+# das leituras também ficam por thread (`_local.latencias_ms`), drenadas
+# por documento.
+_local = threading.local()
+MAX_LATENCIAS_POR_THREAD = 1000
+
+
+class LeitorTesseract:
+    """Handle nativo do Tesseract com o modelo do idioma já carregado."""
+
+    def __init__(self, idioma: str = IDIOMA_OCR):
+        """Inicializa a API do Tesseract (carrega o traineddata)."""
+        self._api = tesserocr.PyTessBaseAPI(
+            lang=idioma, oem=OEM_PADRAO, psm=PSM_PADRAO
+        )
+        self.chamadas = 0
+
+    def ler(self, imagem: np.ndarray, psm: int = PSM_PADRAO) -> str:
+        """Reconhece o texto de uma imagem com o PSM pedido."""
+        self._api.SetPageSegMode(psm)
+        self._api.SetImage(Image.fromarray(imagem))
+        texto = self._api.GetUTF8Text()
+        self.chamadas += 1
+        return texto
+
+    def encerrar(self):
+        """Libera a memória do handle."""
+        self._api.End()
+
+
+def obter_leitor() -> Optional[LeitorTesseract]:
+    """Retorna o leitor nativo desta thread, criando-o se necessário.
+
+    Retorna None quando o binding não está disponível ou não inicializa.
+    """
+    if tesserocr is None or not OCR_NATIVO:
+        return None
+    leitor = getattr(_local, "leitor", None)
+    if leitor is None:
+        try:
+            leitor = LeitorTesseract()
+        except RuntimeError as e:
+            logging.error("Falha ao iniciar o Tesseract nativo: %s", e)
+            return None
+        _local.leitor = leitor
+        logging.info(
+            "Tesseract nativo aquecido (pid %d, idioma '%s').",
+            os.getpid(), IDIOMA_OCR
+        )
+    return leitor
+
+
+def reiniciar_leitor():
+    """Descarta o leitor desta thread; o próximo uso cria um novo."""
+    leitor = getattr(_local, "leitor", None)
+    _local.leitor = None
+    if leitor is not None:
+        try:
+            leitor.encerrar()
+        except RuntimeError:
+            pass
+
+
+def _latencias_da_thread() -> deque:
+    """Latências registradas pela thread atual."""
+    latencias = getattr(_local, "latencias_ms", None)
+    if latencias is None:
+        latencias = deque(maxlen=MAX_LATENCIAS_POR_THREAD)
+        _local.latencias_ms = latencias
+    return latencias
+
+
+def registrar_latencia(inicio: float):
+    """Registra a latência de uma chamada iniciada em `inicio`."""
+    _latencias_da_thread().append((time.perf_counter() - inicio) * 1000)
+
+
+def ler_texto(imagem: np.ndarray, psm: int = PSM_PADRAO) -> str:
+    """Lê o texto de uma ROI pelo handle nativo ou, sem ele, pelo
+    pytesseract. Um handle que falhar é recriado uma vez antes do
+    fallback."""
+    inicio = time.perf_counter()
+    try:
+        for _ in range(2):
+            leitor = obter_leitor()
+            if leitor is None:
+                break
+            try:
+                return leitor.ler(imagem, psm)
+            except RuntimeError as e:
+                logging.error(
+                    "Tesseract nativo falhou (pid %d): %s. Reiniciando.",
+                    os.getpid(), e
+                )
+                reiniciar_leitor()
+
+        return pytesseract.image_to_string(
+            imagem,
+            lang=IDIOMA_OCR,
+            config=f'--oem {OEM_PADRAO} --psm {psm}'
+        )
+    finally:
+        registrar_latencia(inicio)
+
+
+def coletar_latencias() -> List[float]:
+    """Devolve e limpa as latências registradas pela thread atual."""
+    latencias = _latencias_da_thread()
+    coletadas = list(latencias)
+    latencias.clear()
+    return coletadas
+
+
+def aquecer() -> Dict[str, Any]:
+    """Garante o leitor pronto e retorna o estado do worker (health-check)."""
+    leitor = obter_leitor()
+    return {
+        "pid": os.getpid(),
+        "nativo": leitor is not None,
+        "chamadas": leitor.chamadas if leitor else 0,
+    }
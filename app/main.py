@@ -5,38 +5,76 @@ histórico de usuários e prepara a integração com Selenium e Google Sheets.
 """
 
 import os
-import shutil
 import uuid
 import json
 import datetime
 import asyncio
 import logging
 import re
+import time
 import sqlite3
-from typing import List, Dict, Any
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, Optional
 
 import pytesseract  # Importado aqui para configurar tesseract_cmd
-from pdf2image import convert_from_path  # type: ignore
-from PIL import Image
 from pathlib import Path
 
-
-# Imports para OpenCV
-import cv2
-import numpy as np
-
 from fastapi import (
     FastAPI,
-    UploadFile,
     WebSocket,
     WebSocketDisconnect,
     Request,
-    File,
+    Query,
+    Body,
+)
+from fastapi.responses import (
+    HTMLResponse,
+    JSONResponse,
+    FileResponse,
+    StreamingResponse,
 )
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
+from app.motor_ocr import MotorOCR
+from app.cache_ocr import CacheOCR, calcular_sha256
+from app.pipeline_ocr import (
+    PADRAO_PASTA_NORMALIZADA,
+    PAGINAS_NORMALIZADAS_DIAS,
+    PAGINAS_NORMALIZADAS_FOLDER,
+    PAGINAS_NORMALIZADAS_MAX_BYTES,
+    assinatura_pipeline,
+    normalizar_definicoes_rois,
+)
+from app.fila_jobs import (
+    FilaJobs,
+    FilaCheiaError,
+    RESULTADO_ERRO,
+    RESULTADO_INCOMPLETO,
+    RESULTADO_SUCESSO,
+)
+from app.eventos import (
+    BarramentoEventos, TIPO_CONCLUIDO, TIPO_ERRO, TIPO_STATUS
+)
+from app.notificacoes import GerenciadorConexoes
+from app.retencao import GerenciadorRetencao
+from app.ingestao import (
+    RecebimentoUpload,
+    UploadRecusadoError,
+    excede_limite_declarado,
+    mensagem_limite_requisicao,
+)
+from app import historico
+from app import beneficiarios
+from app import consolidado
+from app import depuracao
+from app import mapa
+from app import respostas
+from app import versoes
+from app.banco import banco
+from app.migracoes import aplicar_migracoes
+from app.respostas import RespostaJSON
+
 # --- Configuração de Logging ---
 logging.basicConfig(
     level=logging.INFO,
@@ -44,11 +82,47 @@ logging.basicConfig(
 )
 
 # --- Configuração do FastAPI ---
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """Inicia e encerra os recursos de longa duração da aplicação."""
+    await banco.executar(aplicar_migracoes)
+    await banco.executar(historico.inicializar_historico)
+    await banco.executar(beneficiarios.criar_indices)
+    await banco.executar(beneficiarios.preparar_busca)
+    await banco.executar(mapa.preparar_mapa)
+    await banco.executar(versoes.preparar_versoes)
+    await banco.executar(consolidado.preparar_consolidado)
+    # Retenção dos artefatos de depuração de execuções anteriores
+    await asyncio.to_thread(depuracao.gravador.limpar)
+    barramento.iniciar()
+    motor_ocr.iniciar()
+    monitor_ocr = asyncio.create_task(motor_ocr.monitorar())
+    varreduras = [
+        asyncio.create_task(retencao.monitorar())
+        for retencao in (retencao_uploads, retencao_prints,
+                         retencao_paginas)
+    ]
+    await fila_jobs.iniciar()
+    yield
+    await fila_jobs.encerrar()
+    await barramento.encerrar()
+    monitor_ocr.cancel()
+    for varredura in varreduras:
+        varredura.cancel()
+    await asyncio.to_thread(motor_ocr.encerrar)
+    cache_ocr.fechar()
+    await asyncio.to_thread(banco.fechar)
+
 app = FastAPI(
     title="Água que Alimenta API",
     description="API para processamento de documentos de beneficiários.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=RespostaJSON
 )
+respostas.configurar_compressao(app)
 
 os.makedirs("static", exist_ok=True)
 os.makedirs("templates", exist_ok=True)
@@ -69,7 +143,6 @@ templates = Jinja2Templates(directory=BASE_DIR / "templates")
 # --- Constantes e Configurações do Projeto ---
 UPLOAD_FOLDER = "uploads"
 PRINT_FOLDER = "prints_erros"
-HISTORICO_PATH = "historico.json"
 
 
 # ==============================================================================
@@ -89,127 +162,33 @@ FAVICON_PATH = os.path.join("static", "favicon.ico")
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(PRINT_FOLDER, exist_ok=True)
 
-if not os.path.exists(HISTORICO_PATH):
-    with open(HISTORICO_PATH, 'w', encoding='utf-8') as f:
-        json.dump([], f, ensure_ascii=False, indent=4)
-
-# ==============================================================================
-# Informações sobre as Coordenadas das Páginas
-# ==============================================================================
-LARGURA_PADRAO = 1000
-
-# Definições de ROI para a Página 1
-# Estas coordenadas são baseadas na imagem após redimensionamento para
-# LARGURA_PADRAO e, idealmente, após correção de perspectiva.
-# As coordenadas x, y dos campos individuais são, por agora, relativas
-# ao RETANGULO_PRINCIPAL (ou à imagem inteira corrigida se o retângulo
-# principal for x=0, y=0, w=LARGURA_PADRAO, h=altura_dinamica).
-
-# Coordenadas (X, Y, W, H) do retângulo principal de dados na Página 1.
-# PROVISÓRIO: Ajustar APÓS a Etapa 2 (Correção de Perspectiva).
-# Se (x=0, y=0, w=LARGURA_PADRAO, h=altura_dinamica_da_pagina),
-# significa que usaremos a página inteira como área principal inicialmente.
-# 'h' para RETANGULO_PRINCIPAL pode ser atualizado dinamicamente com base
-# na altura da imagem redimensionada, ou você pode definir um valor fixo
-# se o conteúdo principal tiver uma altura fixa e conhecida após correção.
-RETANGULO_PRINCIPAL_PAG1_COORDS = {
-    "x": 2, "y": 2, "w": 962, "h": 1017
-}
-
-ROI_DEFINICOES_PAGINA1 = {
-    "nome_completo_l1": {
-        "x": 190, "y": 52, "w": 760, "h": 39, "tipo": "texto"
-    },
-    "nome_completo_l2": {
-        "x": 13, "y": 84, "w": 502, "h": 39, "tipo": "texto",
-        "condicional": True
-    },
-    "sexo_cb_masc": {
-        # Aguardando as novas coordenadas (x, y) do checkbox "Masc."
-        "x": 0, "y": 0, "w": 22, "h": 22, "tipo": "checkbox",
-        "campo_destino": "sexo", "valor_marcado": "Masculino"
-    },
-    "sexo_cb_fem": {
-        # Aguardando as novas coordenadas (x, y) do checkbox "Fem."
-        "x": 0, "y": 0, "w": 22, "h": 22, "tipo": "checkbox",
-        "campo_destino": "sexo", "valor_marcado": "Feminino"
-    }
-    # Adicionaremos mais campos aqui conforme progredimos
-}
-
-# Estrutura para agrupar todas as definições de ROI por página
-TODAS_ROIS_POR_PAGINA = {
-    1: {  # Para a página 1
-        "retangulo_principal": RETANGULO_PRINCIPAL_PAG1_COORDS,
-        "campos": ROI_DEFINICOES_PAGINA1
-    },
-    # 2: { # Para a página 2, quando definirmos
-    #     "retangulo_principal": RETANGULO_PRINCIPAL_PAG2_COORDS,
-    #     "campos": ROI_DEFINICOES_PAGINA2
-    # },
-}
-# --- Gerenciamento de Conexões WebSocket ---
-
-
-class ConnectionManager:
-    """Gerencia as conexões WebSocket ativas para comunicação em tempo real
-    com os clientes."""
-
-    def __init__(self):
-        """Inicializa a lista de conexões ativas."""
-        self.active_connections: List[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        """Aceita uma nova conexão WebSocket e a adiciona à lista de conexões
-        ativas."""
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        logging.info("Nova conexão WebSocket estabelecida.")
-
-    def disconnect(self, websocket: WebSocket):
-        """Remove uma conexão WebSocket da lista de conexões ativas."""
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-            logging.info("Conexão WebSocket fechada.")
-
-    async def send_message(self, message: str, beneficiario_id: str = None):
-        """Envia uma mensagem para todas as conexões WebSocket ativas,
-        opcionalmente identificando o beneficiário."""
-        log_msg_prefix = "WS Enviando"
-        if beneficiario_id:
-            message_to_send = f"[{beneficiario_id}] {message}"
-            log_msg_prefix += f" para Beneficiário ID [{beneficiario_id}]"
-        else:
-            message_to_send = message
-
-        logging.info("%s: %s", log_msg_prefix, message)
+# Pastas por data/lote e retenção dos uploads e prints de erro
+retencao_uploads = GerenciadorRetencao(UPLOAD_FOLDER)
+retencao_prints = GerenciadorRetencao(PRINT_FOLDER)
+# Páginas normalizadas (por SHA-256 do documento), só por idade e espaço
+retencao_paginas = GerenciadorRetencao(
+    PAGINAS_NORMALIZADAS_FOLDER,
+    apagar_sucesso=False,
+    dias_falhas=PAGINAS_NORMALIZADAS_DIAS,
+    max_bytes=PAGINAS_NORMALIZADAS_MAX_BYTES,
+    padrao_entrada=PADRAO_PASTA_NORMALIZADA
+)
 
-        for connection in list(self.active_connections):
-            try:
-                await connection.send_text(message_to_send)
-            except RuntimeError as e_runtime:
-                logging.error(
-                    "Erro de runtime ao enviar msg WS para %s: %s",
-                    connection.client, e_runtime
-                )
-            except ConnectionError as e_conn:
-                logging.error(
-                    "Erro de conexão ao enviar msg WS para %s: %s",
-                    connection.client, e_conn
-                )
-            except OSError as e_os:
-                logging.error(
-                    "Erro de sistema ao enviar msg WS para %s: %s",
-                    connection.client, e_os
-                )
-            except Exception as e:  # pylint: disable=broad-except
-                logging.error(
-                    "Erro genérico inesperado ao enviar msg WS para %s: %s",
-                    connection.client, e
-                )
+# --- Motor de OCR (estágio de CPU em processos separados) ---
+motor_ocr = MotorOCR(
+    poppler_path=POPPLER_PATH,
+    tesseract_cmd=pytesseract.pytesseract.tesseract_cmd
+)
+# Cache de resultados por conteúdo do arquivo + assinatura das ROIs
+cache_ocr = CacheOCR(assinatura_pipeline())
 
+# --- Eventos de progresso via WebSocket ---
 
-manager = ConnectionManager()
+# O processamento publica no barramento sem esperar; o despachante do
+# barramento entrega aos WebSockets assinantes.
+barramento = BarramentoEventos()
+manager = GerenciadorConexoes(barramento.recentes)
+barramento.assinar(manager.publicar)
 
 # --- Rotas HTML ---
 
@@ -248,100 +227,199 @@ async def get_processar_pagina(request: Request):
 # --- Endpoint de API para os Dados ---
 
 
-@app.get("/api/beneficiarios", response_class=JSONResponse)
-def get_beneficiarios():
+@app.get("/api/beneficiarios", response_class=RespostaJSON)
+async def get_beneficiarios(
+    request: Request,
+    limite: Optional[int] = Query(
+        None, ge=1, le=beneficiarios.LIMITE_PAGINA_MAXIMO
+    ),
+    offset: int = Query(0, ge=0),
+    campos: Optional[str] = Query(
+        None, description="Lista de colunas separadas por vírgulas."
+    ),
+    ordenar: Optional[str] = Query(None),
+    direcao: str = Query("asc"),
+    municipio: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    tecnico: Optional[str] = Query(None),
+    data_inicio: Optional[str] = Query(None, description="AAAA-MM-DD"),
+    data_fim: Optional[str] = Query(None, description="AAAA-MM-DD"),
+    busca: Optional[str] = Query(None),
+    coluna_busca: Optional[str] = Query(None)
+):
     """
-    Busca todos os registros de beneficiários no banco de dados SQLite
-    e os retorna como uma lista de dicionários (JSON).
+    Busca os registros de beneficiários no banco de dados SQLite e os
+    retorna como uma lista de dicionários (JSON).
+
+    Sem parâmetros, devolve a tabela inteira (como antes). Com `limite` e
+    `offset` devolve uma página; o total de registros filtrados vem no
+    cabeçalho `X-Total-Count`. Responde 304 se a tabela não mudou desde o
+    ETag enviado pelo cliente.
     """
-    db_path = "agendha.db"
+    filtros = {
+        "municipio": municipio,
+        "status": status,
+        "tecnico": tecnico,
+        "data_inicio": data_inicio,
+        "data_fim": data_fim,
+        "busca": busca,
+        "coluna_busca": coluna_busca,
+    }
     try:
-        logging.info(
-            "API: Conectando ao banco de dados para buscar beneficiários...")
-        conexao = sqlite3.connect(db_path)
-        # O Row_factory faz com que o resultado venha como dicionários,
-        # o que é perfeito para converter para JSON.
-        conexao.row_factory = sqlite3.Row
-        cursor = conexao.cursor()
-
-        # Executa a consulta para pegar todos os dados da tabela
-        cursor.execute("SELECT * FROM beneficiarios")
-        registros = cursor.fetchall()
+        etag = respostas.etag(
+            "beneficiarios",
+            await banco.executar(versoes.versao, "beneficiarios"), request
+        )
+        if respostas.etag_confere(request, etag):
+            return respostas.nao_modificado(etag)
+        registros, total = await banco.executar(
+            beneficiarios.consultar,
+            filtros,
+            beneficiarios.validar_campos(campos),
+            ordenar,
+            direcao,
+            limite,
+            offset
+        )
+    except ValueError as e_valor:
+        return JSONResponse(status_code=400, content={"error": str(e_valor)})
+    except sqlite3.Error as e:
+        logging.error(f"API: Erro ao acessar o banco de dados: {e}")
+        # Retorna uma resposta de erro no formato JSON
+        return JSONResponse(
+            status_code=500,
+            content={"error": "Erro interno ao buscar os dados."}
+        )
+    logging.info(
+        "API: %d de %d registros enviados.", len(registros), total
+    )
+    return RespostaJSON(
+        content=registros,
+        headers={
+            "X-Total-Count": str(total), **respostas.cabecalhos_cache(etag)
+        }
+    )
 
-        # Converte a lista de registros do banco em uma lista de dicionários
-        # que pode ser enviada como JSON
-        lista_beneficiarios = [dict(registro) for registro in registros]
 
-        logging.info(
-            "API: %d registros encontrados e enviados.", len(
-                lista_beneficiarios)
+@app.get("/api/beneficiarios/search", response_class=RespostaJSON)
+async def buscar_beneficiarios(
+    request: Request,
+    q: str = Query(..., min_length=1),
+    limite: int = Query(
+        beneficiarios.LIMITE_BUSCA_PADRAO, ge=1,
+        le=beneficiarios.LIMITE_BUSCA_MAXIMO
+    ),
+    campos: Optional[str] = Query(None)
+):
+    """Busca textual (sem acentos, por prefixo) em nome, comunidade,
+    município, técnico, CPF e NIS, ordenada por relevância."""
+    try:
+        etag = respostas.etag(
+            "busca", await banco.executar(versoes.versao, "beneficiarios"),
+            request
+        )
+        if respostas.etag_confere(request, etag):
+            return respostas.nao_modificado(etag)
+        resultados = await banco.executar(
+            beneficiarios.buscar,
+            q, beneficiarios.validar_campos(campos), limite
+        )
+        return RespostaJSON(
+            content=resultados, headers=respostas.cabecalhos_cache(etag)
+        )
+    except ValueError as e_valor:
+        return JSONResponse(status_code=400, content={"error": str(e_valor)})
+    except sqlite3.Error as e:
+        logging.error(f"API: Erro na busca de beneficiários: {e}")
+        return JSONResponse(
+            status_code=500,
+            content={"error": "Erro interno ao buscar os dados."}
         )
-        return lista_beneficiarios
 
+
+@app.get("/api/mapa", response_class=RespostaJSON)
+async def get_mapa_dados(
+    request: Request,
+    bbox: Optional[str] = Query(
+        None, description="Área visível: 'oeste,sul,leste,norte'."
+    ),
+    zoom: int = Query(mapa.ZOOM_PONTOS, ge=0, le=mapa.ZOOM_MAXIMO),
+    status: Optional[str] = Query(
+        None, description="Status separados por vírgula."
+    )
+):
+    """GeoJSON dos beneficiários da área (id, status e coordenadas), com
+    os pontos agrupados no servidor em zoom baixo."""
+    try:
+        caixa = mapa.validar_caixa(bbox)
+        lista_status = [s.strip() for s in (status or "").split(",")
+                        if s.strip()]
+        etag = respostas.etag(
+            "mapa", await banco.executar(versoes.versao, "beneficiarios"),
+            request
+        )
+        if respostas.etag_confere(request, etag):
+            return respostas.nao_modificado(etag)
+        dados = await banco.executar(
+            mapa.consultar, caixa, zoom, lista_status
+        )
+        return RespostaJSON(
+            content=dados, headers=respostas.cabecalhos_cache(etag)
+        )
+    except ValueError as e_valor:
+        return JSONResponse(status_code=400, content={"error": str(e_valor)})
     except sqlite3.Error as e:
-        logging.error(f"API: Erro ao acessar o banco de dados: {e}")
-        # Retorna uma resposta de erro no formato JSON
+        logging.error(f"API: Erro ao ler os dados do mapa: {e}")
         return JSONResponse(
             status_code=500,
             content={"error": "Erro interno ao buscar os dados."}
         )
-    finally:
-        if 'conexao' in locals() and conexao:
-            conexao.close()
-            logging.info(
-                "API: %s registros encontrados e enviados.",
-                len(lista_beneficiarios)
-            )
 
 
-@app.get("/api/consolidado/atividades", response_class=JSONResponse)
-def get_consolidado_atividades():
+@app.get("/api/consolidado/atividades", response_class=RespostaJSON)
+async def get_consolidado_atividades(
+    request: Request,
+    municipio: Optional[str] = Query(None),
+    verificar: bool = Query(
+        False, description="Compara a tabela materializada com a consulta "
+        "ao vivo."
+    )
+):
     """
     Gera um resumo de atividades por município.
-    Assume que os dados de município já estão padronizados no banco.
+    Lê a tabela `consolidado_municipio`, mantida por triggers; o ETag é a
+    versão de `beneficiarios` (responde 304 se o cliente já a tiver).
     """
-    db_path = "agendha.db"
-    conexao = None
     try:
-        logging.info("API: Gerando dados consolidados (v3)...")
-        conexao = sqlite3.connect(db_path)
-        conexao.row_factory = sqlite3.Row
-        cursor = conexao.cursor()
-
-        # Consulta SQL agora muito mais simples!
-        query = """
-        SELECT
-            municipio,
-            COUNT(*) AS total_beneficiarios,
-            SUM(CASE WHEN status = 'EM CADASTRO' THEN 1 ELSE 0 END) AS em_cadastro,
-            SUM(CASE WHEN status = 'CADASTRADO' THEN 1 ELSE 0 END) AS cadastrado,
-            SUM(CASE WHEN status = 'A CONSTRUIR' THEN 1 ELSE 0 END) AS a_construir,
-            SUM(CASE WHEN status = 'CONSTRUÍDA' THEN 1 ELSE 0 END) AS construida,
-            SUM(CASE WHEN status NOT IN (
-                'EM CADASTRO', 'CADASTRADO', 'A CONSTRUIR', 'CONSTRUÍDA'
-                ) OR status IS NULL THEN 1 ELSE 0 END) AS outros_status
-        FROM
-            beneficiarios
-        WHERE
-            municipio IS NOT NULL AND municipio != ''
-        GROUP BY
-            municipio
-        ORDER BY
-            municipio;
-        """
-        cursor.execute(query)
-        registros = cursor.fetchall()
-        dados_consolidados = [dict(registro) for registro in registros]
-
-        logging.info("API: Dados consolidados (v3) gerados com sucesso.")
-        return dados_consolidados
+        if verificar:
+            divergencias = await banco.executar(consolidado.verificar)
+            if divergencias:
+                logging.error(
+                    "API: Consolidado divergente da consulta ao vivo em %d "
+                    "município(s).", len(divergencias)
+                )
+            return {
+                "consistente": not divergencias,
+                "divergencias": divergencias,
+            }
+
+        versao = await banco.executar(versoes.versao, "beneficiarios")
+        etag = respostas.etag("consolidado", versao, request)
+        if respostas.etag_confere(request, etag):
+            return respostas.nao_modificado(etag)
+        dados_consolidados, versao = await banco.executar(
+            consolidado.consultar, municipio
+        )
+        logging.info("API: Dados consolidados lidos (versão %s).", versao)
+        return RespostaJSON(
+            content=dados_consolidados,
+            headers=respostas.cabecalhos_cache(
+                respostas.etag("consolidado", versao, request)
+            )
+        )
     except sqlite3.Error as e:
-        logging.error(f"API: Erro ao gerar dados consolidados (v3): {e}")
+        logging.error(f"API: Erro ao gerar dados consolidados: {e}")
         return JSONResponse(status_code=500, content={"error": "Erro interno."})
-    finally:
-        if conexao:
-            conexao.close()
-            logging.info("API: Conexão do consolidado (v3) fechada.")
 
 
 # --- Endpoint para Favicon ---
@@ -364,304 +442,6 @@ async def favicon():
 
 # FUNÇÕES
 
-# -----------------------------------------------------------------------------
-# ETAPA 1: FUNÇÕES AUXILIARES PARA CARREGAMENTO E PRÉ-PROCESSAMENTO BÁSICO
-# -----------------------------------------------------------------------------
-
-# Converte imagem PIL para OpenCV (BGR) e redimensiona à largura alvo.
-
-
-def _converter_pil_para_cv_e_redimensionar(
-    imagem_pil: Image.Image, largura_alvo: int
-) -> np.ndarray:
-
-    # Converter PIL Image para OpenCV array (RGB)
-    img_cv_rgb = np.array(imagem_pil.convert('RGB'))
-    # Converter RGB para BGR (formato padrão do OpenCV)
-    img_cv_bgr = cv2.cvtColor(img_cv_rgb, cv2.COLOR_RGB2BGR)
-
-    altura_original, largura_original = img_cv_bgr.shape[:2]
-    if largura_original == 0:
-        logging.error("Largura original da imagem é 0. Imagem inválida.")
-        raise ValueError("Imagem com largura original zero.")
-
-    proporcao = largura_alvo / float(largura_original)
-    altura_alvo = int(altura_original * proporcao)
-
-    img_redimensionada = cv2.resize(
-        img_cv_bgr, (largura_alvo, altura_alvo),
-        interpolation=cv2.INTER_AREA  # Bom para reduzir, ok para aumentar
-    )
-    logging.info(
-        f"Imagem redimensionada de {largura_original}x{altura_original} "
-        f"para {largura_alvo}x{altura_alvo}"
-    )
-    return img_redimensionada
-
-
-# Endireita uma imagem de formulário que possa estar em perspectiva.
-def _corrigir_perspectiva(imagem_cv_bgr: np.ndarray) -> np.ndarray:
-    # Para o processamento, uma cópia da imagem é usada
-    imagem_processo = imagem_cv_bgr.copy()
-
-    # Converte para escala de cinza, aplica desfoque e detecta bordas
-    cinza = cv2.cvtColor(imagem_processo, cv2.COLOR_BGR2GRAY)
-    desfoque = cv2.GaussianBlur(cinza, (5, 5), 0)
-    bordas = cv2.Canny(desfoque, 75, 200)
-
-    # Encontra os contornos na imagem
-    contornos, _ = cv2.findContours(
-        bordas, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE
-    )
-    # Ordena os contornos por área, do maior para o menor
-    contornos = sorted(contornos, key=cv2.contourArea, reverse=True)[:5]
-
-    contorno_tela = None
-
-    # Itera sobre os maiores contornos para encontrar o formulário
-    for c in contornos:
-        # Aproxima o contorno para uma forma com menos vértices
-        perimetro = cv2.arcLength(c, True)
-        aprox = cv2.approxPolyDP(c, 0.02 * perimetro, True)
-
-        # Se a forma aproximada tiver 4 vértices, assumimos que é o formulário
-        if len(aprox) == 4:
-            contorno_tela = aprox
-            break
-
-    # Se nenhum contorno de 4 pontos foi encontrado, retorna a imagem original
-    if contorno_tela is None:
-        logging.warning("Não foi possível encontrar contorno de 4 pontos. "
-                        "A correção de perspectiva não será aplicada.")
-        return imagem_cv_bgr
-
-    # --- Ordena os 4 pontos do contorno para uma ordem consistente ---
-    pontos = contorno_tela.reshape(4, 2)
-    pontos_ret = np.zeros((4, 2), dtype="float32")
-
-    soma = pontos.sum(axis=1)
-    pontos_ret[0] = pontos[np.argmin(soma)]  # Canto superior esquerdo
-    pontos_ret[2] = pontos[np.argmax(soma)]  # Canto inferior direito
-
-    diff = np.diff(pontos, axis=1)
-    pontos_ret[1] = pontos[np.argmin(diff)]  # Canto superior direito
-    pontos_ret[3] = pontos[np.argmax(diff)]  # Canto inferior esquerdo
-    # --- Fim da ordenação ---
-
-    (sup_esq, sup_dir, inf_dir, inf_esq) = pontos_ret
-
-    # Calcula a largura da nova imagem "plana"
-    largura_a = np.sqrt(
-        ((inf_dir[0] - inf_esq[0]) ** 2) + ((inf_dir[1] - inf_esq[1]) ** 2))
-    largura_b = np.sqrt(
-        ((sup_dir[0] - sup_esq[0]) ** 2) + ((sup_dir[1] - sup_esq[1]) ** 2))
-    max_largura = max(int(largura_a), int(largura_b))
-
-    # Calcula a altura da nova imagem "plana"
-    altura_a = np.sqrt(
-        ((sup_dir[0] - inf_dir[0]) ** 2) + ((sup_dir[1] - inf_dir[1]) ** 2))
-    altura_b = np.sqrt(
-        ((sup_esq[0] - inf_esq[0]) ** 2) + ((sup_esq[1] - inf_esq[1]) ** 2))
-    max_altura = max(int(altura_a), int(altura_b))
-
-    # Define os pontos de destino para a transformação
-    dst = np.array([
-        [0, 0],
-        [max_largura - 1, 0],
-        [max_largura - 1, max_altura - 1],
-        [0, max_altura - 1]], dtype="float32")
-
-    # Calcula a matriz de transformação de perspectiva e a aplica
-    matriz_transformacao = cv2.getPerspectiveTransform(pontos_ret, dst)
-    imagem_corrigida = cv2.warpPerspective(
-        imagem_processo, matriz_transformacao, (max_largura, max_altura)
-    )
-
-    logging.info("Correção de perspectiva aplicada com sucesso.")
-    return imagem_corrigida
-
-# Aplica pré-processamento OpenCV (escala de cinza, binarização) em imagem
-# OpenCV (BGR) já redimensionada.
-
-
-async def _preprocessar_imagem_para_ocr(
-    img_cv_redimensionada: np.ndarray,
-    beneficiario_id: str,
-    pagina_num: int = 0
-) -> np.ndarray:
-
-    try:
-        logging.info(
-            "[%s] Iniciando pré-processamento OpenCV para página/imagem "
-            "(já redimensionada)...", beneficiario_id
-        )
-
-        img_cinza = cv2.cvtColor(img_cv_redimensionada, cv2.COLOR_BGR2GRAY)
-
-        img_cinza_desfocada = cv2.GaussianBlur(img_cinza, (3, 3), 0)
-
-        # Parâmetros de binarização que você está testando
-        blockSize = 15
-        C_val = 6
-
-        logging.info(
-            "[%s] Aplicando adaptiveThreshold: blockSize=%s, C=%s, "
-            "ADAPTIVE_THRESH_MEAN_C", beneficiario_id, blockSize, C_val
-        )
-
-        img_binarizada = cv2.adaptiveThreshold(
-            img_cinza_desfocada,
-            255,
-            cv2.ADAPTIVE_THRESH_MEAN_C,
-            cv2.THRESH_BINARY,
-            blockSize,
-            C_val
-        )
-
-        # Salvar imagem de depuração
-        try:
-            nome_base_debug = f"debug_opencv_b{blockSize}_C{C_val}_mean"
-            if pagina_num > 0:
-                nome_base_debug += f"_p{pagina_num}"
-
-            debug_filename = (
-                f"{nome_base_debug}_"
-                f"{beneficiario_id}_"
-                f"{uuid.uuid4().hex[:4]}.png"
-            )
-            debug_path = os.path.join(UPLOAD_FOLDER, debug_filename)
-            cv2.imwrite(debug_path, img_binarizada)
-
-            logging.info(
-                "[%s] Imagem OpenCV pré-processada salva em: %s",
-                beneficiario_id, debug_path
-            )
-            await manager.send_message(
-                f"Imagem de depuração OpenCV salva: {debug_filename}",
-                beneficiario_id
-            )
-        except Exception as e_save:  # pylint: disable=broad-except
-            logging.error(
-                "[%s] Erro ao salvar imagem OpenCV de depuração: %s",
-                beneficiario_id, e_save
-            )
-
-        logging.info(
-            "[%s] Pré-processamento OpenCV concluído.", beneficiario_id
-        )
-        return img_binarizada
-
-    except Exception as e_cv:  # pylint: disable=broad-except
-        logging.exception(
-            "[%s] Erro crítico durante o pré-processamento com OpenCV: %s."
-            " Retornando imagem original em escala de cinza (se possível).",
-            beneficiario_id, e_cv
-        )
-        try:
-            return cv2.cvtColor(img_cv_redimensionada, cv2.COLOR_BGR2GRAY)
-        except Exception as e_fallback:
-            logging.error(
-                "[%s] Erro ao converter para cinza no fallback: %s",
-                beneficiario_id, e_fallback
-            )
-            raise e_cv
-
-
-# -----------------------------------------------------------------------------
-# FUNÇÕES PRINCIPAIS DE ORQUESTRAÇÃO DO OCR E PROCESSAMENTO DE ARQUIVO
-# (Esta função será modificada ao longo de várias etapas)
-# -----------------------------------------------------------------------------
-
-async def _executar_ocr_para_arquivo(
-    file_path: str, original_filename: str, beneficiario_id: str
-) -> Dict[str, Any]:
-    """
-    Prepara uma imagem para extração por ROI. O processo inclui
-    redimensionamento, correção de perspectiva, recorte e pré-processamento.
-    Esta função RETORNA A IMAGEM PROCESSADA, não o texto.
-    """
-    await manager.send_message(
-        f"Preparando imagem do arquivo: {original_filename}...",
-        beneficiario_id
-    )
-    logging.info(
-        "[%s] Iniciando preparação de imagem para: %s",
-        beneficiario_id, file_path
-    )
-
-    try:
-        imagem_pil = None
-        pagina_num = 1  # Assume página 1 para imagens e para o primeiro do PDF
-
-        if file_path.lower().endswith('.pdf'):
-            # Lógica para converter a primeira página do PDF em imagem PIL
-            imagens_pil_pdf = await asyncio.to_thread(
-                convert_from_path,
-                file_path, poppler_path=POPPLER_PATH, dpi=300
-            )
-            if imagens_pil_pdf:
-                imagem_pil = imagens_pil_pdf[0]
-        elif file_path.lower().endswith(('.jpg', '.jpeg', '.png')):
-            # Lógica para abrir um arquivo de imagem
-            imagem_pil = await asyncio.to_thread(Image.open, file_path)
-
-        if imagem_pil is None:
-            logging.error(
-                "Não foi possível carregar a imagem de %s", file_path)
-            return {
-                "error": "Não foi possível carregar a imagem do arquivo."
-            }
-
-        # --- Etapa 1: Redimensionamento ---
-        img_redim = _converter_pil_para_cv_e_redimensionar(
-            imagem_pil, LARGURA_PADRAO
-        )
-        # --- Etapa 2: Correção de Perspectiva ---
-        img_corrigida = _corrigir_perspectiva(img_redim)
-
-        # --- Etapa 3: Recorte para o Retângulo Principal de Dados ---
-        imagem_base_para_processar = img_corrigida  # Valor padrão
-        if pagina_num in TODAS_ROIS_POR_PAGINA:
-            coords = TODAS_ROIS_POR_PAGINA[pagina_num]["retangulo_principal"]
-            x, y, w, h = (coords["x"], coords["y"], coords["w"], coords["h"])
-
-            if h == 0:
-                h = img_corrigida.shape[0] - y
-            if w == 0:
-                w = img_corrigida.shape[1] - x
-
-            imagem_base_para_processar = img_corrigida[y:y+h, x:x+w]
-            logging.info(
-                "Imagem da página %d recortada para a área de dados.",
-                pagina_num
-            )
-        else:
-            logging.warning(
-                "ROI principal não definida para pág %d. Usando imagem "
-                "inteira.",
-                pagina_num
-            )
-
-        # Opcional: Salvar imagem de depuração do recorte
-        try:
-            path_debug = os.path.join(
-                UPLOAD_FOLDER, f"debug_recorte_{beneficiario_id}.png")
-            cv2.imwrite(path_debug, imagem_base_para_processar)
-        except Exception as e:
-            logging.error(
-                "Erro ao salvar imagem de depuração do recorte: %s", e)
-
-        # A função agora retorna um dicionário com a imagem pronta para a
-        # extração por ROI
-        logging.info("[%s] Preparação da imagem concluída.", beneficiario_id)
-        return {"imagem_processada": imagem_base_para_processar}
-
-    except Exception as e:
-        error_msg = f"Erro crítico ao preparar imagem: {e!s}"
-        logging.exception("[%s] %s", beneficiario_id, error_msg)
-        await manager.send_message(error_msg, beneficiario_id)
-        raise
-
 
 def _limpar_valor_extraido(valor: str) -> str:
     """Remove espaços extras e quebras de linha de um valor extraído."""
@@ -681,115 +461,6 @@ def _normalizar_data(data_str: str) -> str:
         return f"{digitos_data[0:2]}/{digitos_data[2:4]}/{digitos_data[4:8]}"
     return data_str
 
-# -----------------------------------------------------------------------------
-# ETAPA 4: FUNÇÕES AUXILIARES PARA EXTRAÇÃO BASEADA EM ROI
-# -----------------------------------------------------------------------------
-
-# Analisa a imagem de uma ROI de checkbox e retorna True se parecer marcada.
-
-
-def _analisar_checkbox(roi_img_checkbox: np.ndarray) -> bool:
-    """Analisa uma ROI de checkbox para determinar se está marcada.
-
-    Converte a imagem para preto e branco e verifica a proporção de
-    pixels não-brancos. Retorna True se a proporção exceder um limiar.
-    """
-    # Limiar experimental - percentual de pixels "escuros" para
-    # considerar marcado
-    LIMIAR_MARCACAO = 0.15  # 15%
-
-    # Converte para escala de cinza e aplica limiar de Otsu
-    # para criar uma imagem binária (preto e branco)
-    cinza = cv2.cvtColor(roi_img_checkbox, cv2.COLOR_BGR2GRAY)
-    _, binarizada = cv2.threshold(
-        cinza, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU
-    )
-
-    # Conta os pixels brancos (que representam a marcação "X" ou preenchimento)
-    pixels_marcados = cv2.countNonZero(binarizada)
-    total_pixels = roi_img_checkbox.shape[0] * roi_img_checkbox.shape[1]
-
-    if total_pixels == 0:
-        return False
-
-    proporcao_marcada = pixels_marcados / total_pixels
-
-    return proporcao_marcada >= LIMIAR_MARCACAO
-
-
-# Extrai dados de uma imagem processada usando um dicionário de ROIs.
-async def _extrair_dados_roi(
-    imagem_processada: np.ndarray,
-    definicoes_rois: Dict[str, Any],
-    beneficiario_id: str
-) -> Dict[str, str]:
-
-    dados_extraidos = {}
-
-    # Processa campos de texto primeiro
-    textos_nome = []
-    for nome_campo, roi_info in definicoes_rois.items():
-        if roi_info["tipo"] == "texto":
-            x, y, w, h = (roi_info["x"], roi_info["y"],
-                          roi_info["w"], roi_info["h"])
-
-            # Recorta a ROI do campo de texto
-            roi_texto_img = imagem_processada[y:y+h, x:x+w]
-
-            # Pré-processamento específico para OCR na ROI
-            # Usaremos as mesmas configurações do Teste 8B que foram boas
-            img_para_ocr = await _preprocessar_imagem_para_ocr(
-                roi_texto_img, beneficiario_id
-            )
-
-            # Executa OCR com configuração para linha única
-            config_ocr = r'--oem 3 --psm 7'  # PSM 7: Tratar como linha única
-            texto = await asyncio.to_thread(
-                pytesseract.image_to_string,
-                img_para_ocr,
-                lang='por',
-                config=config_ocr
-            )
-
-            # Tratamento específico para o nome completo
-            if nome_campo.startswith("nome_completo"):
-                textos_nome.append(texto.strip())
-
-    # Consolida os campos que podem ter múltiplas partes
-    dados_extraidos["nome_completo"] = " ".join(filter(None, textos_nome))
-
-    # Processa checkboxes
-    # Agrupa checkboxes pelo campo_destino para garantir que
-    # apenas um seja escolhido
-    checkboxes_por_campo = {}
-    for nome_campo, roi_info in definicoes_rois.items():
-        if roi_info["tipo"] == "checkbox":
-            campo_destino = roi_info["campo_destino"]
-            if campo_destino not in checkboxes_por_campo:
-                checkboxes_por_campo[campo_destino] = []
-            checkboxes_por_campo[campo_destino].append(roi_info)
-
-    for campo_destino, cbs in checkboxes_por_campo.items():
-        dados_extraidos[campo_destino] = "Não preenchido"  # Valor padrão
-        for cb_info in cbs:
-            x, y, w, h = (cb_info["x"], cb_info["y"],
-                          cb_info["w"], cb_info["h"])
-            roi_cb_img = imagem_processada[y:y+h, x:x+w]
-
-            if _analisar_checkbox(roi_cb_img):
-                dados_extraidos[campo_destino] = cb_info["valor_marcado"]
-                # CORREÇÃO: Argumentos formatados corretamente dentro
-                #  da chamada
-                logging.info(
-                    "[%s] Checkbox para '%s' detectado como marcado. "
-                    "Valor: %s",
-                    beneficiario_id,
-                    campo_destino,
-                    cb_info["valor_marcado"]
-                )
-                break
-    return dados_extraidos
-
 
 def _extrair_dados_do_texto(
         texto_combinado: str, beneficiario_id: str
@@ -907,7 +578,7 @@ async def _verificar_cadastro_planilha(
 ) -> bool:
     """Verifica se beneficiário já está cadastrado em Google Sheets"""
     msg = f"Consultando planilha para CPF: {cpf} (Beneficiário: {nome})..."
-    await manager.send_message(msg, beneficiario_id)
+    barramento.publicar(msg, beneficiario_id)
     logging.info(
         "[%s] Simulação: Verificando cadastro na planilha para CPF %s",
         beneficiario_id, cpf
@@ -926,7 +597,7 @@ async def _executar_automacao_selenium(
         f"Iniciando automação Selenium para cadastro de {nome_para_msg} "
         f"(CPF: {cpf_para_msg})..."
     )
-    await manager.send_message(msg, beneficiario_id)
+    barramento.publicar(msg, beneficiario_id)
     logging.info(
         "[%s] Simulação: Iniciando automação Selenium com dados: %s",
         beneficiario_id, dados_beneficiario
@@ -946,103 +617,117 @@ def salvar_historico(
     detalhes_ocr: List[str] = None,
     dados_completos: Dict[str, Any] = None
 ):
-    """Salva informações do processamento no arquivo de histórico JSON."""
+    """Acrescenta o processamento ao histórico (tabela `historico`)."""
     logging.info("Salvando histórico para CPF %s, Status: %s", cpf, status)
+    novo_registro = {
+        "id_lote": beneficiario_id or str(uuid.uuid4()),
+        "nome_beneficiario": nome,
+        "cpf_beneficiario": cpf,
+        "status_processamento": status,
+        "data_processamento": datetime.datetime.now().strftime(
+            historico.FORMATO_DATA_HISTORICO
+        ),
+        "arquivos_originais": detalhes_ocr if detalhes_ocr else [],
+        "dados_extraidos_completos": (
+            dados_completos if dados_completos else {}
+        )
+    }
     try:
-        with open(HISTORICO_PATH, 'r+', encoding='utf-8') as hist_file:
-            try:
-                historico_data = json.load(hist_file)
-            except json.JSONDecodeError:
-                logging.warning(
-                    "Arquivo histórico %s vazio/corrompido. Iniciando com "
-                    "lista vazia.", HISTORICO_PATH
-                )
-                historico_data = []
-
-            novo_registro = {
-                "id_lote": beneficiario_id or str(uuid.uuid4()),
-                "nome_beneficiario": nome,
-                "cpf_beneficiario": cpf,
-                "status_processamento": status,
-                "data_processamento": datetime.datetime.now().strftime(
-                    "%d/%m/%Y %H:%M:%S"
-                ),
-                "arquivos_originais": detalhes_ocr if detalhes_ocr else [],
-                "dados_extraidos_completos": (
-                    dados_completos if dados_completos else {}
-                )
-            }
+        historico.registrar(novo_registro)
+        logging.info("Histórico salvo com sucesso para CPF %s.", cpf)
+    except sqlite3.Error as e:
+        logging.error("Erro de banco ao salvar histórico: %s", e)
 
-            historico_data.append(novo_registro)
+# Consulta o cache de OCR antes de enviar o documento ao motor.
 
-            hist_file.seek(0)
-            json.dump(historico_data, hist_file, indent=4, ensure_ascii=False)
-            hist_file.truncate()
-        logging.info("Histórico salvo com sucesso para CPF %s.", cpf)
-    except IOError as e:
-        logging.error("Erro de I/O ao salvar histórico: %s", e)
-    except json.JSONDecodeError as e_json:
-        logging.error(
-            "Erro ao decodificar JSON ao salvar histórico: %s",
-            e_json
-        )
 
-# Orquestra o processo completo para os documentos de um beneficiário.
+async def _extrair_com_cache(
+    file_path: str,
+    beneficiario_id: str,
+    pagina_inicial: int = 1,
+    num_paginas: int = None,
+    sha256_arquivo: str = None
+) -> Dict[str, Any]:
+    """Devolve os campos do cache de OCR ou processa e guarda o resultado."""
+    if sha256_arquivo is None:
+        sha256_arquivo = await asyncio.to_thread(calcular_sha256, file_path)
+    chave = cache_ocr.chave(sha256_arquivo, pagina_inicial, num_paginas)
 
+    dados_em_cache = await asyncio.to_thread(cache_ocr.obter, chave)
+    if dados_em_cache is not None:
+        logging.info(
+            "[%s] Resultado de OCR obtido do cache (%s).",
+            beneficiario_id, sha256_arquivo[:12]
+        )
+        barramento.publicar(
+            "Documento já processado anteriormente: dados obtidos do cache.",
+            beneficiario_id
+        )
+        return {"dados": dados_em_cache}
 
-async def processar_documentos_beneficiario(
-    beneficiario_id: str, file_paths: List[str], original_filenames: List[str]
-):
-    """Orquestra o processo completo, agora usando a extração por ROI."""
-    msg_inicial = (
-        f"Iniciando processamento para lote ID: {beneficiario_id} "
-        f"(Arquivos: {', '.join(original_filenames)})..."
+    resultado_ocr = await motor_ocr.processar(
+        file_path, beneficiario_id, pagina_inicial, num_paginas,
+        sha256_arquivo
     )
-    await manager.send_message(msg_inicial, beneficiario_id)
+    if "dados" in resultado_ocr:
+        await asyncio.to_thread(
+            cache_ocr.guardar, chave, resultado_ocr["dados"]
+        )
+    return resultado_ocr
+
+# Extrai e cadastra um único formulário (um beneficiário).
+
+
+async def _processar_formulario(
+    beneficiario_id: str,
+    file_path: str,
+    original_filenames: List[str],
+    pagina_inicial: int = 1,
+    num_paginas: int = None,
+    sha256_arquivo: str = None
+) -> str:
+    """Extrai os dados de um formulário via ROI e conclui o cadastro.
 
-    # --- Prepara a imagem do primeiro arquivo usando o novo pipeline ---
-    # A função agora retorna um dicionário com a imagem ou um erro.
-    # Usamos o primeiro arquivo da lista como exemplo.
-    resultado_preparacao = await _executar_ocr_para_arquivo(
-        file_paths[0], original_filenames[0], beneficiario_id
+    Retorna RESULTADO_ERRO se a extração falhou, RESULTADO_INCOMPLETO se
+    Nome/CPF não foram extraídos (cadastro não iniciado) e
+    RESULTADO_SUCESSO nos demais casos.
+    """
+    # --- Estágio de CPU no motor de OCR ---
+    # Rasterização, correção de perspectiva, recorte, binarização e OCR por
+    # ROI rodam em um worker do motor; o loop só recebe os campos extraídos.
+    barramento.publicar(
+        f"Preparando imagem e extraindo dados com ROIs do arquivo: "
+        f"{original_filenames[0]} (página {pagina_inicial})...",
+        beneficiario_id
     )
+    try:
+        resultado_ocr = await _extrair_com_cache(
+            file_path, beneficiario_id, pagina_inicial, num_paginas,
+            sha256_arquivo
+        )
+    except Exception as e:  # pylint: disable=broad-except
+        logging.exception(
+            "[%s] Erro crítico no motor de OCR: %s", beneficiario_id, e
+        )
+        resultado_ocr = {"error": f"Erro crítico ao preparar imagem: {e!s}"}
 
     # Verifica se a preparação da imagem falhou
-    if ("error" in resultado_preparacao or
-            "imagem_processada" not in resultado_preparacao):
+    if "error" in resultado_ocr or "dados" not in resultado_ocr:
         msg_final_erro = (
 
             f"Processamento para {beneficiario_id} interrompido. "
             f"Falha na preparação da imagem: "
-            f"{resultado_preparacao.get('error', 'Erro desconhecido')}"
+            f"{resultado_ocr.get('error', 'Erro desconhecido')}"
         )
-        await manager.send_message(msg_final_erro, beneficiario_id)
-        salvar_historico(
+        barramento.publicar(msg_final_erro, beneficiario_id, TIPO_ERRO)
+        await banco.executar(
+            salvar_historico,
             "Erro Preparação Imagem", "N/A", msg_final_erro, beneficiario_id,
             original_filenames
         )
-        return
-
-    # Se a preparação foi bem-sucedida, obtemos a imagem pronta
-    imagem_pronta_para_extracao = resultado_preparacao["imagem_processada"]
-
-    # --- ETAPA 4: Chamada para a nova extração por ROI ---
-    # A chamada antiga para _extrair_dados_do_texto foi removida.
-    await manager.send_message("Extraindo dados com ROIs...", beneficiario_id)
-
-    # Assume que estamos processando a Página 1 e busca suas definições de ROI
-    pagina_num = 1
-    if pagina_num in TODAS_ROIS_POR_PAGINA:
-        definicoes_da_pagina = TODAS_ROIS_POR_PAGINA[pagina_num]["campos"]
-        dados_beneficiario = await _extrair_dados_roi(
-            imagem_pronta_para_extracao,
-            definicoes_da_pagina,
-            beneficiario_id
-        )
-    else:
-        logging.error("Não há definições de ROI para a página %d.", pagina_num)
-        dados_beneficiario = {}  # Inicia vazio se não houver ROIs
-    # --- Fim da Etapa 4 ---
+        return RESULTADO_ERRO
+
+    dados_beneficiario = resultado_ocr["dados"]
 
     # Garante que os campos principais existam no dicionário para evitar erros
     dados_beneficiario.setdefault("nome_completo", "Não extraído")
@@ -1054,7 +739,7 @@ async def processar_documentos_beneficiario(
         f"Dados extraídos: Nome: {dados_beneficiario['nome_completo']}, "
         f"Sexo: {dados_beneficiario['sexo']}"
     )
-    await manager.send_message(msg_dados_extraidos, beneficiario_id)
+    barramento.publicar(msg_dados_extraidos, beneficiario_id)
 
     # O restante do fluxo para verificar na planilha, simular selenium e
     # salvar no histórico continua, agora usando os dados extraídos por ROI.
@@ -1064,12 +749,13 @@ async def processar_documentos_beneficiario(
     )
     status_planilha = ('Já cadastrado' if ja_cadastrado_planilha
                        else 'Não cadastrado na planilha')
-    await manager.send_message(
+    barramento.publicar(
         f"Consulta à planilha concluída. Status: {status_planilha}",
         beneficiario_id
     )
 
     status_final_cadastro = ""
+    resultado = RESULTADO_SUCESSO
     if ja_cadastrado_planilha:
         status_final_cadastro = "Já cadastrado (conforme consulta à planilha)"
     else:
@@ -1082,19 +768,23 @@ async def processar_documentos_beneficiario(
                 "Falha na extração de Nome/CPF via ROI. "
                 "Cadastro Selenium não iniciado."
             )
-            await manager.send_message(status_final_cadastro, beneficiario_id)
+            resultado = RESULTADO_INCOMPLETO
+            barramento.publicar(
+                status_final_cadastro, beneficiario_id, TIPO_ERRO
+            )
         else:
             resultado_selenium = await _executar_automacao_selenium(
                 dados_beneficiario, beneficiario_id
             )
             status_final_cadastro = resultado_selenium
 
-    await manager.send_message(
+    barramento.publicar(
         f"Status final para {beneficiario_id}: {status_final_cadastro}",
-        beneficiario_id
+        beneficiario_id, TIPO_STATUS
     )
 
-    salvar_historico(
+    await banco.executar(
+        salvar_historico,
         dados_beneficiario["nome_completo"],
         dados_beneficiario["cpf"],
         status_final_cadastro,
@@ -1102,157 +792,556 @@ async def processar_documentos_beneficiario(
         original_filenames,
         dados_beneficiario
     )
+    return resultado
 
-    await manager.send_message(
-        f"Processamento para beneficiário {beneficiario_id} concluído.",
+# Divide cada arquivo em formulários e processa todos em paralelo.
+
+
+async def _processar_formularios_divididos(
+    beneficiario_id: str,
+    file_paths: List[str],
+    original_filenames: List[str],
+    sha256_arquivos: Optional[List[str]] = None
+) -> str:
+    """Mapeia os formulários de cada arquivo e despacha as extrações.
+
+    Retorna RESULTADO_ERRO se algum arquivo não pôde ser dividido ou algum
+    formulário terminou com erro; senão, RESULTADO_INCOMPLETO se algum
+    formulário ficou sem Nome/CPF, ou RESULTADO_SUCESSO.
+    """
+    divisao_ok = True
+    tarefas = []
+    for indice, (file_path, nome_arquivo) in enumerate(
+            zip(file_paths, original_filenames)):
+        try:
+            if sha256_arquivos:
+                sha256_arquivo = sha256_arquivos[indice]
+            else:
+                sha256_arquivo = await asyncio.to_thread(
+                    calcular_sha256, file_path
+                )
+            formularios = await motor_ocr.mapear_formularios(
+                file_path, beneficiario_id
+            )
+        except Exception as e:  # pylint: disable=broad-except
+            logging.exception(
+                "[%s] Erro ao dividir %s em formulários: %s",
+                beneficiario_id, nome_arquivo, e
+            )
+            barramento.publicar(
+                f"Erro ao dividir {nome_arquivo} em formulários: {e!s}",
+                beneficiario_id, TIPO_ERRO
+            )
+            divisao_ok = False
+            continue
+
+        barramento.publicar(
+            f"{len(formularios)} formulário(s) encontrado(s) em "
+            f"{nome_arquivo}.",
+            beneficiario_id
+        )
+        # Cada formulário é despachado assim que o arquivo é mapeado
+        for formulario in formularios:
+            sub_id = f"{beneficiario_id}-{len(tarefas) + 1}"
+            tarefas.append(asyncio.create_task(_processar_formulario(
+                sub_id, file_path, [nome_arquivo],
+                formulario["pagina_inicial"], formulario["num_paginas"],
+                sha256_arquivo
+            )))
+
+    resultados = await asyncio.gather(*tarefas, return_exceptions=True)
+    falhas = [r for r in resultados if isinstance(r, Exception)]
+    for falha in falhas:
+        logging.error(
+            "[%s] Formulário falhou: %s", beneficiario_id, falha
+        )
+    barramento.publicar(
+        f"{len(tarefas) - len(falhas)} de {len(tarefas)} formulário(s) "
+        "processado(s).",
         beneficiario_id
     )
+    if not divisao_ok or falhas or RESULTADO_ERRO in resultados:
+        return RESULTADO_ERRO
+    if RESULTADO_INCOMPLETO in resultados:
+        return RESULTADO_INCOMPLETO
+    return RESULTADO_SUCESSO
+
+# Orquestra o processo completo para os documentos de um beneficiário.
+
+
+async def processar_documentos_beneficiario(
+    beneficiario_id: str,
+    file_paths: List[str],
+    original_filenames: List[str],
+    dividir_formularios: bool = False,
+    sha256_arquivos: Optional[List[str]] = None
+) -> str:
+    """Orquestra o processo completo, agora usando a extração por ROI.
+
+    No modo normal, o primeiro arquivo é um único formulário. Com
+    `dividir_formularios`, cada arquivo é percorrido página a página, cada
+    formulário encontrado vira um beneficiário (ID `<lote>-<n>`) e as
+    extrações são despachadas em paralelo para o motor de OCR.
+    `sha256_arquivos`, calculados no upload, evitam reler os arquivos.
+
+    Retorna um `RESULTADO_*` (a fila de jobs marca o lote como `falhou`
+    com RESULTADO_ERRO e `incompleto` com RESULTADO_INCOMPLETO).
+    """
+    msg_inicial = (
+        f"Iniciando processamento para lote ID: {beneficiario_id} "
+        f"(Arquivos: {', '.join(original_filenames)})..."
+    )
+    barramento.publicar(msg_inicial, beneficiario_id)
+
+    resultado = RESULTADO_ERRO
+    try:
+        if not dividir_formularios:
+            # Usamos o primeiro arquivo da lista como exemplo.
+            resultado = await _processar_formulario(
+                beneficiario_id, file_paths[0], original_filenames,
+                sha256_arquivo=(
+                    sha256_arquivos[0] if sha256_arquivos else None
+                )
+            )
+        else:
+            resultado = await _processar_formularios_divididos(
+                beneficiario_id, file_paths, original_filenames,
+                sha256_arquivos
+            )
+    finally:
+        # Sem erro de processamento, os arquivos do lote já podem ser
+        # apagados; com erro, ficam para a varredura de retenção. Lotes
+        # incompletos (sem Nome/CPF) contam como processados: os campos
+        # extraídos ficam no cache de OCR e no histórico.
+        for retencao in (retencao_uploads, retencao_prints):
+            await asyncio.to_thread(
+                retencao.concluir_lote, beneficiario_id,
+                resultado != RESULTADO_ERRO
+            )
+
+    barramento.publicar(
+        f"Processamento para beneficiário {beneficiario_id} concluído.",
+        beneficiario_id, TIPO_CONCLUIDO
+    )
+    return resultado
+
+
+# Fila limitada que alimenta processar_documentos_beneficiario.
+fila_jobs = FilaJobs(processar_documentos_beneficiario)
+
+
+def _resposta_fila_cheia(retry_after: int) -> JSONResponse:
+    """Resposta 503 com Retry-After quando a fila recusa novos lotes."""
+    return JSONResponse(
+        content={
+            "error": (
+                "Servidor ocupado: fila de processamento cheia. "
+                f"Tente novamente em {retry_after} segundo(s)."
+            )
+        },
+        status_code=503,
+        headers={"Retry-After": str(retry_after)}
+    )
 
 # --- Endpoint de Upload de Arquivos ---
 
 
-@app.post("/upload", summary="Upload de Documentos do Beneficiário")
+@app.post(
+    "/upload",
+    summary="Upload de Documentos do Beneficiário",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": ["files"],
+                        "properties": {
+                            "files": {
+                                "type": "array",
+                                "items": {"type": "string", "format": "binary"},
+                                "description": (
+                                    "Lista de arquivos (PDFs/imagens) do "
+                                    "beneficiário."
+                                ),
+                            }
+                        },
+                    }
+                }
+            },
+        }
+    }
+)
 async def upload_documentos_beneficiario(
-    files: List[UploadFile] = File(
-        ..., description="Lista de arquivos (PDFs/imagens) do beneficiário."
+    request: Request,
+    dividir_formularios: bool = Query(
+        False,
+        description=(
+            "Trata cada arquivo como um lote escaneado com vários "
+            "formulários, gerando um beneficiário por formulário."
+        )
     )
 ):
     """
     Recebe arquivos, salva-os e inicia o processo de OCR e cadastro.
+
+    O corpo é lido em streaming (ver `app.ingestao`): extensão e conteúdo de
+    cada arquivo são conferidos antes de ele ser gravado na pasta do lote.
     """
-    if not files:
+    if excede_limite_declarado(request):
         return JSONResponse(
-            content={"error": "Nenhum arquivo enviado."}, status_code=400
+            content={"error": mensagem_limite_requisicao()}, status_code=413
         )
 
-    saved_file_paths = []
-    original_filenames = []
+    # Controle de admissão: recusa antes de gravar qualquer arquivo
+    if fila_jobs.cheia():
+        return _resposta_fila_cheia(fila_jobs.estimar_retry_after())
+
     beneficiario_id = str(uuid.uuid4())[:8]
 
-    await manager.send_message(
-        f"Recebendo {len(files)} arquivo(s) para o lote {beneficiario_id}...",
+    barramento.publicar(
+        f"Recebendo arquivo(s) para o lote {beneficiario_id}...",
         beneficiario_id
     )
 
-    for file_obj in files:
-        if not file_obj.filename.lower().endswith(
-            ('.pdf', '.jpg', '.jpeg', '.png')
-        ):
-            for p in saved_file_paths:
-                if os.path.exists(p):
-                    os.remove(p)
-            error_msg = (
-                f"Formato inválido para '{file_obj.filename}'. "
-                "Apenas PDF, JPG, JPEG, PNG são permitidos."
-            )
-            await manager.send_message(
-                f"Erro no upload: {error_msg}", beneficiario_id
-            )
-            return JSONResponse(content={"error": error_msg}, status_code=400)
-
+    def destino(nome_original: str) -> str:
         unique_filename = (
-            f"{beneficiario_id}_{uuid.uuid4().hex[:8]}_{file_obj.filename}"
+            f"{uuid.uuid4().hex[:8]}_{os.path.basename(nome_original)}"
+        )
+        return os.path.join(
+            retencao_uploads.pasta_lote(beneficiario_id), unique_filename
         )
-        file_path = os.path.join(UPLOAD_FOLDER, unique_filename)
-        original_filenames.append(file_obj.filename)
 
-        try:
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file_obj.file, buffer)
-            saved_file_paths.append(file_path)
-            logging.info(
-                "Arquivo '%s' salvo como '%s' para o lote %s.",
-                file_obj.filename, file_path, beneficiario_id
-            )
-        except IOError as e_io:
-            logging.exception(
-                "Erro de I/O ao salvar arquivo %s para lote %s",
-                file_obj.filename, beneficiario_id
-            )
-            for p_clean in saved_file_paths:
-                if os.path.exists(p_clean):
-                    os.remove(p_clean)
-            await manager.send_message(
-                (
-                    f"Erro crítico ao salvar {file_obj.filename}. "
-                    "Upload cancelado."
-                ),
-                beneficiario_id
-            )
-            return JSONResponse(
-                content={
-                    "error": (
-                        f"Erro ao salvar {file_obj.filename}: {e_io!s}"
-                    )
-                },
-                status_code=500
-            )
-        finally:
-            if hasattr(file_obj, 'close') and callable(file_obj.close):
-                await file_obj.close()
-
-    if len(saved_file_paths) == len(files):
-        asyncio.create_task(processar_documentos_beneficiario(
-            beneficiario_id, saved_file_paths, original_filenames
-        ))
-        msg_sucesso = (
-            f"{len(saved_file_paths)} arquivo(s) para o lote "
-            f"{beneficiario_id} recebido(s) e em processamento."
+    try:
+        recebidos = await RecebimentoUpload(request, destino).receber()
+    except UploadRecusadoError as e_recusa:
+        await asyncio.to_thread(retencao_uploads.remover_lote, beneficiario_id)
+        barramento.publicar(
+            f"Erro no upload: {e_recusa}", beneficiario_id, TIPO_ERRO
         )
-        await manager.send_message(msg_sucesso, beneficiario_id)
         return JSONResponse(
-            content={"message": msg_sucesso,
-                     "beneficiario_id": beneficiario_id},
-            status_code=202
+            content={"error": str(e_recusa)},
+            status_code=e_recusa.status_code
+        )
+    except IOError as e_io:
+        logging.exception(
+            "Erro de I/O ao salvar arquivos do lote %s", beneficiario_id
+        )
+        await asyncio.to_thread(retencao_uploads.remover_lote, beneficiario_id)
+        barramento.publicar(
+            "Erro crítico ao salvar os arquivos. Upload cancelado.",
+            beneficiario_id, TIPO_ERRO
+        )
+        return JSONResponse(
+            content={"error": f"Erro ao salvar os arquivos: {e_io!s}"},
+            status_code=500
         )
 
-    await manager.send_message(
-        "Erro interno ao lidar com arquivos. Upload falhou.",
-        beneficiario_id
+    if not recebidos:
+        await asyncio.to_thread(retencao_uploads.remover_lote, beneficiario_id)
+        barramento.publicar(
+            "Erro no upload: nenhum arquivo enviado.",
+            beneficiario_id, TIPO_ERRO
+        )
+        return JSONResponse(
+            content={"error": "Nenhum arquivo enviado."}, status_code=400
+        )
+
+    saved_file_paths = [recebido["caminho"] for recebido in recebidos]
+    original_filenames = [recebido["nome"] for recebido in recebidos]
+    sha256_arquivos = [recebido["sha256"] for recebido in recebidos]
+    for recebido in recebidos:
+        logging.info(
+            "Arquivo '%s' salvo como '%s' para o lote %s.",
+            recebido["nome"], recebido["caminho"], beneficiario_id
+        )
+
+    try:
+        fila_jobs.enfileirar(
+            beneficiario_id, saved_file_paths, original_filenames,
+            dividir_formularios, sha256_arquivos
+        )
+    except FilaCheiaError as e_fila:
+        await asyncio.to_thread(retencao_uploads.remover_lote, beneficiario_id)
+        barramento.publicar(
+            "Fila de processamento cheia. Upload recusado.",
+            beneficiario_id, TIPO_ERRO
+        )
+        return _resposta_fila_cheia(e_fila.retry_after)
+    msg_sucesso = (
+        f"{len(saved_file_paths)} arquivo(s) para o lote "
+        f"{beneficiario_id} recebido(s) e na fila de processamento."
     )
+    barramento.publicar(msg_sucesso, beneficiario_id)
     return JSONResponse(
-        content={"error": "Erro interno ao lidar com os arquivos."},
-        status_code=500
+        content={"message": msg_sucesso,
+                 "beneficiario_id": beneficiario_id},
+        status_code=202
     )
 
 # --- Endpoint de Histórico ---
 
 
+def _filtros_historico(
+    status: Optional[str],
+    cpf: Optional[str],
+    id_lote: Optional[str],
+    data_inicio: Optional[str],
+    data_fim: Optional[str]
+) -> Dict[str, Optional[str]]:
+    """Agrupa os filtros de query do histórico."""
+    return {
+        "status": status,
+        "cpf": cpf,
+        "id_lote": id_lote,
+        "data_inicio": data_inicio,
+        "data_fim": data_fim,
+    }
+
+
 @app.get("/historico", summary="Obter Histórico de Processamentos")
-async def get_historico_endpoint():
-    """Retorna o histórico de processamentos do arquivo JSON."""
+async def get_historico_endpoint(
+    request: Request,
+    cursor: Optional[int] = Query(None, description="Cursor da página."),
+    limite: int = Query(
+        historico.LIMITE_PAGINA_PADRAO, ge=1,
+        le=historico.LIMITE_PAGINA_MAXIMO
+    ),
+    status: Optional[str] = Query(None),
+    cpf: Optional[str] = Query(None),
+    id_lote: Optional[str] = Query(None),
+    data_inicio: Optional[str] = Query(None, description="AAAA-MM-DD"),
+    data_fim: Optional[str] = Query(None, description="AAAA-MM-DD"),
+    campos: Optional[str] = Query(
+        None, description="Lista separada por vírgulas, ou 'todos'."
+    )
+):
+    """Retorna uma página do histórico, do mais recente para o mais antigo.
+
+    Por padrão os blobs `arquivos_originais`/`dados_extraidos_completos`
+    ficam de fora (use `campos`). O cursor da próxima página vem no
+    cabeçalho `X-Proximo-Cursor`.
+    """
     try:
-        with open(HISTORICO_PATH, 'r', encoding='utf-8') as hist_file:
-            historico_data = json.load(hist_file)
-        return JSONResponse(content=historico_data)
-    except FileNotFoundError:
-        logging.warning("Arquivo histórico %s não encontrado.", HISTORICO_PATH)
-        return JSONResponse(content=[], status_code=200)
-    except json.JSONDecodeError:
-        logging.error(
-            "Erro ao decodificar JSON do histórico %s.", HISTORICO_PATH
+        colunas = historico.validar_campos(campos)
+        etag = respostas.etag(
+            "historico", await banco.executar(versoes.versao, "historico"),
+            request
         )
-        return JSONResponse(
-            content={"error": "Erro ao ler o histórico."}, status_code=500
+        if respostas.etag_confere(request, etag):
+            return respostas.nao_modificado(etag)
+        registros, proximo_cursor = await banco.executar(
+            historico.consultar,
+            _filtros_historico(status, cpf, id_lote, data_inicio, data_fim),
+            cursor, limite, colunas
         )
-    except IOError as e_io:
-        logging.exception("Erro de I/O ao buscar histórico: %s", e_io)
+    except ValueError as e_valor:
+        return JSONResponse(content={"error": str(e_valor)}, status_code=400)
+    except sqlite3.Error as e_db:
+        logging.exception("Erro de banco ao buscar histórico: %s", e_db)
         return JSONResponse(
             content={"error": "Erro interno ao buscar histórico."},
             status_code=500
         )
+    headers = respostas.cabecalhos_cache(etag)
+    if proximo_cursor is not None:
+        headers["X-Proximo-Cursor"] = str(proximo_cursor)
+    return RespostaJSON(content=registros, headers=headers)
+
+
+@app.get("/historico/exportar", summary="Exportar Histórico Completo")
+async def exportar_historico(
+    status: Optional[str] = Query(None),
+    cpf: Optional[str] = Query(None),
+    id_lote: Optional[str] = Query(None),
+    data_inicio: Optional[str] = Query(None, description="AAAA-MM-DD"),
+    data_fim: Optional[str] = Query(None, description="AAAA-MM-DD"),
+    campos: Optional[str] = Query("todos")
+):
+    """Exporta o histórico filtrado como um array JSON transmitido em
+    partes, lendo o banco em lotes."""
+    try:
+        colunas = historico.validar_campos(campos)
+        filtros = _filtros_historico(
+            status, cpf, id_lote, data_inicio, data_fim
+        )
+        historico.validar_filtros(filtros)
+    except ValueError as e_valor:
+        return JSONResponse(content={"error": str(e_valor)}, status_code=400)
+
+    async def gerar_json():
+        """Lê o histórico em lotes e serializa os registros um a um dentro
+        de um array JSON."""
+        yield "["
+        separador, cursor = "", None
+        while True:
+            registros, cursor = await banco.executar(
+                historico.consultar, filtros, cursor,
+                historico.TAMANHO_LOTE_EXPORTACAO, colunas
+            )
+            for registro in registros:
+                yield separador + "\n" + json.dumps(
+                    registro, ensure_ascii=False
+                )
+                separador = ","
+            if cursor is None:
+                break
+        yield "\n]\n"
+
+    return StreamingResponse(
+        gerar_json(),
+        media_type="application/json",
+        headers={
+            "Content-Disposition": 'attachment; filename="historico.json"'
+        }
+    )
+
+# --- Endpoint de Status de Jobs ---
+
+
+@app.get("/api/jobs/{beneficiario_id}", summary="Status de um Lote")
+async def get_status_job(beneficiario_id: str):
+    """Retorna o estado do job
+    (na_fila/processando/concluido/incompleto/falhou)."""
+    status = fila_jobs.status(beneficiario_id)
+    if status is None:
+        return JSONResponse(
+            content={"error": f"Lote {beneficiario_id} não encontrado."},
+            status_code=404
+        )
+    return JSONResponse(content=status)
+
+
+@app.get("/api/depuracao/{lote}", summary="Artefatos de Depuração de um Lote")
+async def get_artefatos_depuracao(lote: str):
+    """Lista as imagens de depuração gravadas para o lote (ou para um
+    formulário dele, `<lote>-<n>`), com a URL de cada uma."""
+    if not depuracao.nome_seguro(lote):
+        return JSONResponse(
+            content={"error": "Lote inválido."}, status_code=400
+        )
+    itens = await asyncio.to_thread(depuracao.gravador.artefatos, lote)
+    for item in itens:
+        item["url"] = f"/api/depuracao/{lote}/{item['nome']}"
+    return JSONResponse(content={
+        "lote": lote,
+        "amostrado": depuracao.amostrado(lote),
+        "artefatos": itens,
+    })
+
+
+@app.get(
+    "/api/depuracao/{lote}/{nome}", summary="Baixar Artefato de Depuração"
+)
+async def get_artefato_depuracao(lote: str, nome: str):
+    """Serve uma imagem de depuração do lote."""
+    caminho = depuracao.gravador.caminho(lote, nome)
+    if caminho is None:
+        return JSONResponse(
+            content={"error": f"Artefato {nome} não encontrado."},
+            status_code=404
+        )
+    return FileResponse(caminho, media_type="image/png")
+
+
+@app.get("/api/jobs", summary="Ocupação da Fila de Processamento")
+async def get_metricas_jobs():
+    """Retorna a capacidade, a concorrência e a contagem de jobs."""
+    return JSONResponse(content=fila_jobs.metricas())
+
+
+@app.get("/api/ocr/metricas", summary="Métricas do Motor de OCR")
+async def get_metricas_ocr():
+    """Retorna profundidade da fila, latências e reinícios dos workers,
+    além dos contadores do cache de resultados."""
+    metricas = motor_ocr.metricas()
+    metricas["cache"] = await asyncio.to_thread(cache_ocr.metricas)
+    return JSONResponse(content=metricas)
+
+
+@app.get("/api/banco/metricas", summary="Métricas do Acesso ao Banco")
+async def get_metricas_banco():
+    """Retorna conexões abertas, fila e tempos médios das consultas."""
+    return JSONResponse(content=banco.metricas())
+
+
+@app.get("/api/retencao/metricas", summary="Retenção de Arquivos em Disco")
+async def get_metricas_retencao():
+    """Retorna as políticas, a ocupação e os bytes recuperados das pastas
+    de uploads, de prints de erro e de páginas normalizadas."""
+    return JSONResponse(content={
+        "uploads": retencao_uploads.metricas(),
+        "prints": retencao_prints.metricas(),
+        "paginas_normalizadas": retencao_paginas.metricas(),
+    })
+
+
+@app.get("/api/ws/metricas", summary="Métricas dos Eventos e WebSockets")
+async def get_metricas_ws():
+    """Retorna as métricas do barramento de eventos e dos WebSockets.
+
+    `bloqueio_evitado_ms` soma a entrega dos eventos e os envios aos
+    navegadores: o tempo que o processamento passaria bloqueado se ainda
+    enviasse as mensagens ele mesmo.
+    """
+    eventos = barramento.metricas()
+    websockets = manager.metricas()
+    return JSONResponse(content={
+        "eventos": eventos,
+        "websockets": websockets,
+        "bloqueio_evitado_ms": round(
+            eventos["entrega_total_ms"] + websockets["envio_total_ms"], 3
+        ),
+    })
+
+
+@app.post("/api/ocr/reextrair", summary="Reextrair Formulários com Novas ROIs")
+async def reextrair_formularios_endpoint(
+    rois: Dict[str, Any] = Body(
+        None,
+        description=(
+            "Definições no formato de TODAS_ROIS_POR_PAGINA (chave = "
+            "página). Se omitidas, usa as definições atuais."
+        )
+    ),
+    sha256: List[str] = Body(
+        None, description="Restringe a reextração a estes documentos."
+    )
+):
+    """
+    Reaplica o recorte e a extração por ROI sobre as páginas normalizadas
+    já guardadas, sem rasterizar nem corrigir a perspectiva de novo.
+    """
+    try:
+        rois_por_pagina = normalizar_definicoes_rois(rois) if rois else None
+    except (TypeError, ValueError) as e:
+        return JSONResponse(
+            content={"error": f"Definições de ROI inválidas: {e!s}"},
+            status_code=400
+        )
+    inicio = time.perf_counter()
+    resultados = await motor_ocr.reextrair(rois_por_pagina, sha256)
+    return JSONResponse(content={
+        "formularios": len(resultados),
+        "tempo_total_ms": round((time.perf_counter() - inicio) * 1000, 1),
+        "resultados": resultados,
+    })
 
 # --- Endpoint WebSocket ---
 
 
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    """Gerencia a conexão WebSocket para comunicação em tempo real."""
-    await manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket, lote: Optional[str] = None):
+    """Gerencia a conexão WebSocket para comunicação em tempo real.
+
+    O cliente recebe os eventos dos lotes que assinar (`?lote=` na URL ou
+    `{"acao": "assinar", "lotes": [...]}`; ver `app.notificacoes`).
+    """
+    await manager.connect(websocket, [lote] if lote else [])
     try:
         while True:
-            _ = await websocket.receive_text()
-            # logging.debug("WebSocket recebeu (e ignorou): %s", _)
+            manager.tratar_mensagem(websocket, await websocket.receive_text())
     except WebSocketDisconnect:
         logging.info("Cliente %s desconectado do WebSocket.", websocket.client)
     except RuntimeError as e_runtime:
@@ -0,0 +1,184 @@
+"""
+Dados do mapa de beneficiários (GeoJSON), por área visível.
+
+A tabela virtual R*Tree `beneficiarios_mapa` indexa latitude/longitude de
+cada beneficiário e guarda, como colunas auxiliares, o status e as
+coordenadas exatas (a R*Tree arredonda as caixas para float32); assim a
+consulta por área não precisa ler `beneficiarios`. Triggers a mantêm em dia,
+como o índice FTS5 de `app.beneficiarios`.
+
+Em zoom baixo os pontos são agrupados no servidor em uma grade (células de
+`PIXELS_CELULA` px na tela); a partir de `ZOOM_PONTOS` vão individualmente,
+desde que a área não passe de `LIMITE_PONTOS_MAPA` pontos.
+"""
+
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.banco import banco
+
+TABELA_MAPA = "beneficiarios_mapa"
+ZOOM_MAXIMO = 22
+ZOOM_PONTOS = 13  # a partir deste zoom, sem agrupamento
+PIXELS_CELULA = 64  # lado da célula de agrupamento na tela
+PIXELS_TILE = 256  # largura do mundo, em px, no zoom 0
+LIMITE_PONTOS_MAPA = 2000  # acima disso a área é agrupada mesmo em zoom alto
+CASAS_DECIMAIS = 6  # ~0,1 m
+
+Caixa = Tuple[float, float, float, float]  # oeste, sul, leste, norte
+
+
+def preparar_mapa():
+    """Cria a R*Tree e os triggers; reconstrói o índice quando os triggers
+    não existiam ou a contagem de pontos diverge."""
+    inserir_novo = f"""
+        INSERT INTO {TABELA_MAPA}
+        SELECT new.id, new.latitude, new.latitude, new.longitude,
+            new.longitude, new.status, new.latitude, new.longitude
+        WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+    """
+    conexao = banco.escrita()
+    with conexao:
+        triggers_existentes = conexao.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' "
+            "AND name LIKE ?", (f"{TABELA_MAPA}_%",)
+        ).fetchone()[0]
+        conexao.executescript(
+            f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {TABELA_MAPA} USING rtree(
+                id, min_lat, max_lat, min_lon, max_lon,
+                +status, +latitude, +longitude
+            );
+            CREATE TRIGGER IF NOT EXISTS {TABELA_MAPA}_ai
+            AFTER INSERT ON beneficiarios BEGIN
+                {inserir_novo}
+            END;
+            CREATE TRIGGER IF NOT EXISTS {TABELA_MAPA}_ad
+            AFTER DELETE ON beneficiarios BEGIN
+                DELETE FROM {TABELA_MAPA} WHERE id = old.id;
+            END;
+            CREATE TRIGGER IF NOT EXISTS {TABELA_MAPA}_au
+            AFTER UPDATE OF id, latitude, longitude, status ON beneficiarios
+            BEGIN
+                DELETE FROM {TABELA_MAPA} WHERE id = old.id;
+                {inserir_novo}
+            END;
+            """
+        )
+        total_tabela = conexao.execute(
+            "SELECT COUNT(*) FROM beneficiarios "
+            "WHERE latitude IS NOT NULL AND longitude IS NOT NULL"
+        ).fetchone()[0]
+        total_indice = conexao.execute(
+            f"SELECT COUNT(*) FROM {TABELA_MAPA}"
+        ).fetchone()[0]
+        if triggers_existentes < 3 or total_tabela != total_indice:
+            conexao.execute(f"DELETE FROM {TABELA_MAPA}")
+            conexao.execute(
+                f"INSERT INTO {TABELA_MAPA} "
+                "SELECT id, latitude, latitude, longitude, longitude, "
+                "status, latitude, longitude FROM beneficiarios "
+                "WHERE latitude IS NOT NULL AND longitude IS NOT NULL"
+            )
+            logging.info(
+                "Mapa: índice R*Tree reconstruído (%d pontos).", total_tabela
+            )
+
+
+def validar_caixa(bbox: Optional[str]) -> Optional[Caixa]:
+    """"oeste,sul,leste,norte" (ordem do GeoJSON) -> tupla; ValueError se
+    inválida."""
+    if not bbox:
+        return None
+    try:
+        oeste, sul, leste, norte = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise ValueError("bbox deve ser 'oeste,sul,leste,norte'.")
+    if sul > norte or oeste > leste:
+        raise ValueError("bbox com sul > norte ou oeste > leste.")
+    return oeste, sul, leste, norte
+
+
+def _filtros(
+    caixa: Optional[Caixa], status: Sequence[str]
+) -> Tuple[str, list]:
+    """Cláusula WHERE (área e status) e parâmetros."""
+    condicoes: List[str] = []
+    parametros: list = []
+    if caixa:
+        oeste, sul, leste, norte = caixa
+        condicoes.append(
+            "max_lat >= ? AND min_lat <= ? AND max_lon >= ? AND min_lon <= ?"
+        )
+        parametros += [sul, norte, oeste, leste]
+    if status:
+        condicoes.append(f"status IN ({', '.join('?' * len(status))})")
+        parametros += list(status)
+    where = (" WHERE " + " AND ".join(condicoes)) if condicoes else ""
+    return where, parametros
+
+
+def _ponto(latitude: float, longitude: float) -> Dict[str, Any]:
+    """Geometria GeoJSON (lon, lat) com coordenadas arredondadas."""
+    return {
+        "type": "Point",
+        "coordinates": [
+            round(longitude, CASAS_DECIMAIS), round(latitude, CASAS_DECIMAIS)
+        ],
+    }
+
+
+def consultar(
+    caixa: Optional[Caixa] = None,
+    zoom: int = ZOOM_PONTOS,
+    status: Sequence[str] = ()
+) -> Dict[str, Any]:
+    """FeatureCollection com os beneficiários da área.
+
+    Pontos individuais têm `id` e `properties.status`; grupos têm
+    `properties.quantidade` e ficam no centroide dos seus pontos.
+    """
+    where, parametros = _filtros(caixa, status)
+    conexao = banco.leitura()
+    with conexao:
+        conexao.execute("BEGIN")
+        total = conexao.execute(
+            f"SELECT COUNT(*) FROM {TABELA_MAPA}{where}", parametros
+        ).fetchone()[0]
+        agrupar = zoom < ZOOM_PONTOS or total > LIMITE_PONTOS_MAPA
+        if agrupar:
+            # Lado da célula em graus: PIXELS_CELULA px no zoom atual.
+            celula = 360 / (PIXELS_TILE * 2 ** zoom) * PIXELS_CELULA
+            linhas = conexao.execute(
+                "SELECT COUNT(*), AVG(latitude), AVG(longitude), MIN(id), "
+                f"MIN(status) FROM {TABELA_MAPA}{where} "
+                "GROUP BY CAST((latitude + 90) / ? AS INTEGER), "
+                "CAST((longitude + 180) / ? AS INTEGER)",
+                parametros + [celula, celula]
+            ).fetchall()
+        else:
+            linhas = conexao.execute(
+                f"SELECT 1, latitude, longitude, id, status FROM {TABELA_MAPA}"
+                f"{where}", parametros
+            ).fetchall()
+
+    features = []
+    for quantidade, latitude, longitude, id_, status_ponto in linhas:
+        if quantidade == 1:
+            features.append({
+                "type": "Feature", "id": id_,
+                "geometry": _ponto(latitude, longitude),
+                "properties": {"status": status_ponto},
+            })
+        else:
+            features.append({
+                "type": "Feature",
+                "geometry": _ponto(latitude, longitude),
+                "properties": {"quantidade": quantidade},
+            })
+    return {
+        "type": "FeatureCollection",
+        "features": features,
+        "total": total,
+        "agrupado": agrupar,
+    }
@@ -0,0 +1,336 @@
+"""
+Migrações versionadas do esquema do `agendha.db`.
+
+A versão aplicada fica em `PRAGMA user_version`; cada migração roda uma
+única vez, dentro de uma transação, na inicialização da aplicação (ou pelos
+scripts de `scripts/`). Também estão aqui os conversores usados para levar
+os valores da planilha (tudo texto) para as colunas tipadas.
+"""
+
+import re
+import json
+import hashlib
+import logging
+import sqlite3
+import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.banco import banco
+
+# Esquema tipado de `beneficiarios`. `codigo` vem da planilha como
+# "Código: 26511.1" e não é numérico, por isso a chave é `id`.
+SQL_CRIAR_BENEFICIARIOS = """
+    CREATE TABLE {tabela} (
+        id INTEGER PRIMARY KEY,
+        codigo TEXT UNIQUE,
+        nome_tecnico TEXT,
+        cpf_tecnico TEXT,
+        municipio TEXT,
+        comunidade TEXT,
+        latitude REAL,
+        longitude REAL,
+        data_atividade TEXT,  -- AAAA-MM-DD
+        nome_familiar TEXT,
+        cpf_familiar TEXT,
+        nis TEXT,
+        renda_media REAL,
+        status TEXT,
+        tecnico_agua_que_alimenta TEXT,
+        doc_status TEXT,
+        grh TEXT,
+        verificado_bsf TEXT
+    )
+"""
+COLUNAS_TIPADAS = (
+    "codigo", "nome_tecnico", "cpf_tecnico", "municipio", "comunidade",
+    "latitude", "longitude", "data_atividade", "nome_familiar",
+    "cpf_familiar", "nis", "renda_media", "status",
+    "tecnico_agua_que_alimenta", "doc_status", "grh", "verificado_bsf",
+)
+FORMATOS_DATA = ("%d/%m/%Y", "%Y-%m-%d", "%d/%m/%y", "%d-%m-%Y")
+
+
+# --- Conversores ---
+
+
+def converter_texto(valor: Any) -> Optional[str]:
+    """Texto sem espaços nas pontas; vazio vira None."""
+    if valor is None:
+        return None
+    texto = str(valor).strip()
+    return texto or None
+
+
+def converter_codigo(valor: Any) -> Optional[str]:
+    """"Código: 26511.1" -> "26511.1"."""
+    texto = converter_texto(valor)
+    if texto is None:
+        return None
+    return re.sub(r"^c[oó]digo\s*:?\s*", "", texto, flags=re.IGNORECASE)
+
+
+def converter_cpf(valor: Any) -> Optional[str]:
+    """Mantém só os dígitos do CPF ("055.996.115-40" -> "05599611540")."""
+    texto = converter_texto(valor)
+    if texto is None:
+        return None
+    return re.sub(r"\D", "", texto) or None
+
+
+def converter_numero(valor: Any) -> Optional[float]:
+    """Número no formato brasileiro ("1.200,50", "R$ 379,5") ou já em
+    ponto flutuante. Retorna None se não for numérico."""
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    texto = converter_texto(valor)
+    if texto is None:
+        return None
+    texto = texto.replace("R$", "").replace(" ", "")
+    if "," in texto:
+        texto = texto.replace(".", "").replace(",", ".")
+    try:
+        return float(texto)
+    except ValueError:
+        return None
+
+
+def converter_moeda(valor: Any) -> Optional[float]:
+    """Como `converter_numero`, mas "1.200" é lido como mil e duzentos
+    (ponto como separador de milhar)."""
+    texto = converter_texto(valor)
+    if texto and re.fullmatch(r"(R\$\s*)?\d{1,3}(\.\d{3})+", texto):
+        texto = texto.replace(".", "")
+    return converter_numero(texto if texto is not None else valor)
+
+
+def converter_coordenada(valor: Any) -> Optional[float]:
+    """Coordenada decimal ("-8.999007") ou em graus/minutos/segundos
+    ("8º 45' 06\\" S"). Hemisférios S/W/O ficam negativos."""
+    numero = converter_numero(valor)
+    if numero is not None:
+        return numero
+    texto = converter_texto(valor)
+    if texto is None:
+        return None
+    partes = re.findall(r"\d+(?:[.,]\d+)?", texto)
+    hemisferio = re.search(r"[NSEWO]\s*$", texto.upper())
+    if len(partes) < 2 or not hemisferio:
+        return None
+    graus, minutos, segundos = (
+        [float(p.replace(",", ".")) for p in partes[:3]] + [0.0]
+    )[:3]
+    decimal = graus + minutos / 60 + segundos / 3600
+    return -decimal if hemisferio.group(0).strip() in "SWO" else decimal
+
+
+def converter_data(valor: Any) -> Optional[str]:
+    """Data "DD/MM/AAAA" (ou ISO) -> "AAAA-MM-DD"."""
+    texto = converter_texto(valor)
+    if texto is None:
+        return None
+    for formato in FORMATOS_DATA:
+        try:
+            data = datetime.datetime.strptime(texto, formato).date()
+            return data.isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+CONVERSORES: Dict[str, Callable[[Any], Any]] = {
+    "codigo": converter_codigo,
+    "cpf_tecnico": converter_cpf,
+    "cpf_familiar": converter_cpf,
+    "latitude": converter_coordenada,
+    "longitude": converter_coordenada,
+    "renda_media": converter_moeda,
+    "data_atividade": converter_data,
+}
+
+
+def converter_registro(
+    registro: Dict[str, Any],
+    descartes: Optional[Dict[str, int]] = None
+) -> Dict[str, Any]:
+    """Converte um registro da planilha para as colunas tipadas.
+
+    Valores preenchidos que não puderam ser convertidos viram None e são
+    contados em `descartes` (por coluna), quando informado.
+    """
+    convertido = {}
+    for coluna in COLUNAS_TIPADAS:
+        original = registro.get(coluna)
+        valor = CONVERSORES.get(coluna, converter_texto)(original)
+        if (valor is None and converter_texto(original) is not None
+                and descartes is not None):
+            descartes[coluna] = descartes.get(coluna, 0) + 1
+        convertido[coluna] = valor
+    return convertido
+
+
+def chave_base_planilha(registro: Dict[str, Any]) -> Optional[str]:
+    """Chave de uma linha da planilha sem o sufixo de repetição.
+
+    Usa o `codigo`; sem ele, o CPF do familiar; sem os dois, nome e
+    município.
+    """
+    if registro.get("codigo"):
+        return f"codigo:{registro['codigo']}"
+    if registro.get("cpf_familiar"):
+        return f"cpf:{registro['cpf_familiar']}"
+    if registro.get("nome_familiar"):
+        return (
+            f"nome:{registro['nome_familiar'].upper()}|"
+            f"{(registro.get('municipio') or '').upper()}"
+        )
+    return None
+
+
+def chave_planilha(
+    registro: Dict[str, Any], ocorrencias: Dict[str, int]
+) -> Optional[str]:
+    """Chave estável de uma linha da planilha (já convertida).
+
+    É a `chave_base_planilha`; repetições da mesma chave na planilha ganham
+    um sufixo "#2", "#3"... na ordem em que aparecem (`ocorrencias` guarda
+    a contagem entre chamadas).
+    """
+    chave = chave_base_planilha(registro)
+    if chave is None:
+        return None
+    ocorrencias[chave] = ocorrencias.get(chave, 0) + 1
+    if ocorrencias[chave] > 1:
+        chave = f"{chave}#{ocorrencias[chave]}"
+    return chave
+
+
+def hash_registro(registro: Dict[str, Any]) -> str:
+    """Hash do conteúdo (colunas da planilha) de um registro convertido."""
+    conteudo = json.dumps(
+        [registro.get(c) for c in COLUNAS_TIPADAS], ensure_ascii=False
+    )
+    return hashlib.sha1(conteudo.encode("utf-8")).hexdigest()
+
+
+# --- Migrações ---
+
+
+def _migracao_001_beneficiarios_tipados(conexao: sqlite3.Connection):
+    """Recria `beneficiarios` com colunas tipadas, datas ISO, `codigo`
+    único e sem a coluna "Coluna 1" gerada pela importação."""
+    existe = conexao.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' "
+        "AND name = 'beneficiarios'"
+    ).fetchone()
+    conexao.execute(
+        SQL_CRIAR_BENEFICIARIOS.format(tabela="beneficiarios_tipada")
+    )
+    if existe:
+        cursor = conexao.execute("SELECT * FROM beneficiarios")
+        nomes = [coluna[0] for coluna in cursor.description]
+        descartes: Dict[str, int] = {}
+        codigos_vistos = set()
+        registros = []
+        for linha in cursor:
+            registro = converter_registro(dict(zip(nomes, linha)), descartes)
+            if registro["codigo"] in codigos_vistos:
+                descartes["codigo (duplicado)"] = (
+                    descartes.get("codigo (duplicado)", 0) + 1
+                )
+                registro["codigo"] = None
+            elif registro["codigo"] is not None:
+                codigos_vistos.add(registro["codigo"])
+            registros.append(registro)
+        if "Coluna 1" in nomes:
+            descartes["Coluna 1 (removida)"] = conexao.execute(
+                'SELECT COUNT("Coluna 1") FROM beneficiarios'
+            ).fetchone()[0]
+        inserir_beneficiarios(conexao, registros, "beneficiarios_tipada")
+        conexao.execute("DROP TABLE beneficiarios")
+        logging.info(
+            "Migração 001: %d registro(s) convertidos. Valores descartados "
+            "por coluna: %s", len(registros), descartes or "nenhum"
+        )
+    conexao.execute(
+        "ALTER TABLE beneficiarios_tipada RENAME TO beneficiarios"
+    )
+
+
+def _migracao_002_chave_e_hash_planilha(conexao: sqlite3.Connection):
+    """Adiciona a chave da planilha e o hash do conteúdo de cada linha,
+    usados pela sincronização incremental, e os preenche."""
+    conexao.execute("ALTER TABLE beneficiarios ADD COLUMN chave_planilha TEXT")
+    conexao.execute("ALTER TABLE beneficiarios ADD COLUMN hash_planilha TEXT")
+    conexao.execute(
+        "CREATE UNIQUE INDEX idx_beneficiarios_chave_planilha "
+        "ON beneficiarios (chave_planilha)"
+    )
+    cursor = conexao.execute(
+        f"SELECT id, {', '.join(COLUNAS_TIPADAS)} FROM beneficiarios "
+        "ORDER BY id"
+    )
+    nomes = [coluna[0] for coluna in cursor.description]
+    ocorrencias: Dict[str, int] = {}
+    valores = []
+    for linha in cursor.fetchall():
+        registro = dict(zip(nomes, linha))
+        valores.append((
+            chave_planilha(registro, ocorrencias),
+            hash_registro(registro),
+            registro["id"],
+        ))
+    conexao.executemany(
+        "UPDATE beneficiarios SET chave_planilha = ?, hash_planilha = ? "
+        "WHERE id = ?", valores
+    )
+
+
+MIGRACOES: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "beneficiarios com colunas tipadas",
+     _migracao_001_beneficiarios_tipados),
+    (2, "chave e hash da planilha para sincronização incremental",
+     _migracao_002_chave_e_hash_planilha),
+]
+
+
+def inserir_beneficiarios(
+    conexao: sqlite3.Connection,
+    registros: List[Dict[str, Any]],
+    tabela: str = "beneficiarios"
+):
+    """INSERT de registros já convertidos (sem commit)."""
+    conexao.executemany(
+        f"INSERT INTO {tabela} ({', '.join(COLUNAS_TIPADAS)}) "
+        f"VALUES ({', '.join('?' * len(COLUNAS_TIPADAS))})",
+        [[r.get(c) for c in COLUNAS_TIPADAS] for r in registros]
+    )
+
+
+def versao_esquema(conexao: Optional[sqlite3.Connection] = None) -> int:
+    """Versão do esquema gravada no banco."""
+    conexao = conexao or banco.escrita()
+    return conexao.execute("PRAGMA user_version").fetchone()[0]
+
+
+def aplicar_migracoes(conexao: Optional[sqlite3.Connection] = None) -> int:
+    """Aplica, em ordem, as migrações ainda pendentes e retorna a versão
+    final do esquema. Cada migração é atômica."""
+    conexao = conexao or banco.escrita()
+    versao = versao_esquema(conexao)
+    for numero, descricao, migracao in MIGRACOES:
+        if numero <= versao:
+            continue
+        logging.info("Aplicando migração %03d: %s.", numero, descricao)
+        conexao.execute("BEGIN")
+        try:
+            migracao(conexao)
+            conexao.execute(f"PRAGMA user_version = {numero}")
+            conexao.commit()
+        except BaseException:
+            # Também erros de conversão em Python (ValueError, TypeError...):
+            # o BEGIN não pode ficar aberto na conexão de escrita.
+            conexao.rollback()
+            logging.exception("Migração %03d falhou; desfeita.", numero)
+            raise
+        versao = numero
+    return versao
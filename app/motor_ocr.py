@@ -0,0 +1,324 @@
+"""
+Motor de OCR baseado em pool de processos.
+
+Executa o estágio de CPU de cada documento (ver `app.pipeline_ocr`) em
+processos separados, para que o loop de eventos do uvicorn continue livre
+para atender WebSockets e endpoints `/api/*` enquanto lotes grandes são
+processados. Apenas os dicionários de campos extraídos voltam ao loop.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional
+
+import pytesseract
+
+from app import leitor_tesseract
+from app.pipeline_ocr import (
+    listar_formularios_normalizados,
+    mapear_formularios,
+    processar_documento,
+    reextrair_formulario,
+)
+
+# Quantidade de workers do motor. Por padrão, um por núcleo.
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+# "processos" (padrão) ou "threads" (útil para depuração local).
+OCR_MODO = os.getenv("OCR_MODO", "processos")
+# Intervalo (s) entre health-checks dos workers.
+OCR_INTERVALO_SAUDE = float(os.getenv("OCR_INTERVALO_SAUDE", "60"))
+# Health-checks seguidos sem resposta (e sem nenhum documento concluído
+# entre eles) antes de encerrar os workers à força e recriar o pool.
+OCR_TIMEOUTS_PARA_RECICLAR = int(os.getenv("OCR_TIMEOUTS_PARA_RECICLAR", "3"))
+
+
+def _inicializar_worker(tesseract_cmd: Optional[str]):
+    """Configura o worker (logging e caminho do Tesseract) e já carrega o
+    modelo do idioma, quando o Tesseract nativo estiver disponível."""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    leitor_tesseract.aquecer()
+
+
+def _percentil(valores: List[float], percentil: float) -> float:
+    """Percentil simples (vizinho mais próximo) de uma lista de valores."""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, int(len(ordenados) * percentil))
+    return round(ordenados[indice], 2)
+
+
+class MotorOCR:
+    """Distribui o processamento de documentos entre workers de CPU."""
+
+    def __init__(
+        self,
+        max_workers: int = OCR_WORKERS,
+        modo: str = OCR_MODO,
+        poppler_path: Optional[str] = None,
+        tesseract_cmd: Optional[str] = None
+    ):
+        """Guarda a configuração; o pool só é criado em `iniciar`."""
+        self.max_workers = max(1, max_workers)
+        self.modo = modo
+        self.poppler_path = poppler_path
+        self.tesseract_cmd = tesseract_cmd
+        self._executor: Optional[Executor] = None
+        # Métricas: chamadas em andamento/na fila, latência por documento e
+        # por leitura do Tesseract (ms), reinícios do pool.
+        self._pendentes = 0
+        self._latencias_documento_ms: deque = deque(maxlen=500)
+        self._latencias_ocr_ms: deque = deque(maxlen=2000)
+        self._ocr_nativo: Optional[bool] = None
+        self.reinicios = 0
+        # Detecção de workers travados pelo health-check
+        self._concluidos = 0
+        self._concluidos_no_timeout: Optional[int] = None
+        self._timeouts_seguidos = 0
+
+    def iniciar(self):
+        """Cria o pool de workers, se ainda não existir."""
+        if self._executor is not None:
+            return
+        if self.modo == "threads":
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="ocr",
+                initializer=_inicializar_worker,
+                initargs=(self.tesseract_cmd,)
+            )
+        else:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=_inicializar_worker,
+                initargs=(self.tesseract_cmd,)
+            )
+        logging.info(
+            "Motor de OCR iniciado: %d worker(s) em modo '%s'.",
+            self.max_workers, self.modo
+        )
+
+    def encerrar(self):
+        """Encerra o pool, aguardando os documentos em andamento."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+            logging.info("Motor de OCR encerrado.")
+
+    def _reiniciar(self):
+        """Descarta o pool atual (com workers mortos) e cria outro."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self.reinicios += 1
+        self.iniciar()
+
+    def _reciclar(self):
+        """Encerra à força os processos do pool (workers travados) e cria
+        outro. Em modo threads, as threads travadas não podem ser mortas:
+        o pool novo só passa a receber as próximas chamadas."""
+        executor = self._executor
+        if isinstance(executor, ProcessPoolExecutor):
+            # O executor não tem API pública para matar os processos
+            for processo in list(getattr(executor, "_processes", {}).values()):
+                processo.terminate()
+        self._reiniciar()
+
+    async def _executar(self, funcao: Callable[..., Any], *args: Any) -> Any:
+        """Executa `funcao(*args)` em um worker do pool.
+
+        Os pontos de entrada do pipeline devolvem seus erros como
+        `{"error": ...}`; um BrokenProcessPool aqui significa que um worker
+        morreu (morto pelo sistema, sem memória, falha em biblioteca
+        nativa). O pool é recriado e a chamada é tentada de novo uma única
+        vez. Se a nova tentativa também derrubar o pool, o documento é
+        tratado como a causa: o pool é recriado para os demais e a chamada
+        falha, sem outra tentativa.
+        """
+        self.iniciar()
+        loop = asyncio.get_running_loop()
+        self._pendentes += 1
+        inicio = time.perf_counter()
+        try:
+            for tentativa in (1, 2):
+                executor = self._executor
+                try:
+                    resultado = await loop.run_in_executor(
+                        executor, funcao, *args
+                    )
+                    self._concluidos += 1
+                    return resultado
+                except BrokenProcessPool:
+                    # Só quem percebe primeiro recria o pool
+                    if self._executor is executor:
+                        self._reiniciar()
+                    if tentativa == 2:
+                        logging.error(
+                            "Worker de OCR morreu de novo executando %s; "
+                            "a chamada não será repetida.", funcao.__name__
+                        )
+                        raise RuntimeError(
+                            "O worker de OCR foi encerrado durante o "
+                            "processamento deste documento."
+                        ) from None
+                    logging.error(
+                        "Pool de OCR quebrado. Recriando workers e tentando "
+                        "novamente."
+                    )
+        finally:
+            self._pendentes -= 1
+            self._latencias_documento_ms.append(
+                (time.perf_counter() - inicio) * 1000
+            )
+
+    async def verificar_saude(self, timeout: float = 30.0) -> bool:
+        """Health-check: pede a um worker o estado do seu Tesseract.
+
+        Um pool com worker morto é recriado. Se nenhum worker responder em
+        OCR_TIMEOUTS_PARA_RECICLAR verificações seguidas e nenhum documento
+        for concluído nesse meio-tempo, os workers são considerados
+        travados e o pool é reciclado. Retorna True se um worker respondeu
+        dentro do `timeout`.
+        """
+        self.iniciar()
+        loop = asyncio.get_running_loop()
+        try:
+            estado = await asyncio.wait_for(
+                loop.run_in_executor(self._executor, leitor_tesseract.aquecer),
+                timeout
+            )
+        except BrokenProcessPool:
+            logging.error("Health-check: worker de OCR morto. Reiniciando.")
+            self._reiniciar()
+            return False
+        except asyncio.TimeoutError:
+            if self._concluidos == self._concluidos_no_timeout:
+                self._timeouts_seguidos += 1
+            else:
+                self._timeouts_seguidos = 1
+            self._concluidos_no_timeout = self._concluidos
+            logging.warning(
+                "Health-check: nenhum worker de OCR livre em %.0fs "
+                "(fila: %d, %d timeout(s) seguido(s)).",
+                timeout, self.profundidade_fila(), self._timeouts_seguidos
+            )
+            if self._timeouts_seguidos >= OCR_TIMEOUTS_PARA_RECICLAR:
+                logging.error(
+                    "Health-check: workers de OCR sem progresso em %d "
+                    "verificações. Reciclando o pool.",
+                    self._timeouts_seguidos
+                )
+                self._reciclar()
+                self._timeouts_seguidos = 0
+                self._concluidos_no_timeout = None
+            return False
+        self._timeouts_seguidos = 0
+        self._concluidos_no_timeout = None
+        self._ocr_nativo = estado["nativo"]
+        return True
+
+    async def monitorar(self, intervalo: float = OCR_INTERVALO_SAUDE):
+        """Executa o health-check periodicamente até ser cancelada. Um
+        erro em uma verificação não encerra o monitor."""
+        while True:
+            await asyncio.sleep(intervalo)
+            try:
+                await self.verificar_saude()
+            except Exception:  # pylint: disable=broad-except
+                logging.exception("Health-check do motor de OCR falhou.")
+
+    def profundidade_fila(self) -> int:
+        """Chamadas aguardando um worker livre."""
+        return max(0, self._pendentes - self.max_workers)
+
+    def metricas(self) -> Dict[str, Any]:
+        """Resumo de ocupação e latência do motor."""
+        documentos = list(self._latencias_documento_ms)
+        leituras = list(self._latencias_ocr_ms)
+        return {
+            "workers": self.max_workers,
+            "modo": self.modo,
+            "tesseract_nativo": self._ocr_nativo,
+            "em_andamento": min(self._pendentes, self.max_workers),
+            "profundidade_fila": self.profundidade_fila(),
+            "reinicios": self.reinicios,
+            "latencia_documento_ms": {
+                "p50": _percentil(documentos, 0.5),
+                "p95": _percentil(documentos, 0.95),
+                "amostras": len(documentos),
+            },
+            "latencia_leitura_ocr_ms": {
+                "p50": _percentil(leituras, 0.5),
+                "p95": _percentil(leituras, 0.95),
+                "amostras": len(leituras),
+            },
+        }
+
+    async def processar(
+        self,
+        file_path: str,
+        beneficiario_id: str,
+        pagina_inicial: int = 1,
+        num_paginas: Optional[int] = None,
+        sha256_arquivo: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Processa um documento (ou um formulário dentro de um PDF) em um
+        worker e devolve os campos extraídos."""
+        resultado = await self._executar(
+            processar_documento, file_path, beneficiario_id,
+            self.poppler_path, pagina_inicial, num_paginas, sha256_arquivo
+        )
+        metricas = resultado.get("metricas", {})
+        self._latencias_ocr_ms.extend(metricas.get("latencias_ocr_ms", []))
+        if "ocr_nativo" in metricas:
+            self._ocr_nativo = metricas["ocr_nativo"]
+        return resultado
+
+    async def mapear_formularios(
+        self, file_path: str, beneficiario_id: str
+    ) -> List[Dict[str, int]]:
+        """Detecta, em um worker, os formulários contidos em um arquivo.
+        Levanta RuntimeError se o worker não conseguir ler o arquivo."""
+        resultado = await self._executar(
+            mapear_formularios, file_path, beneficiario_id, self.poppler_path
+        )
+        if isinstance(resultado, dict):
+            raise RuntimeError(resultado.get("error", "Erro desconhecido"))
+        return resultado
+
+    async def reextrair(
+        self,
+        rois_por_pagina: Optional[Dict[int, Any]] = None,
+        shas: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Reextrai os formulários guardados com outras ROIs, distribuindo
+        os formulários entre os workers."""
+        formularios = await asyncio.to_thread(
+            listar_formularios_normalizados, shas
+        )
+        resultados = await asyncio.gather(*[
+            self._executar(reextrair_formulario, formulario, rois_por_pagina)
+            for formulario in formularios
+        ], return_exceptions=True)
+        return [
+            {
+                "sha256": formulario["sha256"],
+                "pagina_inicial": formulario["pagina_inicial"],
+                "error": str(resultado),
+            } if isinstance(resultado, Exception) else resultado
+            for formulario, resultado in zip(formularios, resultados)
+        ]
@@ -0,0 +1,135 @@
+"""
+Padronização dos textos de `beneficiarios` (município, comunidade, técnico e
+status).
+
+`padronizar_texto` tira acentos, passa para maiúsculas e junta espaços
+repetidos; para o status, o valor padronizado volta para a grafia usada pelo
+consolidado ("CONSTRUÍDA"). As mesmas funções são registradas como funções
+SQL, para que a correção do banco seja um único UPDATE (em vez de um por
+valor distinto), e são usadas pela importação da planilha
+(`app.importacao`), para que os dados já entrem padronizados.
+"""
+
+import logging
+import sqlite3
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from unidecode import unidecode
+
+from app.consolidado import STATUS_POR_COLUNA
+
+COLUNAS_PADRONIZADAS = ("municipio", "comunidade", "nome_tecnico", "status")
+
+
+def padronizar_texto(texto: Any) -> Any:
+    """Converte texto para maiúsculas, sem acentos e sem espaços extras."""
+    if not isinstance(texto, str):
+        return texto
+    return " ".join(unidecode(texto).upper().split())
+
+
+_STATUS_CANONICOS = {
+    padronizar_texto(status): status for status in STATUS_POR_COLUNA.values()
+}
+
+
+def padronizar_status(texto: Any) -> Any:
+    """Como `padronizar_texto`, mas mantém a grafia dos status conhecidos
+    ("construida" -> "CONSTRUÍDA")."""
+    padronizado = padronizar_texto(texto)
+    return _STATUS_CANONICOS.get(padronizado, padronizado)
+
+
+# Coluna -> (nome da função SQL, função Python).
+FUNCOES_POR_COLUNA: Dict[str, Tuple[str, Callable[[Any], Any]]] = {
+    "municipio": ("padronizar_texto", padronizar_texto),
+    "comunidade": ("padronizar_texto", padronizar_texto),
+    "nome_tecnico": ("padronizar_texto", padronizar_texto),
+    "status": ("padronizar_status", padronizar_status),
+}
+
+
+def validar_colunas(colunas: Optional[Sequence[str]]) -> Tuple[str, ...]:
+    """Colunas a padronizar (todas por padrão); ValueError se inválidas."""
+    if not colunas:
+        return COLUNAS_PADRONIZADAS
+    invalidas = [c for c in colunas if c not in FUNCOES_POR_COLUNA]
+    if invalidas:
+        raise ValueError(f"Colunas sem padronização: {', '.join(invalidas)}")
+    return tuple(colunas)
+
+
+def padronizar_registro(registro: Dict[str, Any]) -> Dict[str, Any]:
+    """Padroniza as colunas de um registro já convertido (cópia)."""
+    padronizado = dict(registro)
+    for coluna, (_, funcao) in FUNCOES_POR_COLUNA.items():
+        if coluna in padronizado:
+            padronizado[coluna] = funcao(padronizado[coluna])
+    return padronizado
+
+
+def registrar_funcoes(conexao: sqlite3.Connection):
+    """Registra `padronizar_texto` e `padronizar_status` na conexão."""
+    for nome, funcao in dict(FUNCOES_POR_COLUNA.values()).items():
+        conexao.create_function(nome, 1, funcao, deterministic=True)
+
+
+def relatorio(
+    conexao: sqlite3.Connection,
+    colunas: Optional[Sequence[str]] = None
+) -> List[Dict[str, Any]]:
+    """Alterações que a padronização faria, por coluna e valor distinto:
+    [{"coluna", "de", "para", "linhas"}]. Não altera o banco."""
+    registrar_funcoes(conexao)
+    consultas = []
+    for coluna in validar_colunas(colunas):
+        expressao = f"{FUNCOES_POR_COLUNA[coluna][0]}({coluna})"
+        consultas.append(
+            f"SELECT '{coluna}', {coluna}, {expressao}, COUNT(*) "
+            f"FROM beneficiarios WHERE {coluna} IS NOT {expressao} "
+            f"GROUP BY {coluna}"
+        )
+    linhas = conexao.execute(" UNION ALL ".join(consultas)).fetchall()
+    return [
+        {"coluna": linha[0], "de": linha[1], "para": linha[2],
+         "linhas": linha[3]}
+        for linha in linhas
+    ]
+
+
+def aplicar_padronizacao(
+    conexao: sqlite3.Connection,
+    colunas: Optional[Sequence[str]] = None
+) -> int:
+    """Padroniza as colunas com um único UPDATE (sem commit) e retorna o
+    número de linhas alteradas."""
+    registrar_funcoes(conexao)
+    colunas = validar_colunas(colunas)
+    expressoes = {
+        coluna: f"{FUNCOES_POR_COLUNA[coluna][0]}({coluna})"
+        for coluna in colunas
+    }
+    atribuicoes = ", ".join(f"{c} = {e}" for c, e in expressoes.items())
+    condicoes = " OR ".join(f"{c} IS NOT {e}" for c, e in expressoes.items())
+    return conexao.execute(
+        f"UPDATE beneficiarios SET {atribuicoes} WHERE {condicoes}"
+    ).rowcount
+
+
+def padronizar(
+    conexao: sqlite3.Connection,
+    colunas: Optional[Sequence[str]] = None,
+    simular: bool = False
+) -> Tuple[List[Dict[str, Any]], int]:
+    """Gera o relatório e, se não for simulação, aplica a padronização em
+    uma transação. Retorna (relatório, linhas alteradas)."""
+    alteracoes = relatorio(conexao, colunas)
+    if simular or not alteracoes:
+        return alteracoes, 0
+    with conexao:
+        linhas = aplicar_padronizacao(conexao, colunas)
+    logging.info(
+        "Padronização: %d valor(es) distinto(s), %d linha(s) alterada(s).",
+        len(alteracoes), linhas
+    )
+    return alteracoes, linhas
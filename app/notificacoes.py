@@ -0,0 +1,227 @@
+"""
+Envio de eventos de progresso aos navegadores conectados no `/ws`.
+
+Cada conexão assina os lotes que lhe interessam (`{"acao": "assinar",
+"lotes": ["ab12cd34"]}`, ou `"*"` para todos) e só recebe os eventos deles;
+eventos de formulários de um lote dividido (`<lote>-<n>`) vão para quem
+assinou o lote. Os eventos são JSON:
+
+    {"seq": 12, "lote": "ab12cd34-2", "tipo": "progresso",
+     "mensagem": "...", "momento": "2024-05-01T12:00:00"}
+
+Os eventos vêm do barramento (`app.eventos`), cujo despachante chama
+`publicar`: o evento é serializado uma vez e colocado na fila limitada de
+cada conexão interessada, e uma tarefa por conexão faz os envios. Ao
+assinar um lote, o cliente recebe antes os últimos eventos dele que ainda
+estão no buffer do barramento. Se um navegador não acompanhar, os eventos
+de progresso mais antigos da sua fila são descartados (os de erro e
+conclusão são mantidos) e, se um envio demorar mais que
+`TIMEOUT_ENVIO_WS`, a conexão é encerrada. Um navegador lento não atrasa
+mais os demais nem o processamento.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import (
+    Any, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+)
+
+from fastapi import WebSocket
+
+from app.eventos import TIPO_PROGRESSO, Evento, lote_raiz
+
+# Eventos pendentes por conexão antes de descartar progresso antigo.
+TAMANHO_FILA_WS = int(os.getenv("TAMANHO_FILA_WS", "100"))
+TIMEOUT_ENVIO_WS = float(os.getenv("TIMEOUT_ENVIO_WS", "10"))  # s
+TODOS_OS_LOTES = "*"
+# Tipos que podem ser descartados quando a conexão está atrasada.
+TIPOS_DESCARTAVEIS = {TIPO_PROGRESSO}
+
+
+class ConexaoWS:
+    """Uma conexão WebSocket, seus lotes assinados e sua fila de saída."""
+
+    def __init__(self, websocket: WebSocket, tamanho_fila: int):
+        self.websocket = websocket
+        self.lotes: Set[str] = set()
+        self.descartados = 0
+        self.envio_ms = 0.0  # tempo total aguardando send_text
+        self._tamanho_fila = tamanho_fila
+        # (tipo, texto JSON já serializado)
+        self._fila: Deque[Tuple[str, str]] = deque()
+        self._sinal = asyncio.Event()
+        self._tarefa: Optional[asyncio.Task] = None
+
+    def assina(self, lote: Optional[str]) -> bool:
+        """True se a conexão deve receber os eventos de `lote`."""
+        return (
+            TODOS_OS_LOTES in self.lotes
+            or lote is None
+            or lote_raiz(lote) in self.lotes
+        )
+
+    def enfileirar(self, tipo: str, texto: str):
+        """Coloca um evento na fila, sem esperar. Com a fila cheia, descarta
+        o progresso mais antigo (ou, sem nenhum, o evento mais antigo)."""
+        if len(self._fila) >= self._tamanho_fila:
+            for indice, (tipo_antigo, _) in enumerate(self._fila):
+                if tipo_antigo in TIPOS_DESCARTAVEIS:
+                    del self._fila[indice]
+                    break
+            else:
+                self._fila.popleft()
+            self.descartados += 1
+        self._fila.append((tipo, texto))
+        self._sinal.set()
+
+    @property
+    def pendentes(self) -> int:
+        """Eventos aguardando envio."""
+        return len(self._fila)
+
+    def iniciar(self):
+        """Inicia a tarefa de envio desta conexão."""
+        self._tarefa = asyncio.create_task(self._enviar())
+
+    async def _enviar(self):
+        """Envia os eventos da fila, um a um, enquanto a conexão existir."""
+        while True:
+            await self._sinal.wait()
+            self._sinal.clear()
+            while self._fila:
+                _, texto = self._fila.popleft()
+                inicio = time.perf_counter()
+                try:
+                    await asyncio.wait_for(
+                        self.websocket.send_text(texto), TIMEOUT_ENVIO_WS
+                    )
+                    self.envio_ms += (time.perf_counter() - inicio) * 1000
+                except asyncio.TimeoutError:
+                    logging.warning(
+                        "WS: envio para %s passou de %.0fs; encerrando a "
+                        "conexão.", self.websocket.client, TIMEOUT_ENVIO_WS
+                    )
+                    await self._fechar_websocket()
+                    return
+                except (RuntimeError, ConnectionError, OSError) as e_envio:
+                    logging.error(
+                        "Erro ao enviar msg WS para %s: %s",
+                        self.websocket.client, e_envio
+                    )
+                    return
+
+    async def _fechar_websocket(self):
+        """Fecha o WebSocket (cliente lento), ignorando erros."""
+        try:
+            await self.websocket.close(code=1008)
+        except (RuntimeError, ConnectionError, OSError):
+            pass
+
+    def encerrar(self):
+        """Cancela a tarefa de envio."""
+        if self._tarefa is not None:
+            self._tarefa.cancel()
+
+
+class GerenciadorConexoes:
+    """Conexões WebSocket ativas e publicação de eventos por lote."""
+
+    def __init__(
+        self,
+        recentes: Optional[Callable[[str], List[Evento]]] = None,
+        tamanho_fila: int = TAMANHO_FILA_WS
+    ):
+        """`recentes(lote)` devolve os eventos a reenviar quando uma conexão
+        assina o lote (ver `BarramentoEventos.recentes`)."""
+        self.tamanho_fila = tamanho_fila
+        self._recentes = recentes
+        self._conexoes: Dict[WebSocket, ConexaoWS] = {}
+        self._publicados = 0
+        # Totais das conexões já encerradas
+        self._descartados = 0
+        self._envio_ms = 0.0
+
+    async def connect(self, websocket: WebSocket, lotes: Iterable[str] = ()):
+        """Aceita a conexão e inicia sua tarefa de envio."""
+        await websocket.accept()
+        conexao = ConexaoWS(websocket, self.tamanho_fila)
+        conexao.iniciar()
+        self._conexoes[websocket] = conexao
+        self._assinar(conexao, lotes)
+        logging.info("Nova conexão WebSocket estabelecida.")
+
+    def _assinar(
+        self, conexao: ConexaoWS, lotes: Iterable[str], replay: bool = True
+    ):
+        """Assina os lotes e reenvia os eventos recentes de cada um."""
+        for lote in lotes:
+            if lote in conexao.lotes:
+                continue
+            conexao.lotes.add(lote)
+            if replay and self._recentes is not None:
+                for evento in self._recentes(lote):
+                    conexao.enfileirar(
+                        evento["tipo"], json.dumps(evento, ensure_ascii=False)
+                    )
+
+    def disconnect(self, websocket: WebSocket):
+        """Remove a conexão e encerra sua tarefa de envio."""
+        conexao = self._conexoes.pop(websocket, None)
+        if conexao is not None:
+            conexao.encerrar()
+            self._descartados += conexao.descartados
+            self._envio_ms += conexao.envio_ms
+            logging.info("Conexão WebSocket fechada.")
+
+    def tratar_mensagem(self, websocket: WebSocket, texto: str):
+        """Trata um comando do cliente: assinar/cancelar lotes (com
+        `"replay": false`, a assinatura não reenvia eventos anteriores)."""
+        conexao = self._conexoes.get(websocket)
+        try:
+            comando = json.loads(texto)
+            acao = comando["acao"]
+            lotes = comando.get("lotes") or []
+            if isinstance(lotes, str):
+                lotes = [lotes]
+        except (ValueError, KeyError, TypeError, AttributeError):
+            logging.debug("WS: mensagem ignorada de %s.", websocket.client)
+            return
+        if conexao is None:
+            return
+        if acao == "assinar":
+            self._assinar(
+                conexao, [str(lote) for lote in lotes],
+                comando.get("replay", True) is not False
+            )
+        elif acao == "cancelar":
+            conexao.lotes.difference_update(str(lote) for lote in lotes)
+
+    def publicar(self, evento: Evento):
+        """Entrega um evento às filas das conexões que assinam o lote
+        (assinante do barramento de eventos)."""
+        texto = json.dumps(evento, ensure_ascii=False)
+        for conexao in self._conexoes.values():
+            if conexao.assina(evento["lote"]):
+                conexao.enfileirar(evento["tipo"], texto)
+        self._publicados += 1
+
+    def metricas(self) -> Dict[str, Any]:
+        """Conexões, eventos publicados, descartes por cliente lento e
+        tempo total de envio (o que o processamento esperaria se enviasse
+        as mensagens ele mesmo, uma a uma)."""
+        conexoes: List[ConexaoWS] = list(self._conexoes.values())
+        return {
+            "conexoes": len(conexoes),
+            "eventos_publicados": self._publicados,
+            "pendentes": sum(c.pendentes for c in conexoes),
+            "descartados": (
+                self._descartados + sum(c.descartados for c in conexoes)
+            ),
+            "envio_total_ms": round(
+                self._envio_ms + sum(c.envio_ms for c in conexoes), 3
+            ),
+        }
@@ -0,0 +1,1054 @@
+"""
+Estágio de CPU do pipeline de OCR do "AguaqueAlimenta".
+
+Reúne as definições de ROI e as funções síncronas que transformam um arquivo
+enviado (PDF/imagem) nos campos extraídos do formulário: rasterização,
+redimensionamento, correção de perspectiva, recorte das ROIs, binarização e
+OCR. Nada aqui depende do FastAPI ou do loop de eventos, para que o módulo
+possa ser importado e executado dentro dos processos do motor de OCR.
+"""
+
+import os
+import re
+import json
+import hashlib
+import math
+import time
+import logging
+import functools
+from typing import Callable, Dict, Any, Iterator, List, Optional, Tuple
+
+import pytesseract
+from pdf2image import convert_from_path, pdfinfo_from_path  # type: ignore
+from PIL import Image
+
+# Imports para OpenCV
+import cv2
+import numpy as np
+
+from app import depuracao
+from app import leitor_tesseract
+
+# Páginas redimensionadas e com perspectiva corrigida, por hash do documento
+PAGINAS_NORMALIZADAS_FOLDER = "paginas_normalizadas"
+# Retenção das páginas normalizadas (aplicada por `app.retencao`): documentos
+# sem uso há mais desses dias e, acima do limite de bytes, os menos usados
+# são apagados.
+PAGINAS_NORMALIZADAS_DIAS = float(os.getenv("PAGINAS_NORMALIZADAS_DIAS", "30"))
+PAGINAS_NORMALIZADAS_MAX_BYTES = int(
+    os.getenv("PAGINAS_NORMALIZADAS_MAX_BYTES", str(2 * 1024 * 1024 * 1024))
+)
+# Nome das pastas de documentos (SHA-256 em hexadecimal).
+PADRAO_PASTA_NORMALIZADA = r"[0-9a-f]{64}"
+
+# ==============================================================================
+# Informações sobre as Coordenadas das Páginas
+# ==============================================================================
+LARGURA_PADRAO = 1000
+
+# Limites do DPI calculado a partir de LARGURA_PADRAO na rasterização de PDFs.
+# DPI_MAXIMO era o valor fixo usado antes para todas as páginas.
+DPI_MINIMO = 72
+DPI_MAXIMO = 300
+PONTOS_POR_POLEGADA = 72
+
+# Detecção do início de cada formulário em PDFs com vários formulários:
+# as páginas são rasterizadas em baixa resolução e comparadas com o layout
+# de RETANGULO_PRINCIPAL_PAG1_COORDS.
+LARGURA_DETECCAO_LAYOUT = 500
+LIMIAR_LAYOUT_PAGINA1 = 0.6
+
+# OCR em lote: sem o Tesseract nativo (ver app.leitor_tesseract), todas as
+# ROIs de texto de uma página são empilhadas em uma imagem e lidas com uma
+# única chamada do Tesseract (PSM 6: bloco de texto), evitando um processo
+# `tesseract` por campo. Desligue com OCR_EM_LOTE=0.
+OCR_EM_LOTE = os.getenv("OCR_EM_LOTE", "1") == "1"
+CONFIG_OCR_LOTE = r'--oem 3 --psm 6'
+MARGEM_LOTE_OCR = 20
+
+# Parâmetros do adaptiveThreshold aplicado a cada ROI de texto.
+BINARIZACAO_BLOCK_SIZE = 15
+BINARIZACAO_C = 6
+
+# Definições de ROI para a Página 1
+# Estas coordenadas são baseadas na imagem após redimensionamento para
+# LARGURA_PADRAO e, idealmente, após correção de perspectiva.
+# As coordenadas x, y dos campos individuais são, por agora, relativas
+# ao RETANGULO_PRINCIPAL (ou à imagem inteira corrigida se o retângulo
+# principal for x=0, y=0, w=LARGURA_PADRAO, h=altura_dinamica).
+
+# Coordenadas (X, Y, W, H) do retângulo principal de dados na Página 1.
+# PROVISÓRIO: Ajustar APÓS a Etapa 2 (Correção de Perspectiva).
+# Se (x=0, y=0, w=LARGURA_PADRAO, h=altura_dinamica_da_pagina),
+# significa que usaremos a página inteira como área principal inicialmente.
+# 'h' para RETANGULO_PRINCIPAL pode ser atualizado dinamicamente com base
+# na altura da imagem redimensionada, ou você pode definir um valor fixo
+# se o conteúdo principal tiver uma altura fixa e conhecida após correção.
+RETANGULO_PRINCIPAL_PAG1_COORDS = {
+    "x": 2, "y": 2, "w": 962, "h": 1017
+}
+
+ROI_DEFINICOES_PAGINA1 = {
+    "nome_completo_l1": {
+        "x": 190, "y": 52, "w": 760, "h": 39, "tipo": "texto"
+    },
+    "nome_completo_l2": {
+        "x": 13, "y": 84, "w": 502, "h": 39, "tipo": "texto",
+        "condicional": True
+    },
+    "sexo_cb_masc": {
+        # Aguardando as novas coordenadas (x, y) do checkbox "Masc."
+        "x": 0, "y": 0, "w": 22, "h": 22, "tipo": "checkbox",
+        "campo_destino": "sexo", "valor_marcado": "Masculino"
+    },
+    "sexo_cb_fem": {
+        # Aguardando as novas coordenadas (x, y) do checkbox "Fem."
+        "x": 0, "y": 0, "w": 22, "h": 22, "tipo": "checkbox",
+        "campo_destino": "sexo", "valor_marcado": "Feminino"
+    }
+    # Adicionaremos mais campos aqui conforme progredimos
+    # Campos de texto aceitam "psm" para sobrescrever o PSM padrão (7).
+}
+
+# Estrutura para agrupar todas as definições de ROI por página
+TODAS_ROIS_POR_PAGINA = {
+    1: {  # Para a página 1
+        "retangulo_principal": RETANGULO_PRINCIPAL_PAG1_COORDS,
+        "campos": ROI_DEFINICOES_PAGINA1
+    },
+    # 2: { # Para a página 2, quando definirmos
+    #     "retangulo_principal": RETANGULO_PRINCIPAL_PAG2_COORDS,
+    #     "campos": ROI_DEFINICOES_PAGINA2
+    # },
+}
+
+
+# -----------------------------------------------------------------------------
+# ETAPA 1: FUNÇÕES AUXILIARES PARA CARREGAMENTO E PRÉ-PROCESSAMENTO BÁSICO
+# -----------------------------------------------------------------------------
+
+# Converte imagem PIL para OpenCV (BGR) e redimensiona à largura alvo.
+
+
+def _converter_pil_para_cv_e_redimensionar(
+    imagem_pil: Image.Image, largura_alvo: int
+) -> np.ndarray:
+
+    # Converter PIL Image para OpenCV array (RGB)
+    img_cv_rgb = np.array(imagem_pil.convert('RGB'))
+    # Converter RGB para BGR (formato padrão do OpenCV)
+    img_cv_bgr = cv2.cvtColor(img_cv_rgb, cv2.COLOR_RGB2BGR)
+
+    altura_original, largura_original = img_cv_bgr.shape[:2]
+    if largura_original == 0:
+        logging.error("Largura original da imagem é 0. Imagem inválida.")
+        raise ValueError("Imagem com largura original zero.")
+
+    proporcao = largura_alvo / float(largura_original)
+    altura_alvo = int(altura_original * proporcao)
+
+    img_redimensionada = cv2.resize(
+        img_cv_bgr, (largura_alvo, altura_alvo),
+        interpolation=cv2.INTER_AREA  # Bom para reduzir, ok para aumentar
+    )
+    logging.info(
+        f"Imagem redimensionada de {largura_original}x{altura_original} "
+        f"para {largura_alvo}x{altura_alvo}"
+    )
+    return img_redimensionada
+
+
+# Encontra o maior contorno de 4 vértices (o formulário) em uma imagem BGR.
+def _encontrar_contorno_formulario(
+    imagem_cv_bgr: np.ndarray
+) -> Optional[np.ndarray]:
+    # Converte para escala de cinza, aplica desfoque e detecta bordas
+    cinza = cv2.cvtColor(imagem_cv_bgr, cv2.COLOR_BGR2GRAY)
+    desfoque = cv2.GaussianBlur(cinza, (5, 5), 0)
+    bordas = cv2.Canny(desfoque, 75, 200)
+
+    # Encontra os contornos na imagem
+    contornos, _ = cv2.findContours(
+        bordas, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE
+    )
+    # Ordena os contornos por área, do maior para o menor
+    contornos = sorted(contornos, key=cv2.contourArea, reverse=True)[:5]
+
+    # Itera sobre os maiores contornos para encontrar o formulário
+    for c in contornos:
+        # Aproxima o contorno para uma forma com menos vértices
+        perimetro = cv2.arcLength(c, True)
+        aprox = cv2.approxPolyDP(c, 0.02 * perimetro, True)
+
+        # Se a forma aproximada tiver 4 vértices, assumimos que é o formulário
+        if len(aprox) == 4:
+            return aprox
+    return None
+
+
+# Endireita uma imagem de formulário que possa estar em perspectiva.
+def _corrigir_perspectiva(imagem_cv_bgr: np.ndarray) -> np.ndarray:
+    # Para o processamento, uma cópia da imagem é usada
+    imagem_processo = imagem_cv_bgr.copy()
+
+    contorno_tela = _encontrar_contorno_formulario(imagem_processo)
+
+    # Se nenhum contorno de 4 pontos foi encontrado, retorna a imagem original
+    if contorno_tela is None:
+        logging.warning("Não foi possível encontrar contorno de 4 pontos. "
+                        "A correção de perspectiva não será aplicada.")
+        return imagem_cv_bgr
+
+    # --- Ordena os 4 pontos do contorno para uma ordem consistente ---
+    pontos = contorno_tela.reshape(4, 2)
+    pontos_ret = np.zeros((4, 2), dtype="float32")
+
+    soma = pontos.sum(axis=1)
+    pontos_ret[0] = pontos[np.argmin(soma)]  # Canto superior esquerdo
+    pontos_ret[2] = pontos[np.argmax(soma)]  # Canto inferior direito
+
+    diff = np.diff(pontos, axis=1)
+    pontos_ret[1] = pontos[np.argmin(diff)]  # Canto superior direito
+    pontos_ret[3] = pontos[np.argmax(diff)]  # Canto inferior esquerdo
+    # --- Fim da ordenação ---
+
+    (sup_esq, sup_dir, inf_dir, inf_esq) = pontos_ret
+
+    # Calcula a largura da nova imagem "plana"
+    largura_a = np.sqrt(
+        ((inf_dir[0] - inf_esq[0]) ** 2) + ((inf_dir[1] - inf_esq[1]) ** 2))
+    largura_b = np.sqrt(
+        ((sup_dir[0] - sup_esq[0]) ** 2) + ((sup_dir[1] - sup_esq[1]) ** 2))
+    max_largura = max(int(largura_a), int(largura_b))
+
+    # Calcula a altura da nova imagem "plana"
+    altura_a = np.sqrt(
+        ((sup_dir[0] - inf_dir[0]) ** 2) + ((sup_dir[1] - inf_dir[1]) ** 2))
+    altura_b = np.sqrt(
+        ((sup_esq[0] - inf_esq[0]) ** 2) + ((sup_esq[1] - inf_esq[1]) ** 2))
+    max_altura = max(int(altura_a), int(altura_b))
+
+    # Define os pontos de destino para a transformação
+    dst = np.array([
+        [0, 0],
+        [max_largura - 1, 0],
+        [max_largura - 1, max_altura - 1],
+        [0, max_altura - 1]], dtype="float32")
+
+    # Calcula a matriz de transformação de perspectiva e a aplica
+    matriz_transformacao = cv2.getPerspectiveTransform(pontos_ret, dst)
+    imagem_corrigida = cv2.warpPerspective(
+        imagem_processo, matriz_transformacao, (max_largura, max_altura)
+    )
+
+    logging.info("Correção de perspectiva aplicada com sucesso.")
+    return imagem_corrigida
+
+# Aplica pré-processamento OpenCV (escala de cinza, binarização) em imagem
+# OpenCV (BGR) já redimensionada.
+
+
+def _erros_como_resultado(funcao: Callable[..., Any]) -> Callable[..., Any]:
+    """Pontos de entrada dos workers: uma exceção volta como
+    `{"error": "..."}` em vez de ser levantada.
+
+    Exceções levantadas no worker são devolvidas ao processo principal por
+    pickle, e as que não podem ser reconstruídas a partir dos seus args
+    (como `pytesseract.TesseractNotFoundError`) quebram o pool inteiro,
+    derrubando os outros documentos em andamento.
+    """
+    @functools.wraps(funcao)
+    def envolvida(*args: Any, **kwargs: Any) -> Any:
+        try:
+            return funcao(*args, **kwargs)
+        except Exception as e:  # pylint: disable=broad-except
+            logging.exception(
+                "Erro no worker de OCR (%s): %s", funcao.__name__, e
+            )
+            return {"error": str(e) or type(e).__name__}
+    return envolvida
+
+
+def _preprocessar_imagem_para_ocr(
+    img_cv_redimensionada: np.ndarray,
+    beneficiario_id: str,
+    pagina_num: int = 0,
+    nome_campo: Optional[str] = None
+) -> np.ndarray:
+
+    try:
+        logging.info(
+            "[%s] Iniciando pré-processamento OpenCV para página/imagem "
+            "(já redimensionada)...", beneficiario_id
+        )
+
+        img_cinza = cv2.cvtColor(img_cv_redimensionada, cv2.COLOR_BGR2GRAY)
+
+        img_cinza_desfocada = cv2.GaussianBlur(img_cinza, (3, 3), 0)
+
+        # Parâmetros de binarização que você está testando
+        blockSize = BINARIZACAO_BLOCK_SIZE
+        C_val = BINARIZACAO_C
+
+        logging.info(
+            "[%s] Aplicando adaptiveThreshold: blockSize=%s, C=%s, "
+            "ADAPTIVE_THRESH_MEAN_C", beneficiario_id, blockSize, C_val
+        )
+
+        img_binarizada = cv2.adaptiveThreshold(
+            img_cinza_desfocada,
+            255,
+            cv2.ADAPTIVE_THRESH_MEAN_C,
+            cv2.THRESH_BINARY,
+            blockSize,
+            C_val
+        )
+
+        # Artefato de depuração (só em lotes amostrados; gravação em thread)
+        nome_debug = f"opencv_b{blockSize}_C{C_val}_mean"
+        if pagina_num > 0:
+            nome_debug += f"_p{pagina_num}"
+        if nome_campo:
+            nome_debug += f"_{nome_campo}"
+        depuracao.salvar(beneficiario_id, nome_debug, img_binarizada)
+
+        logging.info(
+            "[%s] Pré-processamento OpenCV concluído.", beneficiario_id
+        )
+        return img_binarizada
+
+    except Exception as e_cv:  # pylint: disable=broad-except
+        logging.exception(
+            "[%s] Erro crítico durante o pré-processamento com OpenCV: %s."
+            " Retornando imagem original em escala de cinza (se possível).",
+            beneficiario_id, e_cv
+        )
+        try:
+            return cv2.cvtColor(img_cv_redimensionada, cv2.COLOR_BGR2GRAY)
+        except Exception as e_fallback:
+            logging.error(
+                "[%s] Erro ao converter para cinza no fallback: %s",
+                beneficiario_id, e_fallback
+            )
+            raise e_cv
+
+
+# -----------------------------------------------------------------------------
+# FUNÇÕES PRINCIPAIS DE ORQUESTRAÇÃO DO OCR E PROCESSAMENTO DE ARQUIVO
+# (Esta função será modificada ao longo de várias etapas)
+# -----------------------------------------------------------------------------
+
+def _calcular_dpi_para_largura(largura_pts: float, largura_alvo: int) -> int:
+    """Menor DPI que rasteriza uma página de `largura_pts` pontos com pelo
+    menos `largura_alvo` pixels de largura (limitado a DPI_MAXIMO)."""
+    if largura_pts <= 0:
+        return DPI_MAXIMO
+    dpi = math.ceil(largura_alvo * PONTOS_POR_POLEGADA / largura_pts)
+    return max(DPI_MINIMO, min(DPI_MAXIMO, dpi))
+
+
+def _ler_info_pdf(
+    file_path: str, poppler_path: Optional[str] = None
+) -> Tuple[int, float, float]:
+    """Retorna (total de páginas, largura, altura em pontos) de um PDF."""
+    info = pdfinfo_from_path(file_path, poppler_path=poppler_path)
+    total_paginas = int(info.get("Pages", 0))
+
+    # "Page size" vem no formato "595.276 x 841.89 pts (A4)"
+    medidas = re.findall(r"[\d.]+", str(info.get("Page size", "")))
+    largura_pts = float(medidas[0]) if medidas else 0.0
+    altura_pts = float(medidas[1]) if len(medidas) > 1 else 0.0
+    return total_paginas, largura_pts, altura_pts
+
+
+def _rasterizar_paginas_pdf(
+    file_path: str,
+    paginas: List[int],
+    beneficiario_id: str,
+    poppler_path: Optional[str] = None
+) -> Dict[int, Image.Image]:
+    """
+    Rasteriza apenas as `paginas` pedidas do PDF, no DPI necessário para
+    atingir LARGURA_PADRAO, e registra no log a memória economizada em
+    relação a rasterizar o PDF inteiro a DPI_MAXIMO (e uma estimativa do
+    tempo economizado).
+    """
+    inicio = time.perf_counter()
+    total_paginas, largura_pts, altura_pts = _ler_info_pdf(
+        file_path, poppler_path
+    )
+    dpi = _calcular_dpi_para_largura(largura_pts, LARGURA_PADRAO)
+
+    imagens: Dict[int, Image.Image] = {}
+    for pagina in paginas:
+        if pagina > total_paginas:
+            logging.warning(
+                "[%s] PDF tem %d página(s); página %d ignorada.",
+                beneficiario_id, total_paginas, pagina
+            )
+            continue
+        renderizadas = convert_from_path(
+            file_path, poppler_path=poppler_path, dpi=dpi,
+            first_page=pagina, last_page=pagina
+        )
+        if renderizadas:
+            imagens[pagina] = renderizadas[0]
+
+    tempo_real = time.perf_counter() - inicio
+    bytes_agora = sum(
+        img.width * img.height * len(img.getbands())
+        for img in imagens.values()
+    )
+    # Bitmaps RGB que o código antigo gerava: todas as páginas a
+    # DPI_MAXIMO, com o tamanho de página do pdfinfo (o Poppler arredonda
+    # as dimensões para cima).
+    bytes_antes = total_paginas * 3 * (
+        math.ceil(largura_pts * DPI_MAXIMO / PONTOS_POR_POLEGADA)
+        * math.ceil(altura_pts * DPI_MAXIMO / PONTOS_POR_POLEGADA)
+    )
+    # Tempo antigo não medido: estimado como proporcional aos pixels.
+    tempo_antes_estimado = (
+        tempo_real * bytes_antes / bytes_agora if bytes_agora else tempo_real
+    )
+    logging.info(
+        "[%s] PDF com %d página(s): rasterizada(s) %s a %d DPI em %.2fs. "
+        "Memória %.1f MB (antes %.1f MB, economia %.1f MB). Tempo "
+        "economizado estimado ~%.2fs.",
+        beneficiario_id, total_paginas, sorted(imagens), dpi, tempo_real,
+        bytes_agora / 1e6, bytes_antes / 1e6,
+        (bytes_antes - bytes_agora) / 1e6,
+        tempo_antes_estimado - tempo_real
+    )
+    return imagens
+
+
+def _recortar_area_dados(
+    img_corrigida: np.ndarray,
+    pagina_num: int,
+    rois_por_pagina: Optional[Dict[int, Any]] = None
+) -> np.ndarray:
+    """Recorta a página corrigida para o retângulo principal de dados."""
+    if rois_por_pagina is None:
+        rois_por_pagina = TODAS_ROIS_POR_PAGINA
+
+    # --- Etapa 3: Recorte para o Retângulo Principal de Dados ---
+    imagem_base_para_processar = img_corrigida  # Valor padrão
+    if pagina_num in rois_por_pagina:
+        coords = rois_por_pagina[pagina_num]["retangulo_principal"]
+        x, y, w, h = (coords["x"], coords["y"], coords["w"], coords["h"])
+
+        if h == 0:
+            h = img_corrigida.shape[0] - y
+        if w == 0:
+            w = img_corrigida.shape[1] - x
+
+        imagem_base_para_processar = img_corrigida[y:y+h, x:x+w]
+        logging.info(
+            "Imagem da página %d recortada para a área de dados.",
+            pagina_num
+        )
+    else:
+        logging.warning(
+            "ROI principal não definida para pág %d. Usando imagem "
+            "inteira.",
+            pagina_num
+        )
+    return imagem_base_para_processar
+
+
+def _preparar_pagina(
+    imagem_pil: Image.Image,
+    pagina_num: int,
+    beneficiario_id: str,
+    destino_normalizada: Optional[str] = None
+) -> np.ndarray:
+    """Redimensiona, corrige a perspectiva e recorta a área de dados.
+
+    Se `destino_normalizada` for informado, a página já redimensionada e
+    corrigida (antes do recorte) é guardada ali em PNG, para reextrações
+    com outras ROIs sem repetir Poppler e correção de perspectiva.
+    """
+    # --- Etapa 1: Redimensionamento ---
+    img_redim = _converter_pil_para_cv_e_redimensionar(
+        imagem_pil, LARGURA_PADRAO
+    )
+    # --- Etapa 2: Correção de Perspectiva ---
+    img_corrigida = _corrigir_perspectiva(img_redim)
+
+    if destino_normalizada and os.path.exists(destino_normalizada):
+        # Já guardada: marca como usada, para a retenção apagar primeiro
+        # as menos usadas.
+        try:
+            os.utime(destino_normalizada)
+        except OSError:
+            pass
+    elif destino_normalizada:
+        try:
+            os.makedirs(os.path.dirname(destino_normalizada), exist_ok=True)
+            cv2.imwrite(
+                destino_normalizada, img_corrigida,
+                [cv2.IMWRITE_PNG_COMPRESSION, 3]
+            )
+        except Exception as e:  # pylint: disable=broad-except
+            logging.error(
+                "[%s] Erro ao guardar página normalizada: %s",
+                beneficiario_id, e
+            )
+
+    imagem_base_para_processar = _recortar_area_dados(
+        img_corrigida, pagina_num
+    )
+
+    # Artefato de depuração do recorte (só em lotes amostrados)
+    depuracao.salvar(
+        beneficiario_id, f"recorte_p{pagina_num}", imagem_base_para_processar
+    )
+
+    return imagem_base_para_processar
+
+
+def _executar_ocr_para_arquivo(
+    file_path: str,
+    beneficiario_id: str,
+    poppler_path: Optional[str] = None,
+    pagina_inicial: int = 1,
+    num_paginas: Optional[int] = None,
+    sha256_arquivo: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Prepara as imagens de um arquivo para extração por ROI. Apenas as
+    páginas com entrada em TODAS_ROIS_POR_PAGINA são carregadas; cada uma
+    passa por redimensionamento, correção de perspectiva e recorte.
+    Esta função RETORNA AS IMAGENS PROCESSADAS POR PÁGINA, não o texto.
+
+    Em PDFs com vários formulários, `pagina_inicial` e `num_paginas`
+    delimitam o formulário; as chaves do retorno são sempre relativas ao
+    formulário (1 = primeira página dele). Com `sha256_arquivo`, as
+    páginas normalizadas são guardadas em PAGINAS_NORMALIZADAS_FOLDER.
+    """
+    logging.info(
+        "[%s] Iniciando preparação de imagem para: %s",
+        beneficiario_id, file_path
+    )
+
+    imagens_pil: Dict[int, Image.Image] = {}
+    paginas_necessarias = [
+        p for p in (sorted(TODAS_ROIS_POR_PAGINA) or [1])
+        if num_paginas is None or p <= num_paginas
+    ]
+
+    if file_path.lower().endswith('.pdf'):
+        deslocamento = pagina_inicial - 1
+        renderizadas = _rasterizar_paginas_pdf(
+            file_path, [p + deslocamento for p in paginas_necessarias],
+            beneficiario_id, poppler_path
+        )
+        imagens_pil = {
+            p - deslocamento: img for p, img in renderizadas.items()
+        }
+    elif file_path.lower().endswith(('.jpg', '.jpeg', '.png')):
+        # Uma imagem avulsa é sempre tratada como a página 1
+        imagens_pil = {1: Image.open(file_path)}
+
+    if not imagens_pil:
+        logging.error(
+            "Não foi possível carregar a imagem de %s", file_path)
+        return {
+            "error": "Não foi possível carregar a imagem do arquivo."
+        }
+
+    paginas_processadas = {
+        pagina_num: _preparar_pagina(
+            imagem_pil, pagina_num, beneficiario_id,
+            _caminho_pagina_normalizada(
+                sha256_arquivo, pagina_inicial, pagina_num
+            ) if sha256_arquivo else None
+        )
+        for pagina_num, imagem_pil in imagens_pil.items()
+    }
+
+    # A função agora retorna um dicionário com as imagens prontas para a
+    # extração por ROI
+    logging.info("[%s] Preparação da imagem concluída.", beneficiario_id)
+    return {"paginas_processadas": paginas_processadas}
+
+
+# -----------------------------------------------------------------------------
+# DIVISÃO DE PDFs COM VÁRIOS FORMULÁRIOS
+# -----------------------------------------------------------------------------
+
+def _iterar_paginas_pdf(
+    file_path: str, largura_alvo: int, poppler_path: Optional[str] = None
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """Gera (número, imagem BGR redimensionada) página a página, mantendo
+    apenas uma página em memória por vez."""
+    total_paginas, largura_pts, _ = _ler_info_pdf(file_path, poppler_path)
+    dpi = _calcular_dpi_para_largura(largura_pts, largura_alvo)
+    for pagina in range(1, total_paginas + 1):
+        renderizadas = convert_from_path(
+            file_path, poppler_path=poppler_path, dpi=dpi,
+            first_page=pagina, last_page=pagina
+        )
+        if renderizadas:
+            yield pagina, _converter_pil_para_cv_e_redimensionar(
+                renderizadas[0], largura_alvo
+            )
+
+
+def _pontuar_layout_pagina1(imagem_cv_bgr: np.ndarray) -> float:
+    """
+    Compara o maior quadrilátero da página com RETANGULO_PRINCIPAL_PAG1_COORDS
+    e retorna a interseção sobre união (0 a 1) entre os dois retângulos.
+    """
+    contorno = _encontrar_contorno_formulario(imagem_cv_bgr)
+    if contorno is None:
+        return 0.0
+
+    escala = imagem_cv_bgr.shape[1] / float(LARGURA_PADRAO)
+    ref = RETANGULO_PRINCIPAL_PAG1_COORDS
+    rx, ry = ref["x"] * escala, ref["y"] * escala
+    rw, rh = ref["w"] * escala, ref["h"] * escala
+    x, y, w, h = cv2.boundingRect(contorno)
+
+    inter_w = max(0.0, min(x + w, rx + rw) - max(x, rx))
+    inter_h = max(0.0, min(y + h, ry + rh) - max(y, ry))
+    intersecao = inter_w * inter_h
+    uniao = w * h + rw * rh - intersecao
+    return intersecao / uniao if uniao > 0 else 0.0
+
+
+@_erros_como_resultado
+def mapear_formularios(
+    file_path: str, beneficiario_id: str, poppler_path: Optional[str] = None
+) -> Any:
+    """
+    Percorre o PDF página a página (em baixa resolução) e detecta onde cada
+    formulário começa, pelo layout da página 1. Retorna uma lista de
+    {"pagina_inicial", "num_paginas"}, um item por formulário, ou
+    {"error": "..."} se o arquivo não puder ser lido.
+
+    A primeira página sempre inicia um formulário. Imagens avulsas são um
+    único formulário de uma página.
+    """
+    if not file_path.lower().endswith('.pdf'):
+        return [{"pagina_inicial": 1, "num_paginas": 1}]
+
+    formularios: List[Dict[str, int]] = []
+    for pagina, imagem in _iterar_paginas_pdf(
+        file_path, LARGURA_DETECCAO_LAYOUT, poppler_path
+    ):
+        pontuacao = _pontuar_layout_pagina1(imagem)
+        if not formularios or pontuacao >= LIMIAR_LAYOUT_PAGINA1:
+            formularios.append({"pagina_inicial": pagina, "num_paginas": 1})
+        else:
+            formularios[-1]["num_paginas"] += 1
+        logging.info(
+            "[%s] Página %d: similaridade com a página 1 = %.2f.",
+            beneficiario_id, pagina, pontuacao
+        )
+
+    logging.info(
+        "[%s] %d formulário(s) detectado(s) em %s.",
+        beneficiario_id, len(formularios), file_path
+    )
+    return formularios
+
+
+# -----------------------------------------------------------------------------
+# ETAPA 4: FUNÇÕES AUXILIARES PARA EXTRAÇÃO BASEADA EM ROI
+# -----------------------------------------------------------------------------
+
+# Analisa a imagem de uma ROI de checkbox e retorna True se parecer marcada.
+
+
+def _analisar_checkbox(roi_img_checkbox: np.ndarray) -> bool:
+    """Analisa uma ROI de checkbox para determinar se está marcada.
+
+    Converte a imagem para preto e branco e verifica a proporção de
+    pixels não-brancos. Retorna True se a proporção exceder um limiar.
+    """
+    # Limiar experimental - percentual de pixels "escuros" para
+    # considerar marcado
+    LIMIAR_MARCACAO = 0.15  # 15%
+
+    # Converte para escala de cinza e aplica limiar de Otsu
+    # para criar uma imagem binária (preto e branco)
+    cinza = cv2.cvtColor(roi_img_checkbox, cv2.COLOR_BGR2GRAY)
+    _, binarizada = cv2.threshold(
+        cinza, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU
+    )
+
+    # Conta os pixels brancos (que representam a marcação "X" ou preenchimento)
+    pixels_marcados = cv2.countNonZero(binarizada)
+    total_pixels = roi_img_checkbox.shape[0] * roi_img_checkbox.shape[1]
+
+    if total_pixels == 0:
+        return False
+
+    proporcao_marcada = pixels_marcados / total_pixels
+
+    return proporcao_marcada >= LIMIAR_MARCACAO
+
+
+def _ocr_por_roi(
+    imagens: Dict[str, np.ndarray], psms: Optional[Dict[str, int]] = None
+) -> Dict[str, str]:
+    """OCR de cada ROI em uma leitura separada, com PSM por campo."""
+    psms = psms or {}
+    textos = {}
+    for nome_campo, img_para_ocr in imagens.items():
+        textos[nome_campo] = leitor_tesseract.ler_texto(
+            img_para_ocr,
+            psms.get(nome_campo, leitor_tesseract.PSM_PADRAO)
+        )
+    return textos
+
+
+def _compor_rois_em_imagem(
+    imagens: Dict[str, np.ndarray]
+) -> Tuple[np.ndarray, Dict[str, Tuple[int, int]]]:
+    """
+    Empilha as ROIs binarizadas verticalmente em uma única imagem branca,
+    separadas por MARGEM_LOTE_OCR pixels. Retorna a imagem e a faixa
+    vertical (início, fim) ocupada por cada campo.
+    """
+    largura = max(img.shape[1] for img in imagens.values())
+    altura = sum(img.shape[0] for img in imagens.values()) + (
+        MARGEM_LOTE_OCR * (len(imagens) + 1)
+    )
+    composta = np.full(
+        (altura, largura + 2 * MARGEM_LOTE_OCR), 255, dtype=np.uint8
+    )
+
+    faixas = {}
+    y = MARGEM_LOTE_OCR
+    for nome_campo, img in imagens.items():
+        if img.ndim == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        h, w = img.shape[:2]
+        composta[y:y+h, MARGEM_LOTE_OCR:MARGEM_LOTE_OCR+w] = img
+        faixas[nome_campo] = (y, y + h)
+        y += h + MARGEM_LOTE_OCR
+    return composta, faixas
+
+
+def _ocr_em_lote(imagens: Dict[str, np.ndarray]) -> Dict[str, str]:
+    """
+    OCR de todas as ROIs de uma página em uma única chamada do Tesseract.
+
+    As ROIs são compostas em uma imagem só (ver `_compor_rois_em_imagem`) e
+    cada palavra reconhecida volta para o campo cuja faixa vertical contém
+    o centro da palavra.
+    """
+    imagens = {
+        nome: img for nome, img in imagens.items() if img.size > 0
+    }
+    if not imagens:
+        return {}
+
+    composta, faixas = _compor_rois_em_imagem(imagens)
+    inicio = time.perf_counter()
+    dados_ocr = pytesseract.image_to_data(
+        composta,
+        lang=leitor_tesseract.IDIOMA_OCR,
+        config=CONFIG_OCR_LOTE,
+        output_type=pytesseract.Output.DICT
+    )
+    leitor_tesseract.registrar_latencia(inicio)
+
+    palavras_por_campo: Dict[str, List[Tuple[int, str]]] = {
+        nome: [] for nome in imagens
+    }
+    for i, palavra in enumerate(dados_ocr["text"]):
+        palavra = palavra.strip()
+        if not palavra:
+            continue
+        centro_y = dados_ocr["top"][i] + dados_ocr["height"][i] // 2
+        for nome_campo, (inicio, fim) in faixas.items():
+            if inicio <= centro_y < fim:
+                palavras_por_campo[nome_campo].append(
+                    (dados_ocr["left"][i], palavra)
+                )
+                break
+
+    return {
+        # Cada faixa é uma linha só: ordena as palavras da esquerda para a
+        # direita
+        nome: " ".join(p for _, p in sorted(palavras))
+        for nome, palavras in palavras_por_campo.items()
+    }
+
+
+# Extrai dados de uma imagem processada usando um dicionário de ROIs.
+def _extrair_dados_roi(
+    imagem_processada: np.ndarray,
+    definicoes_rois: Dict[str, Any],
+    beneficiario_id: str
+) -> Dict[str, str]:
+
+    dados_extraidos = {}
+
+    # Processa campos de texto primeiro
+    imagens_texto: Dict[str, np.ndarray] = {}
+    for nome_campo, roi_info in definicoes_rois.items():
+        if roi_info["tipo"] == "texto":
+            x, y, w, h = (roi_info["x"], roi_info["y"],
+                          roi_info["w"], roi_info["h"])
+
+            # Recorta a ROI do campo de texto
+            roi_texto_img = imagem_processada[y:y+h, x:x+w]
+
+            # Pré-processamento específico para OCR na ROI
+            # Usaremos as mesmas configurações do Teste 8B que foram boas
+            imagens_texto[nome_campo] = _preprocessar_imagem_para_ocr(
+                roi_texto_img, beneficiario_id, nome_campo=nome_campo
+            )
+
+    psms = {
+        nome_campo: roi_info["psm"]
+        for nome_campo, roi_info in definicoes_rois.items()
+        if roi_info["tipo"] == "texto" and "psm" in roi_info
+    }
+    if OCR_EM_LOTE and leitor_tesseract.obter_leitor() is None:
+        # Sem o handle nativo, cada leitura abre um processo `tesseract`:
+        # os campos sem PSM próprio são lidos juntos, em uma chamada só.
+        textos = _ocr_em_lote({
+            nome: img for nome, img in imagens_texto.items()
+            if nome not in psms
+        })
+        textos.update(_ocr_por_roi(
+            {nome: imagens_texto[nome] for nome in psms}, psms
+        ))
+        textos = {nome: textos.get(nome, "") for nome in imagens_texto}
+    else:
+        textos = _ocr_por_roi(imagens_texto, psms)
+
+    # Tratamento específico para o nome completo
+    textos_nome = [
+        texto.strip() for nome_campo, texto in textos.items()
+        if nome_campo.startswith("nome_completo")
+    ]
+
+    # Consolida os campos que podem ter múltiplas partes
+    dados_extraidos["nome_completo"] = " ".join(filter(None, textos_nome))
+
+    # Processa checkboxes
+    # Agrupa checkboxes pelo campo_destino para garantir que
+    # apenas um seja escolhido
+    checkboxes_por_campo = {}
+    for nome_campo, roi_info in definicoes_rois.items():
+        if roi_info["tipo"] == "checkbox":
+            campo_destino = roi_info["campo_destino"]
+            if campo_destino not in checkboxes_por_campo:
+                checkboxes_por_campo[campo_destino] = []
+            checkboxes_por_campo[campo_destino].append(roi_info)
+
+    for campo_destino, cbs in checkboxes_por_campo.items():
+        dados_extraidos[campo_destino] = "Não preenchido"  # Valor padrão
+        for cb_info in cbs:
+            x, y, w, h = (cb_info["x"], cb_info["y"],
+                          cb_info["w"], cb_info["h"])
+            roi_cb_img = imagem_processada[y:y+h, x:x+w]
+
+            if _analisar_checkbox(roi_cb_img):
+                dados_extraidos[campo_destino] = cb_info["valor_marcado"]
+                # CORREÇÃO: Argumentos formatados corretamente dentro
+                #  da chamada
+                logging.info(
+                    "[%s] Checkbox para '%s' detectado como marcado. "
+                    "Valor: %s",
+                    beneficiario_id,
+                    campo_destino,
+                    cb_info["valor_marcado"]
+                )
+                break
+    return dados_extraidos
+
+
+def assinatura_pipeline() -> str:
+    """
+    Hash (SHA-256) das definições de ROI e dos parâmetros de
+    pré-processamento e OCR. Muda sempre que algo que afeta o resultado da
+    extração muda, invalidando resultados guardados em cache.
+    """
+    parametros = {
+        "rois": TODAS_ROIS_POR_PAGINA,
+        "largura_padrao": LARGURA_PADRAO,
+        "dpi": [DPI_MINIMO, DPI_MAXIMO],
+        "binarizacao": [BINARIZACAO_BLOCK_SIZE, BINARIZACAO_C],
+        "ocr": [
+            leitor_tesseract.IDIOMA_OCR, leitor_tesseract.OEM_PADRAO,
+            leitor_tesseract.PSM_PADRAO, OCR_EM_LOTE, CONFIG_OCR_LOTE
+        ],
+    }
+    serializado = json.dumps(parametros, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(serializado.encode("utf-8")).hexdigest()
+
+
+# -----------------------------------------------------------------------------
+# PONTO DE ENTRADA DO ESTÁGIO DE CPU (executado nos workers do motor de OCR)
+# -----------------------------------------------------------------------------
+
+@_erros_como_resultado
+def processar_documento(
+    file_path: str,
+    beneficiario_id: str,
+    poppler_path: Optional[str] = None,
+    pagina_inicial: int = 1,
+    num_paginas: Optional[int] = None,
+    sha256_arquivo: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Executa todo o estágio de CPU para um documento (rasterização →
+    redimensionamento → correção de perspectiva → recorte → binarização →
+    OCR) e devolve apenas os campos extraídos, nunca as imagens.
+
+    Retorna {"dados": {...}, "metricas": {...}} em caso de sucesso (as
+    métricas trazem a latência de cada leitura do Tesseract) ou
+    {"error": "..."} se a imagem não puder ser preparada ou o OCR falhar.
+    `pagina_inicial`/`num_paginas` selecionam um formulário dentro de um
+    PDF com vários (ver `mapear_formularios`). `sha256_arquivo` ativa a
+    gravação das páginas normalizadas (ver `reextrair_formularios`).
+    """
+    # Descarta leituras de tarefas anteriores desta thread (reextrações,
+    # documentos interrompidos): as métricas são só deste documento.
+    leitor_tesseract.coletar_latencias()
+    resultado_preparacao = _executar_ocr_para_arquivo(
+        file_path, beneficiario_id, poppler_path,
+        pagina_inicial, num_paginas, sha256_arquivo
+    )
+    if "paginas_processadas" not in resultado_preparacao:
+        return {
+            "error": resultado_preparacao.get("error", "Erro desconhecido")
+        }
+
+    # Cada página carregada é extraída com o seu próprio conjunto de ROIs
+    dados_beneficiario: Dict[str, Any] = {}
+    for pagina_num, imagem in resultado_preparacao[
+            "paginas_processadas"].items():
+        if pagina_num not in TODAS_ROIS_POR_PAGINA:
+            logging.error(
+                "Não há definições de ROI para a página %d.", pagina_num
+            )
+            continue
+        definicoes_da_pagina = TODAS_ROIS_POR_PAGINA[pagina_num]["campos"]
+        dados_beneficiario.update(_extrair_dados_roi(
+            imagem, definicoes_da_pagina, beneficiario_id
+        ))
+
+    return {
+        "dados": dados_beneficiario,
+        "metricas": {
+            "pid": os.getpid(),
+            "ocr_nativo": leitor_tesseract.obter_leitor() is not None,
+            "latencias_ocr_ms": leitor_tesseract.coletar_latencias(),
+        }
+    }
+
+
+# -----------------------------------------------------------------------------
+# REEXTRAÇÃO A PARTIR DAS PÁGINAS NORMALIZADAS (ajuste de ROIs)
+# -----------------------------------------------------------------------------
+
+def _caminho_pagina_normalizada(
+    sha256_arquivo: str, pagina_inicial: int, pagina_num: int
+) -> str:
+    """Caminho do PNG da página `pagina_num` do formulário que começa em
+    `pagina_inicial` no documento `sha256_arquivo`."""
+    return os.path.join(
+        PAGINAS_NORMALIZADAS_FOLDER, sha256_arquivo,
+        f"f{pagina_inicial:04d}_p{pagina_num}.png"
+    )
+
+
+def listar_formularios_normalizados(
+    shas: Optional[List[str]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Lista os formulários com páginas normalizadas guardadas, como
+    {"sha256", "pagina_inicial", "paginas": {pagina_num: caminho}}.
+    """
+    formularios: Dict[Tuple[str, int], Dict[str, Any]] = {}
+    if not os.path.isdir(PAGINAS_NORMALIZADAS_FOLDER):
+        return []
+    for sha in sorted(os.listdir(PAGINAS_NORMALIZADAS_FOLDER)):
+        if shas and sha not in shas:
+            continue
+        pasta = os.path.join(PAGINAS_NORMALIZADAS_FOLDER, sha)
+        for nome in sorted(os.listdir(pasta)):
+            encontrado = re.fullmatch(r"f(\d+)_p(\d+)\.png", nome)
+            if not encontrado:
+                continue
+            pagina_inicial, pagina_num = map(int, encontrado.groups())
+            formulario = formularios.setdefault((sha, pagina_inicial), {
+                "sha256": sha, "pagina_inicial": pagina_inicial, "paginas": {}
+            })
+            formulario["paginas"][pagina_num] = os.path.join(pasta, nome)
+    return list(formularios.values())
+
+
+def reextrair_formulario(
+    formulario: Dict[str, Any],
+    rois_por_pagina: Optional[Dict[int, Any]] = None
+) -> Dict[str, Any]:
+    """Roda apenas o recorte e `_extrair_dados_roi` sobre as páginas
+    normalizadas de um formulário, com as ROIs informadas. Erros voltam
+    no campo "error" (ver `_erros_como_resultado`)."""
+    resultado = _reextrair_formulario(formulario, rois_por_pagina)
+    if "error" in resultado:
+        resultado = {
+            "sha256": formulario["sha256"],
+            "pagina_inicial": formulario["pagina_inicial"],
+            "error": resultado["error"],
+        }
+    return resultado
+
+
+@_erros_como_resultado
+def _reextrair_formulario(
+    formulario: Dict[str, Any],
+    rois_por_pagina: Optional[Dict[int, Any]] = None
+) -> Dict[str, Any]:
+    """Corpo de `reextrair_formulario`."""
+    if rois_por_pagina is None:
+        rois_por_pagina = TODAS_ROIS_POR_PAGINA
+    inicio = time.perf_counter()
+    identificador = f"{formulario['sha256'][:8]}-{formulario['pagina_inicial']}"
+
+    dados: Dict[str, Any] = {}
+    for pagina_num, caminho in sorted(formulario["paginas"].items()):
+        if pagina_num not in rois_por_pagina:
+            continue
+        img_corrigida = cv2.imread(caminho, cv2.IMREAD_COLOR)
+        if img_corrigida is None:
+            logging.error("Página normalizada ilegível: %s", caminho)
+            continue
+        imagem = _recortar_area_dados(
+            img_corrigida, pagina_num, rois_por_pagina
+        )
+        dados.update(_extrair_dados_roi(
+            imagem, rois_por_pagina[pagina_num]["campos"], identificador
+        ))
+
+    return {
+        "sha256": formulario["sha256"],
+        "pagina_inicial": formulario["pagina_inicial"],
+        "dados": dados,
+        "tempo_ms": round((time.perf_counter() - inicio) * 1000, 1),
+    }
+
+
+def reextrair_formularios(
+    rois_por_pagina: Optional[Dict[int, Any]] = None,
+    shas: Optional[List[str]] = None
+) -> List[Dict[str, Any]]:
+    """Reextrai todos os formulários guardados (ou apenas os de `shas`)."""
+    return [
+        reextrair_formulario(formulario, rois_por_pagina)
+        for formulario in listar_formularios_normalizados(shas)
+    ]
+
+
+def normalizar_definicoes_rois(definicoes: Dict[Any, Any]) -> Dict[int, Any]:
+    """Converte as chaves de página vindas de JSON ("1") para int."""
+    return {int(pagina): rois for pagina, rois in definicoes.items()}
@@ -0,0 +1,93 @@
+"""
+Respostas JSON da API: serialização, compressão e cache HTTP.
+
+- `RespostaJSON` serializa com `orjson` quando instalado (opcional), senão
+  com o `json` padrão, como o `JSONResponse`.
+- `configurar_compressao` ativa brotli (pacote opcional `brotli-asgi`, com
+  gzip para clientes sem suporte) ou, sem ele, gzip.
+- ETags fracos (`W/`) são montados a partir da versão dos dados
+  (`app.versoes`/consolidado) e da query string; se o cliente já tiver a
+  versão, a resposta é um 304 sem corpo. São fracos porque o mesmo tag vale
+  para o corpo gzip, brotli ou sem compressão (a codificação é escolhida
+  depois, pelo middleware), e um ETag forte exige bytes idênticos.
+"""
+
+import os
+import hashlib
+from typing import Any, Dict
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+from starlette.middleware.gzip import GZipMiddleware
+
+try:
+    import orjson
+except ImportError:  # Serializador rápido é opcional
+    orjson = None
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:  # Sem brotli, só gzip
+    BrotliMiddleware = None
+
+# Respostas menores que isso não compensam a compressão.
+TAMANHO_MINIMO_COMPRESSAO = int(os.getenv("TAMANHO_MINIMO_COMPRESSAO", "1024"))
+# Sempre revalidar com o servidor (If-None-Match) antes de reusar o cache.
+CACHE_CONTROL = "no-cache"
+
+
+class RespostaJSON(JSONResponse):
+    """JSONResponse serializado com orjson, quando disponível."""
+
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content)
+
+
+def configurar_compressao(app: FastAPI):
+    """Registra o middleware de compressão disponível."""
+    if BrotliMiddleware is not None:
+        app.add_middleware(
+            BrotliMiddleware, minimum_size=TAMANHO_MINIMO_COMPRESSAO
+        )
+    else:
+        app.add_middleware(
+            GZipMiddleware, minimum_size=TAMANHO_MINIMO_COMPRESSAO
+        )
+
+
+def etag(prefixo: str, versao: int, request: Request) -> str:
+    """ETag fraco da versão `versao` dos dados, distinto por query
+    string (filtros, página, campos)."""
+    consulta = "&".join(
+        f"{chave}={valor}"
+        for chave, valor in sorted(request.query_params.multi_items())
+    )
+    resumo = hashlib.sha1(consulta.encode("utf-8")).hexdigest()[:16]
+    return f'W/"{prefixo}-{versao}-{resumo}"'
+
+
+def etag_confere(request: Request, etag_atual: str) -> bool:
+    """True se o If-None-Match do cliente contém `etag_atual` (comparação
+    fraca, como manda o If-None-Match)."""
+    cabecalho = request.headers.get("if-none-match")
+    if not cabecalho:
+        return False
+    if cabecalho.strip() == "*":
+        return True
+    atual = etag_atual.removeprefix("W/")
+    return any(
+        item.strip().removeprefix("W/") == atual
+        for item in cabecalho.split(",")
+    )
+
+
+def cabecalhos_cache(etag_atual: str) -> Dict[str, str]:
+    """Cabeçalhos de cache de uma resposta com ETag."""
+    return {"ETag": etag_atual, "Cache-Control": CACHE_CONTROL}
+
+
+def nao_modificado(etag_atual: str) -> Response:
+    """Resposta 304 (o cliente já tem esta versão)."""
+    return Response(status_code=304, headers=cabecalhos_cache(etag_atual))
@@ -0,0 +1,336 @@
+"""
+Retenção dos arquivos enviados (`uploads/`) e dos prints de erro
+(`prints_erros/`).
+
+Os arquivos de cada lote ficam em `<pasta>/AAAA/MM/DD/<lote>/`, em vez de
+todos no mesmo diretório, para que nenhum diretório acumule centenas de
+milhares de entradas. Políticas:
+
+- `RETENCAO_APAGAR_SUCESSO`: apaga a pasta do lote assim que ele termina
+  sem falhas (o resultado do OCR fica no cache e no histórico).
+- `RETENCAO_DIAS_FALHAS`: lotes com falha (ou de sucesso, com a remoção
+  imediata desligada) são apagados depois desse número de dias.
+- `RETENCAO_MAX_BYTES`: se a pasta ainda passar desse total, os lotes mais
+  antigos são apagados primeiro.
+
+Lotes em processamento nunca são apagados. A varredura (`varrer`) roda
+periodicamente em segundo plano (`monitorar`) e também cobre os arquivos do
+layout antigo (`<lote>_<hex>_<nome>`), soltos na raiz da pasta. Qualquer
+outra coisa na pasta (diretórios fora de `AAAA/MM/DD`, arquivos com outros
+nomes) é ignorada. Os bytes recuperados aparecem no log e em `metricas`.
+
+Com `padrao_entrada`, a pasta não usa o layout por data: cada subpasta da
+raiz cujo nome casa com o padrão é uma entrada (por exemplo,
+`paginas_normalizadas/<sha256>/`), sujeita às mesmas políticas de idade e
+espaço.
+"""
+
+import os
+import re
+import time
+import shutil
+import asyncio
+import datetime
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+RETENCAO_APAGAR_SUCESSO = os.getenv("RETENCAO_APAGAR_SUCESSO", "1") == "1"
+RETENCAO_DIAS_FALHAS = float(os.getenv("RETENCAO_DIAS_FALHAS", "7"))
+RETENCAO_MAX_BYTES = int(
+    os.getenv("RETENCAO_MAX_BYTES", str(5 * 1024 * 1024 * 1024))
+)
+# Intervalo (s) entre varreduras em segundo plano.
+RETENCAO_INTERVALO = float(os.getenv("RETENCAO_INTERVALO", "3600"))
+
+MOTIVO_SUCESSO = "sucesso"
+MOTIVO_IDADE = "idade"
+MOTIVO_ESPACO = "espaco"
+MOTIVO_DESCARTE = "descarte"
+
+# (mtime mais recente, bytes, caminho, lote) de um lote ou arquivo solto
+Entrada = Tuple[float, int, str, str]
+
+# Componentes do layout AAAA/MM/DD e nome dos arquivos do layout antigo
+# (lote e sufixo aleatório em hexadecimal, como gerados pelo `/upload`).
+PADRAO_ANO = re.compile(r"\d{4}")
+PADRAO_MES_DIA = re.compile(r"\d{2}")
+PADRAO_ARQUIVO_ANTIGO = re.compile(r"([0-9a-f]{8})_[0-9a-f]{8}_.+")
+
+
+def _pasta_do_dia(pasta: str, dia: datetime.date) -> str:
+    """`<pasta>/AAAA/MM/DD` da data `dia`."""
+    return os.path.join(
+        pasta, f"{dia:%Y}", f"{dia:%m}", f"{dia:%d}"
+    )
+
+
+def _tamanho_e_mtime(caminho: str) -> Tuple[int, float]:
+    """Soma dos tamanhos e mtime mais recente dos arquivos de uma pasta
+    (o da própria pasta, se estiver vazia)."""
+    total, mtime = 0, None
+    for raiz, _, arquivos in os.walk(caminho):
+        for nome in arquivos:
+            try:
+                info = os.stat(os.path.join(raiz, nome))
+            except FileNotFoundError:
+                continue
+            total += info.st_size
+            mtime = info.st_mtime if mtime is None else max(
+                mtime, info.st_mtime
+            )
+    if mtime is None:
+        mtime = os.stat(caminho).st_mtime
+    return total, mtime
+
+
+class GerenciadorRetencao:
+    """Pastas por data/lote de um diretório e suas políticas de retenção."""
+
+    def __init__(
+        self,
+        pasta: str,
+        apagar_sucesso: bool = RETENCAO_APAGAR_SUCESSO,
+        dias_falhas: float = RETENCAO_DIAS_FALHAS,
+        max_bytes: int = RETENCAO_MAX_BYTES,
+        padrao_entrada: Optional[str] = None
+    ):
+        self.pasta = pasta
+        self.apagar_sucesso = apagar_sucesso
+        self.dias_falhas = dias_falhas
+        self.max_bytes = max_bytes
+        # Nome das subpastas da raiz tratadas como entradas (sem layout por
+        # data); None usa AAAA/MM/DD/<lote>.
+        self.padrao_entrada = (
+            re.compile(padrao_entrada) if padrao_entrada else None
+        )
+        # Lotes em processamento -> pasta do lote
+        self._ativos: Dict[str, str] = {}
+        self._trava = threading.Lock()
+        # Métricas
+        self._removidos: Dict[str, int] = {}
+        self._bytes_recuperados: Dict[str, int] = {}
+        self._ocupacao: Optional[int] = None
+        self._ultima_varredura: Optional[Dict[str, Any]] = None
+
+    def pasta_lote(self, lote: str) -> str:
+        """Cria (se preciso) e retorna a pasta do lote, marcando-o como em
+        processamento."""
+        with self._trava:
+            caminho = self._ativos.get(lote)
+            if caminho is None:
+                caminho = os.path.join(
+                    _pasta_do_dia(self.pasta, datetime.date.today()), lote
+                )
+                self._ativos[lote] = caminho
+        os.makedirs(caminho, exist_ok=True)
+        return caminho
+
+    def _contabilizar(self, motivo: str, bytes_removidos: int):
+        """Soma uma remoção às métricas do motivo."""
+        self._removidos[motivo] = self._removidos.get(motivo, 0) + 1
+        self._bytes_recuperados[motivo] = (
+            self._bytes_recuperados.get(motivo, 0) + bytes_removidos
+        )
+
+    def _apagar(self, caminho: str, motivo: str,
+                tamanho: Optional[int] = None) -> int:
+        """Apaga a pasta (ou arquivo solto) e retorna os bytes liberados."""
+        try:
+            if os.path.isdir(caminho):
+                if tamanho is None:
+                    tamanho, _ = _tamanho_e_mtime(caminho)
+                shutil.rmtree(caminho)
+            else:
+                if tamanho is None:
+                    tamanho = os.path.getsize(caminho)
+                os.remove(caminho)
+        except FileNotFoundError:
+            return 0
+        self._contabilizar(motivo, tamanho)
+        return tamanho
+
+    def remover_lote(self, lote: str, motivo: str = MOTIVO_DESCARTE) -> int:
+        """Apaga a pasta do lote (upload recusado ou concluído)."""
+        with self._trava:
+            caminho = self._ativos.pop(lote, None)
+        if caminho is None:
+            return 0
+        return self._apagar(caminho, motivo)
+
+    def concluir_lote(self, lote: str, sucesso: bool) -> int:
+        """Libera o lote para a varredura; com sucesso (e a política
+        ligada), apaga seus arquivos na hora. Retorna os bytes liberados."""
+        if sucesso and self.apagar_sucesso:
+            liberados = self.remover_lote(lote, MOTIVO_SUCESSO)
+            if liberados:
+                logging.info(
+                    "[%s] Retenção: arquivos do lote apagados em %s "
+                    "(%d bytes).", lote, self.pasta, liberados
+                )
+            return liberados
+        with self._trava:
+            self._ativos.pop(lote, None)
+        return 0
+
+    def _listar_entradas(self) -> List[Entrada]:
+        """Lotes (pastas AAAA/MM/DD/<lote>) e arquivos soltos do layout
+        antigo (`<lote>_<hex>_<nome>`); o resto é ignorado."""
+        entradas: List[Entrada] = []
+        if not os.path.isdir(self.pasta):
+            return entradas
+        if self.padrao_entrada is not None:
+            return self._listar_entradas_por_padrao()
+        for item in os.scandir(self.pasta):
+            if item.is_file():
+                antigo = PADRAO_ARQUIVO_ANTIGO.fullmatch(item.name)
+                if antigo:
+                    info = item.stat()
+                    entradas.append((
+                        info.st_mtime, info.st_size, item.path,
+                        antigo.group(1)
+                    ))
+                continue
+            if not (item.is_dir() and PADRAO_ANO.fullmatch(item.name)):
+                continue
+            for mes in _subpastas(item.path, PADRAO_MES_DIA):
+                for dia in _subpastas(mes, PADRAO_MES_DIA):
+                    for pasta_lote in _subpastas(dia):
+                        try:
+                            tamanho, mtime = _tamanho_e_mtime(pasta_lote)
+                        except FileNotFoundError:
+                            continue
+                        entradas.append((
+                            mtime, tamanho, pasta_lote,
+                            os.path.basename(pasta_lote)
+                        ))
+        return entradas
+
+    def _listar_entradas_por_padrao(self) -> List[Entrada]:
+        """Subpastas da raiz cujo nome casa com `padrao_entrada`."""
+        entradas: List[Entrada] = []
+        for item in os.scandir(self.pasta):
+            if not (item.is_dir()
+                    and self.padrao_entrada.fullmatch(item.name)):
+                continue
+            try:
+                tamanho, mtime = _tamanho_e_mtime(item.path)
+            except FileNotFoundError:
+                continue
+            entradas.append((mtime, tamanho, item.path, item.name))
+        return entradas
+
+    def _podar_pastas_vazias(self):
+        """Remove pastas vazias dentro das pastas gerenciadas (AAAA ou
+        `padrao_entrada`), exceto as de hoje e as de lotes em
+        processamento."""
+        hoje = _pasta_do_dia(self.pasta, datetime.date.today())
+        with self._trava:
+            ativas = set(self._ativos.values())
+        gerenciadas = _subpastas(
+            self.pasta, self.padrao_entrada or PADRAO_ANO
+        )
+        pastas = [
+            raiz for pasta in gerenciadas for raiz, _, _ in os.walk(pasta)
+        ]
+        for raiz in sorted(pastas, reverse=True):
+            if (raiz in ativas
+                    or (hoje + os.sep).startswith(raiz + os.sep)):
+                continue
+            try:
+                os.rmdir(raiz)  # só remove se estiver vazia
+            except OSError:
+                pass
+
+    def varrer(self) -> Dict[str, Any]:
+        """Aplica as políticas de idade e de espaço. Retorna o resultado
+        desta varredura, com os bytes recuperados."""
+        inicio = time.perf_counter()
+        with self._trava:
+            ativos = set(self._ativos)
+        limite_mtime = time.time() - self.dias_falhas * 86400
+        removidos = {MOTIVO_IDADE: 0, MOTIVO_ESPACO: 0}
+        liberados = 0
+
+        restantes = []
+        for mtime, tamanho, caminho, lote in sorted(self._listar_entradas()):
+            if lote not in ativos and mtime < limite_mtime:
+                liberados += self._apagar(caminho, MOTIVO_IDADE, tamanho)
+                removidos[MOTIVO_IDADE] += 1
+            else:
+                restantes.append((tamanho, caminho, lote))
+
+        total = sum(tamanho for tamanho, _, _ in restantes)
+        for tamanho, caminho, lote in restantes:
+            if total <= self.max_bytes:
+                break
+            if lote in ativos:
+                continue
+            liberados += self._apagar(caminho, MOTIVO_ESPACO, tamanho)
+            removidos[MOTIVO_ESPACO] += 1
+            total -= tamanho
+
+        self._podar_pastas_vazias()
+        self._ocupacao = total
+        resultado = {
+            "pasta": self.pasta,
+            "removidos": removidos,
+            "bytes_recuperados": liberados,
+            "bytes_ocupados": total,
+            "duracao_ms": round((time.perf_counter() - inicio) * 1000, 1),
+            "momento": datetime.datetime.now().isoformat(timespec="seconds"),
+        }
+        self._ultima_varredura = resultado
+        logging.info(
+            "Retenção de %s: %d lote(s) vencido(s) e %d por espaço "
+            "removido(s), %d bytes recuperados, %d bytes ocupados.",
+            self.pasta, removidos[MOTIVO_IDADE], removidos[MOTIVO_ESPACO],
+            liberados, total
+        )
+        return resultado
+
+    async def monitorar(self, intervalo: float = RETENCAO_INTERVALO):
+        """Executa a varredura periodicamente (em uma thread) até ser
+        cancelada. A primeira roda logo ao iniciar."""
+        while True:
+            try:
+                await asyncio.to_thread(self.varrer)
+            except OSError as e:
+                logging.error("Erro na retenção de %s: %s", self.pasta, e)
+            await asyncio.sleep(intervalo)
+
+    def metricas(self) -> Dict[str, Any]:
+        """Políticas, lotes em processamento e bytes recuperados por
+        motivo desde o início."""
+        with self._trava:
+            em_processamento = len(self._ativos)
+        return {
+            "pasta": self.pasta,
+            "apagar_sucesso": self.apagar_sucesso,
+            "dias_falhas": self.dias_falhas,
+            "max_bytes": self.max_bytes,
+            "padrao_entrada": (
+                self.padrao_entrada.pattern if self.padrao_entrada else None
+            ),
+            "lotes_em_processamento": em_processamento,
+            "bytes_ocupados": self._ocupacao,
+            "removidos": dict(self._removidos),
+            "bytes_recuperados": dict(self._bytes_recuperados),
+            "bytes_recuperados_total": sum(self._bytes_recuperados.values()),
+            "ultima_varredura": self._ultima_varredura,
+        }
+
+
+def _subpastas(
+    caminho: str, padrao: Optional[re.Pattern] = None
+) -> List[str]:
+    """Subpastas imediatas de `caminho` (só as de nome que casa com
+    `padrao`, se informado)."""
+    try:
+        return [
+            item.path for item in os.scandir(caminho)
+            if item.is_dir()
+            and (padrao is None or padrao.fullmatch(item.name))
+        ]
+    except FileNotFoundError:
+        return []
@@ -0,0 +1,221 @@
+"""
+Sincronização incremental da planilha com a tabela `beneficiarios`.
+
+Cada linha da planilha tem uma chave estável (`chave_planilha`, ver
+`app.migracoes.chave_planilha`) e um hash do conteúdo (`hash_planilha`). Só
+as linhas novas ou com hash diferente são gravadas (upsert pela chave) e as
+linhas que sumiram da planilha são removidas; as demais não são tocadas.
+Colunas que não vêm da planilha (enriquecimento local) são preservadas. As
+linhas são processadas em lotes de `TAMANHO_LOTE_SYNC`, cada um em sua
+transação, para não bloquear os leitores por muito tempo nem guardar a
+planilha inteira em memória. O que precisa valer entre lotes (chaves já
+vistas, repetições de cada chave e códigos já usados) fica em tabelas
+temporárias da conexão e é consultado só para as linhas do lote.
+"""
+
+import json
+import logging
+import sqlite3
+from typing import Any, Dict, Iterable, List, Tuple
+
+from app.migracoes import (
+    COLUNAS_TIPADAS, chave_base_planilha, chave_planilha, hash_registro
+)
+
+TAMANHO_LOTE_SYNC = 500
+# Tabelas temporárias (da conexão): chaves lidas da planilha, quantas vezes
+# cada chave base já apareceu e códigos já usados.
+TABELA_CHAVES_VISTAS = "sync_chaves_vistas"
+TABELA_OCORRENCIAS = "sync_ocorrencias"
+TABELA_CODIGOS_VISTOS = "sync_codigos_vistos"
+
+
+def _upsert_sql() -> str:
+    """INSERT ... ON CONFLICT(chave_planilha) que só atualiza as colunas
+    vindas da planilha."""
+    colunas = COLUNAS_TIPADAS + ("chave_planilha", "hash_planilha")
+    atualizacoes = ", ".join(
+        f"{c} = excluded.{c}" for c in colunas if c != "chave_planilha"
+    )
+    return (
+        f"INSERT INTO beneficiarios ({', '.join(colunas)}) "
+        f"VALUES ({', '.join('?' * len(colunas))}) "
+        f"ON CONFLICT (chave_planilha) DO UPDATE SET {atualizacoes}"
+    )
+
+
+def _hashes_atuais(
+    conexao: sqlite3.Connection, chaves: List[str]
+) -> Dict[str, str]:
+    """Hash gravado de cada chave do lote que já existe na tabela."""
+    return dict(conexao.execute(
+        "SELECT chave_planilha, hash_planilha FROM beneficiarios "
+        "WHERE chave_planilha IN (SELECT value FROM json_each(?))",
+        (json.dumps(chaves),)
+    ).fetchall())
+
+
+def _consultar_lote(
+    conexao: sqlite3.Connection, sql: str, valores: Iterable[Any]
+) -> List[Tuple[Any, ...]]:
+    """Executa `sql` com os valores do lote em `json_each(?)`."""
+    return conexao.execute(sql, (json.dumps(list(valores)),)).fetchall()
+
+
+def _chaves_do_lote(
+    conexao: sqlite3.Connection,
+    registros: List[Dict[str, Any]],
+    contagens: Dict[str, int]
+) -> List[Tuple[str, str, Dict[str, Any]]]:
+    """(chave, hash, registro) das linhas do lote, na ordem da planilha.
+
+    Códigos repetidos e o contador de repetições de cada chave continuam a
+    contagem dos lotes anteriores (tabelas temporárias); só as entradas do
+    lote são carregadas em memória.
+    """
+    codigos_vistos = {linha[0] for linha in _consultar_lote(
+        conexao,
+        f"SELECT codigo FROM {TABELA_CODIGOS_VISTOS} "
+        "WHERE codigo IN (SELECT value FROM json_each(?))",
+        {r["codigo"] for r in registros if r.get("codigo")}
+    )}
+    novos_codigos = []
+    convertidos = []
+    for registro in registros:
+        if registro.get("codigo") in codigos_vistos:
+            # `codigo` é único na tabela; a repetição fica só com a chave.
+            registro = dict(registro, codigo=None)
+        elif registro.get("codigo"):
+            codigos_vistos.add(registro["codigo"])
+            novos_codigos.append((registro["codigo"],))
+        convertidos.append(registro)
+
+    bases = {chave_base_planilha(r) for r in convertidos} - {None}
+    ocorrencias: Dict[str, int] = dict(_consultar_lote(
+        conexao,
+        f"SELECT chave, vezes FROM {TABELA_OCORRENCIAS} "
+        "WHERE chave IN (SELECT value FROM json_each(?))",
+        bases
+    ))
+    lote = []
+    for registro in convertidos:
+        chave = chave_planilha(registro, ocorrencias)
+        if chave is None:
+            contagens["sem_chave"] += 1
+            continue
+        lote.append((chave, hash_registro(registro), registro))
+
+    conexao.executemany(
+        f"INSERT INTO {TABELA_CODIGOS_VISTOS} (codigo) VALUES (?)",
+        novos_codigos
+    )
+    conexao.executemany(
+        f"INSERT OR REPLACE INTO {TABELA_OCORRENCIAS} (chave, vezes) "
+        "VALUES (?, ?)", [(base, ocorrencias[base]) for base in bases]
+    )
+    return lote
+
+
+def _gravar_lote(
+    conexao: sqlite3.Connection,
+    registros: List[Dict[str, Any]],
+    contagens: Dict[str, int]
+):
+    """Grava, em uma transação, as linhas novas ou alteradas do lote e
+    anota as chaves vistas."""
+    with conexao:
+        lote = _chaves_do_lote(conexao, registros, contagens)
+        conexao.executemany(
+            f"INSERT OR IGNORE INTO {TABELA_CHAVES_VISTAS} (chave) "
+            "VALUES (?)", [(chave,) for chave, _, _ in lote]
+        )
+        hashes = _hashes_atuais(conexao, [chave for chave, _, _ in lote])
+        alteradas = []
+        for chave, hash_linha, registro in lote:
+            if chave not in hashes:
+                contagens["inseridos"] += 1
+            elif hashes[chave] != hash_linha:
+                contagens["atualizados"] += 1
+            else:
+                contagens["inalterados"] += 1
+                continue
+            alteradas.append(
+                [registro.get(c) for c in COLUNAS_TIPADAS]
+                + [chave, hash_linha]
+            )
+        conexao.executemany(_upsert_sql(), alteradas)
+
+
+def _remover_ausentes(conexao: sqlite3.Connection, tamanho_lote: int) -> int:
+    """Apaga, em lotes, as linhas cuja chave não veio na planilha."""
+    removidos = 0
+    while True:
+        with conexao:
+            apagados = conexao.execute(
+                "DELETE FROM beneficiarios WHERE id IN ("
+                "SELECT id FROM beneficiarios "
+                "WHERE chave_planilha IS NOT NULL AND chave_planilha NOT IN "
+                f"(SELECT chave FROM {TABELA_CHAVES_VISTAS}) LIMIT ?)",
+                (tamanho_lote,)
+            ).rowcount
+        removidos += apagados
+        if apagados < tamanho_lote:
+            return removidos
+
+
+def sincronizar(
+    conexao: sqlite3.Connection,
+    registros: Iterable[Dict[str, Any]],
+    remover_ausentes: bool = True,
+    tamanho_lote: int = TAMANHO_LOTE_SYNC
+) -> Dict[str, int]:
+    """Sincroniza `registros` (já convertidos por
+    `migracoes.converter_registro` ou `importacao.converter_bloco`) com a
+    tabela e retorna as contagens.
+
+    `registros` pode ser um gerador: só um lote fica em memória, e os
+    hashes, códigos e repetições de chave são consultados lote a lote. Se
+    a planilha vier vazia, nada é removido (provável falha de leitura).
+    """
+    contagens = {
+        "lidos": 0, "inseridos": 0, "atualizados": 0, "inalterados": 0,
+        "removidos": 0, "sem_chave": 0,
+    }
+    conexao.execute(
+        f"CREATE TEMP TABLE IF NOT EXISTS {TABELA_CHAVES_VISTAS} "
+        "(chave TEXT PRIMARY KEY) WITHOUT ROWID"
+    )
+    conexao.execute(
+        f"CREATE TEMP TABLE IF NOT EXISTS {TABELA_OCORRENCIAS} "
+        "(chave TEXT PRIMARY KEY, vezes INTEGER NOT NULL) WITHOUT ROWID"
+    )
+    conexao.execute(
+        f"CREATE TEMP TABLE IF NOT EXISTS {TABELA_CODIGOS_VISTOS} "
+        "(codigo TEXT PRIMARY KEY) WITHOUT ROWID"
+    )
+    with conexao:
+        for tabela in (TABELA_CHAVES_VISTAS, TABELA_OCORRENCIAS,
+                       TABELA_CODIGOS_VISTOS):
+            conexao.execute(f"DELETE FROM {tabela}")
+    lote: List[Dict[str, Any]] = []
+
+    for registro in registros:
+        contagens["lidos"] += 1
+        lote.append(registro)
+        if len(lote) >= tamanho_lote:
+            _gravar_lote(conexao, lote, contagens)
+            lote = []
+    if lote:
+        _gravar_lote(conexao, lote, contagens)
+
+    vistas = contagens["lidos"] - contagens["sem_chave"]
+    if remover_ausentes and not vistas:
+        logging.warning(
+            "Sincronização: planilha sem linhas válidas; nenhum registro "
+            "removido."
+        )
+    elif remover_ausentes:
+        contagens["removidos"] = _remover_ausentes(conexao, tamanho_lote)
+
+    logging.info("Sincronização concluída: %s", contagens)
+    return contagens
@@ -9,9 +9,42 @@ document.addEventListener("DOMContentLoaded", () => {
 
     // Inicializamos a tabela diretamente, passando a URL da nossa API
     dataTable = $('#tabela').DataTable({
-        "ajax": {
-            "url": API_URL,       // Pede os dados para o nosso back-end
-            "dataSrc": ""         // Indica que os dados são um array na raiz do JSON
+        // Paginação, ordenação e busca são feitas no servidor: cada página
+        // pede só os registros que vai exibir.
+        "serverSide": true,
+        "ajax": function (data, callback) {
+            const params = new URLSearchParams({
+                limite: data.length,
+                offset: data.start
+            });
+            if (data.order.length) {
+                params.set('ordenar', data.columns[data.order[0].column].data);
+                params.set('direcao', data.order[0].dir);
+            }
+            if (data.search.value) {
+                params.set('busca', data.search.value);
+            }
+            data.columns.forEach(coluna => {
+                if (coluna.search.value) {
+                    params.set('busca', coluna.search.value);
+                    params.set('coluna_busca', coluna.data);
+                }
+            });
+            fetch(`${API_URL}?${params}`)
+                .then(async response => {
+                    const registros = response.ok ? await response.json() : [];
+                    const total = parseInt(response.headers.get('X-Total-Count') || '0', 10);
+                    callback({
+                        draw: data.draw,
+                        recordsTotal: total,
+                        recordsFiltered: total,
+                        data: registros
+                    });
+                })
+                .catch(error => {
+                    console.error('Erro ao buscar beneficiários:', error);
+                    callback({ draw: data.draw, recordsTotal: 0, recordsFiltered: 0, data: [] });
+                });
         },
         "columns": [
             // Mapeia cada coluna para a chave correspondente no JSON que o FastAPI envia.
@@ -32,7 +65,16 @@ document.addEventListener("DOMContentLoaded", () => {
             { "data": "comunidade" },
             { "data": "latitude" },
             { "data": "longitude" },
-            { "data": "data_atividade" },
+            { "data": "data_atividade",
+              // A data vem do banco em AAAA-MM-DD; exibimos DD/MM/AAAA.
+              "render": function(data, type, row) {
+                  if (type === 'display' && data && /^\d{4}-\d{2}-\d{2}$/.test(data)) {
+                      const [ano, mes, dia] = data.split('-');
+                      return `${dia}/${mes}/${ano}`;
+                  }
+                  return data;
+              }
+            },
             { "data": "nome_familiar" },
             { "data": "cpf_familiar",
               // Bônus: Aplicando a formatação de CPF que discutimos!
@@ -0,0 +1,94 @@
+// js/mapa.js
+
+// API de pontos do mapa (GeoJSON por área visível)
+const API_MAPA_URL = '/api/mapa';
+
+// Centro inicial: municípios atendidos (BA/PE)
+const CENTRO_INICIAL = [-9.2, -38.8];
+const ZOOM_INICIAL = 9;
+
+const CORES_STATUS = {
+    'CADASTRADO': '#198754',
+    'EM CADASTRO': '#ffc107',
+    'A CONSTRUIR': '#0d6efd',
+    'CONSTRUÍDA': '#6f42c1'
+};
+
+let mapa;
+let camadaPontos;
+let controladorRequisicao = null;
+
+document.addEventListener("DOMContentLoaded", () => {
+    mapa = L.map('mapa').setView(CENTRO_INICIAL, ZOOM_INICIAL);
+    L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
+        maxZoom: 19,
+        attribution: '&copy; OpenStreetMap'
+    }).addTo(mapa);
+    camadaPontos = L.geoJSON(null, {
+        pointToLayer: criarMarcador,
+        onEachFeature: (feature, camada) => {
+            if (feature.id !== undefined) {
+                camada.bindPopup(`#${feature.id} - ${feature.properties.status || 'Sem status'}`);
+            }
+        }
+    }).addTo(mapa);
+
+    // Recarrega só a área visível a cada movimento/zoom
+    mapa.on('moveend', carregarPontos);
+    document.getElementById('filtro-status').addEventListener('change', carregarPontos);
+    carregarPontos();
+});
+
+function criarMarcador(feature, latlng) {
+    const quantidade = feature.properties.quantidade;
+    if (quantidade) {
+        // Grupo de pontos: círculo com a quantidade
+        const tamanho = 24 + Math.min(24, Math.round(Math.log2(quantidade) * 4));
+        return L.marker(latlng, {
+            icon: L.divIcon({
+                html: `<span>${quantidade}</span>`,
+                className: 'marcador-grupo',
+                iconSize: [tamanho, tamanho]
+            })
+        }).on('click', () => mapa.setView(latlng, mapa.getZoom() + 2));
+    }
+    return L.circleMarker(latlng, {
+        radius: 6,
+        color: CORES_STATUS[feature.properties.status] || '#6c757d',
+        fillOpacity: 0.8
+    });
+}
+
+async function carregarPontos() {
+    // Cancela a requisição anterior se o usuário continuar navegando
+    if (controladorRequisicao) {
+        controladorRequisicao.abort();
+    }
+    controladorRequisicao = new AbortController();
+
+    const parametros = new URLSearchParams({
+        bbox: mapa.getBounds().toBBoxString(),
+        zoom: mapa.getZoom()
+    });
+    const status = document.getElementById('filtro-status').value;
+    if (status) {
+        parametros.set('status', status);
+    }
+
+    try {
+        const response = await fetch(`${API_MAPA_URL}?${parametros}`, {
+            signal: controladorRequisicao.signal
+        });
+        if (!response.ok) {
+            throw new Error(`Erro na API: ${response.status}`);
+        }
+        const dados = await response.json();
+        camadaPontos.clearLayers();
+        camadaPontos.addData(dados);
+        document.getElementById('total-pontos').textContent = dados.total;
+    } catch (error) {
+        if (error.name !== 'AbortError') {
+            console.error("Erro ao carregar os pontos do mapa:", error);
+        }
+    }
+}
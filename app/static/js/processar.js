@@ -131,6 +131,8 @@ document.addEventListener("DOMContentLoaded", () => {
             let successMsg = result.message || "Arquivos enviados com sucesso.";
             if (result.beneficiario_id) {
                 successMsg += ` ID do Lote: ${result.beneficiario_id}. Aguardando processamento...`;
+                // Passa a receber os eventos deste lote pelo WebSocket
+                assinarLote(result.beneficiario_id);
             }
             atualizarStatus(successMsg);
             
@@ -161,17 +163,31 @@ document.addEventListener("DOMContentLoaded", () => {
 
     const ws = new WebSocket(wsUrl);
 
+    // Lotes enviados nesta página (reassinados se a conexão abrir depois)
+    const lotesAssinados = new Set();
+
+    function assinarLote(lote) {
+        lotesAssinados.add(lote);
+        if (ws.readyState === WebSocket.OPEN) {
+            ws.send(JSON.stringify({ acao: 'assinar', lotes: [lote] }));
+        }
+    }
+
     ws.onopen = () => {
         atualizarStatus('Conectado ao servidor para status em tempo real...');
+        if (lotesAssinados.size) {
+            ws.send(JSON.stringify({ acao: 'assinar', lotes: [...lotesAssinados] }));
+        }
     };
 
     ws.onmessage = (event) => {
-        const msg = event.data;
-        atualizarStatus(msg);
+        // Eventos JSON: {seq, lote, tipo, mensagem, momento}
+        const evento = JSON.parse(event.data);
+        atualizarStatus(`[${evento.lote}] ${evento.mensagem}`);
 
-        // Se receber 'concluído' no final da mensagem de status, recarrega histórico
-        if (msg.toLowerCase().includes('concluído.')) { 
-            setTimeout(carregarHistorico, 1000); // Pequeno delay para garantir que o JSON foi escrito
+        // Lote concluído: recarrega o histórico
+        if (evento.tipo === 'concluido') {
+            setTimeout(carregarHistorico, 1000);
         }
     };
 
@@ -0,0 +1,67 @@
+"""
+Contadores de versão dos dados do `agendha.db`, usados nos ETags da API.
+
+A tabela `versao_dados` tem uma linha por conjunto de dados (`beneficiarios`,
+`historico`); triggers incrementam a versão a cada INSERT, UPDATE ou DELETE
+na tabela correspondente, venha a escrita da API ou de um script. O
+consolidado por município (`app.consolidado`) usa a versão de
+`beneficiarios`. A versão inicial parte do relógio, para que um banco
+recriado não repita ETags antigos.
+"""
+
+import time
+import sqlite3
+from typing import Dict
+
+from app.banco import banco
+
+TABELA_VERSOES = "versao_dados"
+TABELAS_VERSIONADAS = ("beneficiarios", "historico")
+
+
+def preparar_versoes():
+    """Cria a tabela de versões e os triggers das tabelas versionadas."""
+    inicial = int(time.time() * 1000)
+    conexao = banco.escrita()
+    with conexao:
+        conexao.execute(
+            f"CREATE TABLE IF NOT EXISTS {TABELA_VERSOES} ("
+            "nome TEXT PRIMARY KEY, versao INTEGER NOT NULL)"
+        )
+        for tabela in TABELAS_VERSIONADAS:
+            conexao.execute(
+                f"INSERT OR IGNORE INTO {TABELA_VERSOES} (nome, versao) "
+                "VALUES (?, ?)", (tabela, inicial)
+            )
+            for sufixo, evento in (("ai", "INSERT"), ("ad", "DELETE"),
+                                   ("au", "UPDATE")):
+                conexao.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS "
+                    f"{TABELA_VERSOES}_{tabela}_{sufixo} "
+                    f"AFTER {evento} ON {tabela} BEGIN "
+                    f"UPDATE {TABELA_VERSOES} SET versao = versao + 1 "
+                    f"WHERE nome = '{tabela}'; END"
+                )
+
+
+def incrementar(conexao: sqlite3.Connection, nome: str):
+    """Nova versão de `nome` para uma mudança que os triggers não veem
+    (sem commit)."""
+    conexao.execute(
+        f"UPDATE {TABELA_VERSOES} SET versao = versao + 1 WHERE nome = ?",
+        (nome,)
+    )
+
+
+def versao(nome: str) -> int:
+    """Versão atual do conjunto de dados `nome`."""
+    return banco.leitura().execute(
+        f"SELECT versao FROM {TABELA_VERSOES} WHERE nome = ?", (nome,)
+    ).fetchone()[0]
+
+
+def versoes() -> Dict[str, int]:
+    """Versão de todos os conjuntos de dados."""
+    return dict(banco.leitura().execute(
+        f"SELECT nome, versao FROM {TABELA_VERSOES}"
+    ).fetchall())
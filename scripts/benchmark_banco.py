@@ -0,0 +1,93 @@
+# scripts/benchmark_banco.py
+"""
+Teste de carga das consultas da API ao `agendha.db`: compara o acesso
+antigo (uma conexão nova, com pragmas padrão, por requisição) com a camada
+`app.banco` (conexões somente-leitura por thread, WAL e pragmas de leitura).
+
+Cada "requisição" é uma página de /api/beneficiarios seguida do consolidado
+do dashboard, executadas por várias threads ao mesmo tempo.
+
+Uso (a partir da raiz do projeto):
+    python scripts/benchmark_banco.py [threads] [segundos]
+"""
+import sys
+import time
+import sqlite3
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import beneficiarios, consolidado, versoes  # noqa: E402
+from app.banco import banco  # noqa: E402
+
+# --- CONFIGURAÇÕES ---
+THREADS_PADRAO = 8
+SEGUNDOS_PADRAO = 5
+TAMANHO_PAGINA = 25
+
+
+def requisicao_antiga():
+    """Como os endpoints faziam: conecta, consulta e fecha."""
+    conexao = sqlite3.connect(banco.db_path)
+    conexao.row_factory = sqlite3.Row
+    try:
+        [dict(r) for r in conexao.execute(
+            "SELECT * FROM beneficiarios LIMIT ?", (TAMANHO_PAGINA,)
+        )]
+        [dict(r) for r in conexao.execute(consolidado.CONSULTA_AO_VIVO)]
+    finally:
+        conexao.close()
+
+
+def requisicao_nova():
+    """Pelos módulos da API, com as conexões de `app.banco`."""
+    beneficiarios.consultar(limite=TAMANHO_PAGINA)
+    consolidado.consultar()
+
+
+def medir(funcao, threads, segundos):
+    """Executa `funcao` em `threads` threads por `segundos`; retorna req/s."""
+    contagens = [0] * threads
+    fim = time.perf_counter() + segundos
+
+    def trabalhar(indice):
+        while time.perf_counter() < fim:
+            funcao()
+            contagens[indice] += 1
+
+    trabalhadores = [
+        threading.Thread(target=trabalhar, args=(i,)) for i in range(threads)
+    ]
+    for trabalhador in trabalhadores:
+        trabalhador.start()
+    for trabalhador in trabalhadores:
+        trabalhador.join()
+    return sum(contagens) / segundos
+
+
+def executar_benchmark():
+    """Mede e imprime requisições/s antes e depois da camada de banco."""
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else THREADS_PADRAO
+    segundos = float(sys.argv[2]) if len(sys.argv) > 2 else SEGUNDOS_PADRAO
+
+    print("Preparando índices e consolidado...")
+    beneficiarios.criar_indices()
+    versoes.preparar_versoes()
+    consolidado.preparar_consolidado()
+
+    print(f"Medindo com {threads} thread(s), {segundos:.0f}s cada modo...")
+    antes = medir(requisicao_antiga, threads, segundos)
+    depois = medir(requisicao_nova, threads, segundos)
+    banco.fechar()
+
+    print("\n" + "="*40)
+    print(f"Conexão por requisição : {antes:10.1f} req/s")
+    print(f"Camada app.banco       : {depois:10.1f} req/s")
+    if antes > 0:
+        print(f"Ganho                  : {depois / antes:10.2f}x")
+    print("="*40)
+
+
+if __name__ == "__main__":
+    executar_benchmark()
@@ -0,0 +1,130 @@
+# scripts/benchmark_importacao.py
+"""
+Benchmark da importação da planilha: compara a leitura antiga (CSV inteiro
+em um DataFrame e conversão linha a linha) com a leitura em blocos de
+`app.importacao`, ambas gravando pela `app.sincronizacao` em um banco
+temporário.
+
+Gera um CSV sintético no formato da planilha, mede linhas/s de cada modo e,
+em uma segunda passada com `tracemalloc`, o pico de memória alocada pelo
+Python.
+
+Uso (a partir da raiz do projeto):
+    python scripts/benchmark_importacao.py [linhas] [tamanho_bloco]
+"""
+import csv
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.importacao import (  # noqa: E402
+    MAPEAMENTO_COLUNAS, TAMANHO_BLOCO_IMPORTACAO, ler_planilha
+)
+from app.migracoes import aplicar_migracoes, converter_registro  # noqa: E402
+from app.sincronizacao import sincronizar  # noqa: E402
+
+# --- CONFIGURAÇÕES ---
+LINHAS_PADRAO = 100_000
+MUNICIPIOS = ("ABARE", "CABROBO", "FLORESTA", "OROCO", "PETROLINA")
+STATUS = ("EM CADASTRO", "CADASTRADO", "A CONSTRUIR", "CONSTRUÍDA")
+
+
+def gerar_csv(caminho, linhas):
+    """Escreve um CSV sintético com os cabeçalhos e formatos da planilha."""
+    aleatorio = random.Random(42)
+    with open(caminho, "w", newline="", encoding="utf-8") as arquivo:
+        escritor = csv.writer(arquivo)
+        escritor.writerow(list(MAPEAMENTO_COLUNAS))
+        for i in range(linhas):
+            cpf = f"{aleatorio.randrange(10**11):011d}"
+            escritor.writerow([
+                f"Código: {i}.1", f"Técnico {i % 40}",
+                f"{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}",
+                aleatorio.choice(MUNICIPIOS), f"Comunidade {i % 300}",
+                f"-{aleatorio.uniform(8, 10):.6f}",
+                f"-{aleatorio.uniform(38, 41):.6f}",
+                f"{aleatorio.randint(1, 28):02d}/"
+                f"{aleatorio.randint(1, 12):02d}/2024",
+                f"Familiar {i}", cpf, f"{aleatorio.randrange(10**11):011d}",
+                f"R$ {aleatorio.randint(100, 2000)},00",
+                aleatorio.choice(STATUS), "", "OK", "", "Sim",
+            ])
+
+
+def importar_antigo(origem, conexao):
+    """CSV inteiro em memória e conversão linha a linha."""
+    df = pd.read_csv(origem, dtype=str, keep_default_na=False)
+    df.rename(columns=MAPEAMENTO_COLUNAS, inplace=True)
+    registros = [converter_registro(r) for r in df.to_dict("records")]
+    return sincronizar(conexao, registros)
+
+
+def importar_em_blocos(origem, conexao, tamanho_bloco):
+    """Leitura e gravação bloco a bloco (`app.importacao`)."""
+    registros = (
+        registro
+        for bloco in ler_planilha(origem, tamanho_bloco)
+        for registro in bloco
+    )
+    return sincronizar(conexao, registros, tamanho_lote=tamanho_bloco)
+
+
+def medir(importar, origem, pasta, nome, memoria=False):
+    """Importa em um banco novo; retorna (linhas/s, pico em MiB)."""
+    conexao = sqlite3.connect(str(Path(pasta) / f"{nome}.db"))
+    aplicar_migracoes(conexao)
+    if memoria:
+        tracemalloc.start()
+    inicio = time.perf_counter()
+    contagens = importar(origem, conexao)
+    duracao = time.perf_counter() - inicio
+    pico = 0.0
+    if memoria:
+        pico = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+    conexao.close()
+    return contagens["lidos"] / duracao, pico
+
+
+def executar_benchmark():
+    """Gera o CSV, mede os dois modos e imprime o resultado."""
+    linhas = int(sys.argv[1]) if len(sys.argv) > 1 else LINHAS_PADRAO
+    tamanho_bloco = (
+        int(sys.argv[2]) if len(sys.argv) > 2 else TAMANHO_BLOCO_IMPORTACAO
+    )
+
+    with tempfile.TemporaryDirectory() as pasta:
+        origem = str(Path(pasta) / "planilha.csv")
+        print(f"Gerando CSV sintético com {linhas} linhas...")
+        gerar_csv(origem, linhas)
+
+        modos = {
+            "CSV inteiro": importar_antigo,
+            f"Blocos de {tamanho_bloco}": (
+                lambda o, c: importar_em_blocos(o, c, tamanho_bloco)
+            ),
+        }
+        resultados = {}
+        for i, (nome, importar) in enumerate(modos.items()):
+            print(f"Medindo '{nome}'...")
+            velocidade, _ = medir(importar, origem, pasta, f"v{i}")
+            _, pico = medir(importar, origem, pasta, f"m{i}", memoria=True)
+            resultados[nome] = (velocidade, pico)
+
+    print("\n" + "="*50)
+    for nome, (velocidade, pico) in resultados.items():
+        print(f"{nome:18}: {velocidade:10.0f} linhas/s | "
+              f"pico {pico:8.1f} MiB")
+    print("="*50)
+
+
+if __name__ == "__main__":
+    executar_benchmark()
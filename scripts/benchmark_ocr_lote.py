@@ -0,0 +1,85 @@
+# scripts/benchmark_ocr_lote.py
+"""
+Compara o OCR por ROI (uma chamada do Tesseract por campo) com o OCR em
+lote (todas as ROIs de texto da página em uma única chamada).
+
+Uso (a partir da raiz do projeto):
+    python scripts/benchmark_ocr_lote.py [imagem] [repeticoes]
+"""
+import sys
+import time
+from pathlib import Path
+
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import pipeline_ocr  # noqa: E402
+
+# --- CONFIGURAÇÕES ---
+IMAGEM_PADRAO = "testes/teste.png"
+REPETICOES_PADRAO = 5
+
+
+def preparar_rois(caminho_imagem):
+    """Prepara a página 1 e devolve as ROIs de texto já binarizadas."""
+    imagem_pil = Image.open(caminho_imagem)
+    pagina = pipeline_ocr._preparar_pagina(imagem_pil, 1, "benchmark")
+    rois = {}
+    for nome_campo, roi_info in pipeline_ocr.ROI_DEFINICOES_PAGINA1.items():
+        if roi_info["tipo"] != "texto":
+            continue
+        x, y, w, h = (roi_info["x"], roi_info["y"],
+                      roi_info["w"], roi_info["h"])
+        recorte = pagina[y:y+h, x:x+w]
+        if recorte.size == 0:
+            print(f"- ROI '{nome_campo}' fora da imagem, ignorada.")
+            continue
+        rois[nome_campo] = pipeline_ocr._preprocessar_imagem_para_ocr(
+            recorte, "benchmark"
+        )
+    return rois
+
+
+def medir(funcao, rois, repeticoes):
+    """Executa `funcao(rois)` várias vezes e retorna (média em s, textos)."""
+    textos = {}
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        textos = funcao(rois)
+    return (time.perf_counter() - inicio) / repeticoes, textos
+
+
+def executar_benchmark():
+    """Mede e imprime o tempo médio dos dois modos de OCR."""
+    caminho = sys.argv[1] if len(sys.argv) > 1 else IMAGEM_PADRAO
+    repeticoes = int(sys.argv[2]) if len(sys.argv) > 2 else REPETICOES_PADRAO
+
+    print(f"Preparando ROIs de '{caminho}'...")
+    rois = preparar_rois(caminho)
+    if not rois:
+        print("❌ Nenhuma ROI de texto válida para medir.")
+        return
+
+    print(f"Medindo {len(rois)} ROI(s), {repeticoes} repetição(ões)...")
+    tempo_roi, textos_roi = medir(
+        pipeline_ocr._ocr_por_roi, rois, repeticoes
+    )
+    tempo_lote, textos_lote = medir(
+        pipeline_ocr._ocr_em_lote, rois, repeticoes
+    )
+
+    print("\n" + "="*40)
+    print(f"Por ROI : {tempo_roi * 1000:8.1f} ms/página")
+    print(f"Em lote : {tempo_lote * 1000:8.1f} ms/página")
+    if tempo_lote > 0:
+        print(f"Ganho   : {tempo_roi / tempo_lote:8.2f}x")
+    print("="*40)
+    for nome_campo in rois:
+        print(f"- {nome_campo}:")
+        print(f"    por ROI: {textos_roi.get(nome_campo, '').strip()!r}")
+        print(f"    em lote: {textos_lote.get(nome_campo, '').strip()!r}")
+
+
+if __name__ == "__main__":
+    executar_benchmark()
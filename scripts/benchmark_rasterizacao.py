@@ -0,0 +1,77 @@
+# scripts/benchmark_rasterizacao.py
+"""
+Compara a rasterização antiga de um PDF (todas as páginas a DPI_MAXIMO)
+com a atual (só as páginas com ROIs, no DPI que atinge LARGURA_PADRAO),
+medindo tempo e tamanho das imagens geradas.
+
+Uso (a partir da raiz do projeto):
+    python scripts/benchmark_rasterizacao.py <arquivo.pdf> [repeticoes]
+"""
+import sys
+import time
+from pathlib import Path
+
+from pdf2image import convert_from_path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import pipeline_ocr  # noqa: E402
+
+# --- CONFIGURAÇÕES ---
+REPETICOES_PADRAO = 3
+
+
+def bytes_imagens(imagens):
+    """Bytes dos pixels das imagens (largura x altura x canais)."""
+    return sum(
+        img.width * img.height * len(img.getbands()) for img in imagens
+    )
+
+
+def rasterizar_antigo(caminho):
+    """Como era antes: o PDF inteiro a DPI_MAXIMO."""
+    return convert_from_path(caminho, dpi=pipeline_ocr.DPI_MAXIMO)
+
+
+def rasterizar_atual(caminho):
+    """Como é hoje: só as páginas com ROIs."""
+    paginas = sorted(pipeline_ocr.TODAS_ROIS_POR_PAGINA) or [1]
+    return list(pipeline_ocr._rasterizar_paginas_pdf(
+        caminho, paginas, "benchmark"
+    ).values())
+
+
+def medir(funcao, caminho, repeticoes):
+    """Executa `funcao(caminho)` várias vezes e retorna
+    (média em s, bytes das imagens)."""
+    imagens = []
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        imagens = funcao(caminho)
+    return (time.perf_counter() - inicio) / repeticoes, bytes_imagens(imagens)
+
+
+def executar_benchmark():
+    """Mede e imprime tempo médio e memória das duas rasterizações."""
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return
+    caminho = sys.argv[1]
+    repeticoes = int(sys.argv[2]) if len(sys.argv) > 2 else REPETICOES_PADRAO
+
+    print(f"Medindo '{caminho}', {repeticoes} repetição(ões)...")
+    tempo_antigo, bytes_antigo = medir(rasterizar_antigo, caminho, repeticoes)
+    tempo_atual, bytes_atual = medir(rasterizar_atual, caminho, repeticoes)
+
+    print("\n" + "="*40)
+    print(f"Antigo : {tempo_antigo:6.2f} s  {bytes_antigo / 1e6:8.1f} MB")
+    print(f"Atual  : {tempo_atual:6.2f} s  {bytes_atual / 1e6:8.1f} MB")
+    print(
+        f"Economia: {tempo_antigo - tempo_atual:5.2f} s  "
+        f"{(bytes_antigo - bytes_atual) / 1e6:8.1f} MB"
+    )
+    print("="*40)
+
+
+if __name__ == "__main__":
+    executar_benchmark()
@@ -1,5 +1,11 @@
 import sqlite3
 import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.migracoes import aplicar_migracoes  # noqa: E402
 
 # --- CONFIGURAÇÕES ---
 NOME_BANCO_DE_DADOS = "agendha.db"
@@ -21,47 +27,23 @@ try:
         print("Banco de dados antigo removido.")
 
     conexao = sqlite3.connect(NOME_BANCO_DE_DADOS)
-    cursor = conexao.cursor()
     print("Conexão bem-sucedida.")
 
-    # 2. Definir o comando SQL para criar a tabela
-    # Usamos """ para criar uma string de múltiplas
-    #  linhas e facilitar a leitura.
-    sql_criar_tabela = """
-    CREATE TABLE IF NOT EXISTS beneficiarios (
-        codigo INTEGER PRIMARY KEY,
-        nome_tecnico TEXT,
-        cpf_tecnico TEXT,
-        municipio TEXT,
-        comunidade TEXT,
-        latitude REAL,
-        longitude REAL,
-        data_atividade TEXT,
-        nome_familiar TEXT,
-        cpf_familiar TEXT,
-        nis TEXT,
-        renda_media REAL,
-        status TEXT,
-        tecnico_agua_que_alimenta TEXT,
-        doc_status TEXT,
-        grh TEXT,
-        verificado_bsf TEXT
-    );
-    """
-
-    # 3. Executar o comando SQL
+    # 2. Criar as tabelas pelas migrações versionadas do app, para que o
+    #  esquema (colunas tipadas, PRAGMA user_version) seja o mesmo que a
+    #  aplicação espera.
     print("Criando a tabela 'beneficiarios'...")
-    cursor.execute(sql_criar_tabela)
-    print("Tabela 'beneficiarios' criada com sucesso!")
+    versao = aplicar_migracoes(conexao)
+    print(f"Tabela 'beneficiarios' criada com sucesso! (esquema v{versao})")
 
-    # 4. Salvar (commit) as alterações
+    # 3. Salvar (commit) as alterações
     conexao.commit()
 
 except sqlite3.Error as e:
     print(f"Ocorreu um erro ao interagir com o banco de dados: {e}")
 
 finally:
-    # 5. Fechar a conexão com o banco de dados
+    # 4. Fechar a conexão com o banco de dados
     if 'conexao' in locals() and conexao:
         conexao.close()
         print("Conexão com o banco de dados fechada.")
\ No newline at end of file
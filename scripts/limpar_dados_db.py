@@ -1,54 +1,51 @@
 # scripts/limpar_dados_db.py
+"""
+Padroniza município, comunidade, técnico e status já gravados no
+`agendha.db` (maiúsculas, sem acentos e sem espaços extras; ver
+`app.normalizacao`). A importação da planilha já grava os dados
+padronizados; este script corrige o que estiver no banco.
+
+Uso (a partir da raiz do projeto):
+    python scripts/limpar_dados_db.py [--simular] [--colunas municipio ...]
+"""
+import argparse
 import sqlite3
-from unidecode import unidecode
+import sys
+from pathlib import Path
 
-NOME_BANCO_DE_DADOS = "agendha.db"
-NOME_TABELA = "beneficiarios"
-COLUNA_ALVO = "municipio"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
+from app.normalizacao import COLUNAS_PADRONIZADAS, padronizar  # noqa: E402
 
-def padronizar_texto(texto):
-    """Converte texto para maiúsculas, remove espaços e acentos."""
-    if not isinstance(texto, str):
-        return texto
-    texto_sem_acento = unidecode(texto)
-    return texto_sem_acento.upper().strip()
+NOME_BANCO_DE_DADOS = "agendha.db"
 
 
-def limpar_coluna_municipio():
-    """Padroniza todos os valores na coluna de municípios."""
+def limpar_colunas(colunas=None, simular=False):
+    """Padroniza as colunas (todas por padrão) com um único UPDATE e mostra
+    as alterações. Com `simular`, só mostra."""
     conexao = None
     try:
-        conexao = sqlite3.connect(NOME_BANCO_DE_DADOS)
-        cursor = conexao.cursor()
-
-        print("Buscando nomes de municípios únicos para limpar...")
-        cursor.execute(f"SELECT DISTINCT {COLUNA_ALVO} FROM {NOME_TABELA}")
-        municipios_unicos = [row[0] for row in cursor.fetchall()]
-
-        print("Iniciando a limpeza dos dados. Alterações:")
-        alteracoes_feitas = 0
-        for original in municipios_unicos:
-            if not original:
-                continue
-
-            limpo = padronizar_texto(original)
-
-            if original != limpo:
-                print(f"- De '{original}' para '{limpo}'")
-                cursor.execute(
-                    f"UPDATE {NOME_TABELA} SET {COLUNA_ALVO} = ? WHERE {COLUNA_ALVO} = ?",
-                    (limpo, original)
-                )
-                alteracoes_feitas += 1
-
-        conexao.commit()
-        print(
-            f"\n✅ Limpeza de dados concluída! {alteracoes_feitas} registros"
-            " de municípios foram padronizados."
-        )
-
-    except sqlite3.Error as e:
+        conexao = sqlite3.connect(NOME_BANCO_DE_DADOS, timeout=30)
+        alteracoes, linhas = padronizar(conexao, colunas, simular)
+
+        print("Alterações" + (" (simulação)" if simular else "") + ":")
+        for alteracao in alteracoes:
+            print(
+                f"- {alteracao['coluna']}: de '{alteracao['de']}' para "
+                f"'{alteracao['para']}' ({alteracao['linhas']} linha(s))"
+            )
+        if simular:
+            print(
+                f"\n{len(alteracoes)} valor(es) seriam padronizados "
+                f"({sum(a['linhas'] for a in alteracoes)} linha(s))."
+            )
+        else:
+            print(
+                f"\n✅ Limpeza de dados concluída! {len(alteracoes)} valor(es)"
+                f" padronizados em {linhas} linha(s)."
+            )
+
+    except (sqlite3.Error, ValueError) as e:
         print(f"❌ ERRO ao limpar o banco de dados: {e}")
     finally:
         if conexao:
@@ -57,5 +54,14 @@ def limpar_coluna_municipio():
 
 
 if __name__ == "__main__":
-    # CORREÇÃO: Chamando a função com o nome correto
-    limpar_coluna_municipio()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--simular", action="store_true",
+        help="Só mostra as alterações, sem gravar."
+    )
+    parser.add_argument(
+        "--colunas", nargs="+", choices=COLUNAS_PADRONIZADAS,
+        help="Colunas a padronizar (padrão: todas)."
+    )
+    argumentos = parser.parse_args()
+    limpar_colunas(argumentos.colunas, argumentos.simular)
@@ -1,6 +1,28 @@
-import pandas as pd
+# scripts/migrar_dados.py
+"""
+Sincroniza a planilha publicada (ou um CSV local) com a tabela
+`beneficiarios` do `agendha.db`.
+
+Por padrão a sincronização é incremental: só linhas novas ou alteradas são
+gravadas e linhas removidas da planilha são apagadas (ver
+`app.sincronizacao`). Com --completo todas as linhas são regravadas.
+O CSV é lido e gravado em blocos (ver `app.importacao`), então o uso de
+memória não cresce com o tamanho da planilha.
+
+Uso (a partir da raiz do projeto):
+    python scripts/migrar_dados.py [caminho_ou_url_csv] [--completo]
+"""
+import argparse
 import sqlite3
-import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.importacao import TAMANHO_BLOCO_IMPORTACAO, ler_planilha  # noqa: E402
+from app.migracoes import aplicar_migracoes  # noqa: E402
+from app.sincronizacao import sincronizar  # noqa: E402
 
 # --- CONFIGURAÇÕES ---
 # URL pública da planilha no formato CSV
@@ -13,61 +35,73 @@ NOME_BANCO_DE_DADOS = "agendha.db"
 NOME_TABELA = "beneficiarios"
 
 
-def limpar_cpf(cpf_bruto):
-    """Remove todos os caracteres não numéricos de um CPF."""
-    if not cpf_bruto:
-        return ""
-    return re.sub(r'\D', '', str(cpf_bruto))
-
-
-def migrar_dados():
-    """Lê a planilha, limpa os dados e insere no banco de dados SQLite."""
+def migrar_dados(origem=URL_PLANILHA_CSV, completo=False):
+    """Lê a planilha, converte os dados e sincroniza o banco SQLite."""
+    conexao = None
     try:
-        # 1. Ler a planilha com o pandas
-        print(f"Lendo dados da planilha '{URL_PLANILHA_CSV}'...")
-        df = pd.read_csv(URL_PLANILHA_CSV)
-        print("Leitura da planilha concluída com sucesso.")
-
-        # 2. Limpeza e Preparação dos Dados
-        print("Iniciando limpeza e preparação dos dados...")
-        mapeamento_colunas = {
-            'Código': 'codigo', 'Nome Técnico': 'nome_tecnico',
-            'CPF Técnico': 'cpf_tecnico', 'Município': 'municipio',
-            'Comunidade': 'comunidade', 'Latitude': 'latitude',
-            'Longitude': 'longitude', 'Data Atividade': 'data_atividade',
-            'Nome Familiar': 'nome_familiar', 'CPF Familiar': 'cpf_familiar',
-            'NIS': 'nis', 'Renda Média': 'renda_media', 'Status': 'status',
-            'Técnico Água que Alimenta': 'tecnico_agua_que_alimenta',
-            'Doc. Status': 'doc_status', 'GRH': 'grh',
-            'Verificado no BSF?': 'verificado_bsf'
-        }
-        df.rename(columns=mapeamento_colunas, inplace=True)
-        df['cpf_tecnico'] = df['cpf_tecnico'].apply(limpar_cpf)
-        df['cpf_familiar'] = df['cpf_familiar'].apply(limpar_cpf)
-        print("Limpeza dos dados concluída.")
-
-        # 3. Inserir os dados no Banco de Dados SQLite
         print(f"Conectando ao banco de dados '{NOME_BANCO_DE_DADOS}'...")
-        conexao = sqlite3.connect(NOME_BANCO_DE_DADOS)
-        print("Conexão bem-sucedida. Iniciando inserção de dados...")
-        df.to_sql(NOME_TABELA, conexao, if_exists='replace', index=False)
-        # NOTA: Mudei para 'replace' para que você possa rodar o script
-        # várias vezes durante os testes sem duplicar os dados.
+        conexao = sqlite3.connect(NOME_BANCO_DE_DADOS, timeout=30)
+        aplicar_migracoes(conexao)
+        if completo:
+            # Sem hash, todas as linhas são regravadas; a tabela não é
+            # esvaziada antes, para não ficar vazia se a leitura falhar.
+            print("Modo completo: todas as linhas serão regravadas...")
+            with conexao:
+                conexao.execute(
+                    f"UPDATE {NOME_TABELA} SET hash_planilha = NULL"
+                )
+
+        # Lê, converte e grava bloco a bloco (tudo como texto: a conversão
+        # de tipos é feita por app.importacao, igual para todas as origens)
+        print(f"Lendo e sincronizando a planilha '{origem}' em blocos de "
+              f"{TAMANHO_BLOCO_IMPORTACAO} linhas...")
+        inicio = time.perf_counter()
+        descartes = {}
+        registros = (
+            registro
+            for bloco in ler_planilha(origem, descartes=descartes)
+            for registro in bloco
+        )
+        contagens = sincronizar(
+            conexao, registros, tamanho_lote=TAMANHO_BLOCO_IMPORTACAO
+        )
+        duracao = time.perf_counter() - inicio
+        if descartes:
+            print(f"Valores não convertidos por coluna: {descartes}")
 
         print("\n" + "="*40)
-        print(f"✅ SUCESSO! {len(df)} registros foram migrados.")
+        print(
+            f"✅ SUCESSO! {contagens['lidos']} linhas lidas: "
+            f"{contagens['inseridos']} inseridas, "
+            f"{contagens['atualizados']} atualizadas, "
+            f"{contagens['removidos']} removidas, "
+            f"{contagens['inalterados']} sem alteração "
+            f"({contagens['lidos'] / max(duracao, 1e-9):.0f} linhas/s)."
+        )
+        if contagens["sem_chave"]:
+            print(f"⚠️ {contagens['sem_chave']} linha(s) sem código, CPF "
+                  "ou nome foram ignoradas.")
         print("="*40)
 
     except FileNotFoundError:
-        print(f"ERRO: Arquivo '{URL_PLANILHA_CSV}' não encontrado.")
+        print(f"ERRO: Arquivo '{origem}' não encontrado.")
     except Exception as e:
         print(f"Ocorreu um erro inesperado: {e}")
     finally:
-        if 'conexao' in locals():
-            if conexao:
-                conexao.close()
-                print("Conexão com o banco de dados fechada.")
+        if conexao:
+            conexao.close()
+            print("Conexão com o banco de dados fechada.")
 
 
 if __name__ == "__main__":
-    migrar_dados()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "origem", nargs="?", default=URL_PLANILHA_CSV,
+        help="URL ou caminho de um CSV local (padrão: planilha publicada)."
+    )
+    parser.add_argument(
+        "--completo", action="store_true",
+        help="Regrava todas as linhas (em vez de só as alteradas)."
+    )
+    argumentos = parser.parse_args()
+    migrar_dados(argumentos.origem, argumentos.completo)
@@ -0,0 +1,63 @@
+# scripts/reextrair_rois.py
+"""
+Reextrai os formulários já processados usando outras definições de ROI,
+a partir das páginas normalizadas guardadas em `paginas_normalizadas/`
+(sem rodar Poppler nem a correção de perspectiva de novo).
+
+Uso (a partir da raiz do projeto):
+    python scripts/reextrair_rois.py [rois.json] [sha256 ...]
+
+O arquivo JSON segue o formato de TODAS_ROIS_POR_PAGINA, com as páginas
+como chaves ("1", "2", ...). Sem ele, usa as definições atuais.
+"""
+import sys
+import json
+import time
+import asyncio
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.motor_ocr import MotorOCR  # noqa: E402
+from app.pipeline_ocr import normalizar_definicoes_rois  # noqa: E402
+
+
+def carregar_rois(caminho):
+    """Lê as definições de ROI de um arquivo JSON."""
+    with open(caminho, "r", encoding="utf-8") as arquivo:
+        return normalizar_definicoes_rois(json.load(arquivo))
+
+
+async def reextrair(rois_por_pagina, shas):
+    """Distribui a reextração entre os workers do motor de OCR."""
+    motor = MotorOCR()
+    try:
+        return await motor.reextrair(rois_por_pagina, shas or None)
+    finally:
+        motor.encerrar()
+
+
+def main():
+    """Executa a reextração e imprime os campos de cada formulário."""
+    argumentos = sys.argv[1:]
+    rois_por_pagina = None
+    if argumentos and argumentos[0].endswith(".json"):
+        rois_por_pagina = carregar_rois(argumentos.pop(0))
+
+    inicio = time.perf_counter()
+    resultados = asyncio.run(reextrair(rois_por_pagina, argumentos))
+    tempo_total = time.perf_counter() - inicio
+
+    for resultado in resultados:
+        print(
+            f"- {resultado['sha256'][:12]} (pág. {resultado['pagina_inicial']}"
+            f"): {resultado.get('dados', resultado.get('error'))}"
+        )
+    print("\n" + "="*40)
+    print(f"✅ {len(resultados)} formulário(s) reextraído(s) em "
+          f"{tempo_total:.2f}s.")
+    print("="*40)
+
+
+if __name__ == "__main__":
+    main()